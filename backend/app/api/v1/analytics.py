@@ -0,0 +1,32 @@
+import logging
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
+
+from ...services.analytics import get_aggregates
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+@router.get("/analytics/summary", tags=["analytics"])
+def analytics_summary(request: Request, limit: int = Query(20, ge=1, le=200, description="Categories / brands returned")):
+    """
+    Catalog totals, products per category, average price per brand and the
+    monthly growth series, served from incrementally maintained aggregates.
+    Send the ETag back in If-None-Match to get a 304 while nothing changed.
+    """
+    try:
+        body, etag = get_aggregates().rendered(limit)
+    except Exception as e:
+        logger.exception("analytics summary failed")
+        raise HTTPException(status_code=500, detail=str(e))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
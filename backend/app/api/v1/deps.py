@@ -0,0 +1,35 @@
+import json
+from typing import Any, Dict, List, Optional, Union
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import Response
+from ...core.config import settings
+from ...core.metrics import timed
+from ...services.facets import FilterError, validate_filter
+
+def require_role(role: str):
+    """Route dependency: 503 when this deployment's SERVICE_ROLES excludes `role`."""
+    def _check():
+        if not settings.has_role(role):
+            raise HTTPException(status_code=503, detail=f"'{role}' is not served by this deployment")
+    return _check
+
+def hits_response(items: List[Dict[str, Any]], timings_ms: Optional[Dict[str, float]] = None,
+                  **extra: Any) -> Response:
+    """SearchResponse-shaped body from hydrated hit dicts, serialized by orjson without a model_dump() pass."""
+    body: Dict[str, Any] = {"items": items, "timings_ms": timings_ms}
+    body.update(extra)
+    with timed("serialize"):
+        data = orjson.dumps(body, option=orjson.OPT_SERIALIZE_NUMPY)
+    return Response(data, media_type="application/json")
+
+def parse_filters(raw: Union[str, Dict[str, Any], None], facets_only: bool = False) -> Dict[str, Any]:
+    """Validated metadata filter from a dict or a JSON string; 422 if malformed (or, with facets_only, not facet-indexable)."""
+    if not raw:
+        return {}
+    try:
+        flt = json.loads(raw) if isinstance(raw, str) else raw
+        return validate_filter(flt, facets_only)
+    except (ValueError, FilterError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid filters: {e}")
@@ -0,0 +1,34 @@
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from .deps import parse_filters
+from ...services.facets import CATEGORICAL, NUMERIC, catalog_facets
+from ...services.vectorstore import text_index
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.get("/facets", tags=["search"])
+def facet_counts(
+    fields: str = Query(",".join(CATEGORICAL + NUMERIC), description="Comma-separated facet fields"),
+    filters: Optional[str] = Query(None, description='Metadata filter as JSON, e.g. {"price":{"$lt":100}}'),
+    limit: int = Query(50, ge=1, le=500, description="Values per categorical field"),
+):
+    """
+    Counts per facet value among products matching `filters` (price gets
+    min/max), for building the filter sidebar.
+    """
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in CATEGORICAL + NUMERIC]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown facet fields: {', '.join(unknown)}")
+    flt = parse_filters(filters, facets_only=True)  # counted on the facet bitmaps
+    try:
+        if hasattr(text_index, "facet_counts"):  # LocalIndex keeps its facets in sync with writes
+            return text_index.facet_counts(wanted, flt, namespace="default", limit=limit)
+        return catalog_facets().counts(wanted, flt, limit=limit)
+    except Exception as e:
+        logger.exception("facet counts failed")
+        raise HTTPException(status_code=500, detail=str(e))
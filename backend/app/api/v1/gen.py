@@ -1,14 +1,28 @@
 # app/api/v1/gen.py
-from fastapi import APIRouter, HTTPException, Body, Query
+import json
+import logging
+import sqlite3
+from fastapi import APIRouter, HTTPException, Body, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
-from ...services.genai import generate_description
+from typing import Optional, Dict, Any, List
+from ...services.genai import generate_description, generate_descriptions, stream_description
 from ...services.vectorstore import text_index  # Pinecone text index
+from ...services.cache import invalidate_search
+from ...services.lexical import on_metadata_update
+from ...services import analytics, suggest
+from ...services.metastore import metastore
+from ...services.modelserver import ModelServerError
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+_FETCH_CHUNK = 100  # ids per fetch call when hydrating batch requests
+
 class GenRequest(BaseModel):
-    uniq_id: Optional[str] = Field(default=None, description="If provided, fetch metadata from Pinecone")
+    uniq_id: Optional[str] = Field(default=None, description="If provided, fetch metadata from the local store (or Pinecone)")
     meta: Optional[Dict[str, Any]] = Field(default=None, description="Inline metadata if no uniq_id")
     style: Optional[str] = None
     temperature: float = 0.9
@@ -17,24 +31,72 @@ class GenRequest(BaseModel):
     seed: Optional[int] = 42
     save: bool = False  # write to Pinecone metadata as 'gen_description'
 
-@router.post("/gen/description")
-def gen_description(req: GenRequest = Body(...)):
-    meta = None
+class GenBatchItem(BaseModel):
+    uniq_id: Optional[str] = None
+    meta: Optional[Dict[str, Any]] = None
+    seed: Optional[int] = Field(default=None, description="Overrides the batch seed for this item")
+
+class GenBatchRequest(BaseModel):
+    uniq_ids: List[str] = Field(default_factory=list)
+    items: List[GenBatchItem] = Field(default_factory=list)
+    style: Optional[str] = None
+    temperature: float = 0.9
+    top_p: float = 0.95
+    max_new_tokens: int = 120
+    seed: Optional[int] = 42
+    batch_size: int = Field(default=8, ge=1, le=64)
+    save: bool = False
+
+def _stored_metas(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Full records (description included) from the local store; the index only holds slim metadata."""
+    try:
+        return metastore.get_many(ids) if ids and metastore.ready() else {}
+    except sqlite3.Error as e:
+        logger.warning(f"metadata store read failed: {e}")
+        return {}
+
+def _resolve_meta(req: GenRequest) -> Dict[str, Any]:
     if req.uniq_id:
-        # fetch from Pinecone
+        stored = _stored_metas([req.uniq_id])
+        if req.uniq_id in stored:
+            return stored[req.uniq_id]
+        # fall back to Pinecone metadata
         try:
             res = text_index.fetch(ids=[req.uniq_id], namespace="default")
-            vecs = res.get("vectors", {})
-            if req.uniq_id not in vecs:
-                raise HTTPException(status_code=404, detail="uniq_id not found in index")
-            meta = vecs[req.uniq_id].get("metadata", {}) or {}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"fetch failed: {e}")
-    else:
-        meta = req.meta or {}
-        if not meta:
-            raise HTTPException(status_code=422, detail="Provide uniq_id or meta")
+        vecs = res.get("vectors", {})
+        if req.uniq_id not in vecs:
+            raise HTTPException(status_code=404, detail="uniq_id not found in index")
+        return vecs[req.uniq_id].get("metadata", {}) or {}
+    meta = req.meta or {}
+    if not meta:
+        raise HTTPException(status_code=422, detail="Provide uniq_id or meta")
+    return meta
+
+def _write_description(uid: str, text: str):
+    patch = {"gen_description": text}
+    text_index.update(id=uid, set_metadata=patch, namespace="default")
+    metastore.patch(uid, patch)
+    on_metadata_update(uid, patch)
+    analytics.on_metadata_update(uid, patch)
+    suggest.on_metadata_update(uid, patch)
 
+def _save_description(req: GenRequest, text: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if req.save and req.uniq_id and meta is not None and meta.get("gen_description") == text:
+        return {"description": text, "saved": True}  # cached text is already stored; skip the write
+    if req.save and req.uniq_id:
+        try:
+            _write_description(req.uniq_id, text)
+            invalidate_search()
+        except Exception as e:
+            # Return description even if update fails
+            return {"description": text, "saved": False, "error": str(e)}
+    return {"description": text, "saved": bool(req.save and req.uniq_id)}
+
+@router.post("/gen/description")
+def gen_description(req: GenRequest = Body(...)):
+    meta = _resolve_meta(req)
     text = generate_description(
         meta=meta,
         style=req.style,
@@ -43,12 +105,119 @@ def gen_description(req: GenRequest = Body(...)):
         top_p=req.top_p,
         seed=req.seed,
     )
+    return _save_description(req, text, meta)
 
-    if req.save and req.uniq_id:
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/gen/description/stream")
+async def gen_description_stream(request: Request, req: GenRequest = Body(...)):
+    """
+    Server-sent events: `token` events carry decoded text deltas as FLAN-T5
+    generates them; a final `done` event carries the cleaned description (and
+    save status). Generation stops as soon as the client disconnects.
+    """
+    meta = await run_in_threadpool(_resolve_meta, req)
+    steps = stream_description(
+        meta=meta,
+        style=req.style,
+        max_new_tokens=req.max_new_tokens,
+        temperature=req.temperature,
+        top_p=req.top_p,
+        seed=req.seed,
+    )
+
+    async def events():
         try:
-            text_index.update(id=req.uniq_id, set_metadata={"gen_description": text}, namespace="default")
-        except Exception as e:
-            # Return description even if update fails
-            return {"description": text, "saved": False, "error": str(e)}
+            while True:
+                if await request.is_disconnected():
+                    return
+                try:
+                    item = await run_in_threadpool(next, steps, None)
+                except ModelServerError as e:
+                    yield _sse("error", {"status": e.status_code, "detail": str(e)})
+                    return
+                if item is None:
+                    return
+                kind, text = item
+                if kind == "token":
+                    yield _sse("token", {"text": text})
+                else:
+                    yield _sse("done", await run_in_threadpool(_save_description, req, text, meta))
+        finally:
+            try:
+                steps.close()  # frees the model when the client goes away
+            except ValueError:
+                pass  # a step is still running in the pool; it won't be advanced again
 
-    return {"description": text, "saved": bool(req.save and req.uniq_id)}
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _fetch_metas(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    found = _stored_metas(ids)
+    missing = [i for i in ids if i not in found]
+    for i in range(0, len(missing), _FETCH_CHUNK):
+        res = text_index.fetch(ids=missing[i:i + _FETCH_CHUNK], namespace="default")
+        for vid, vec in (res.get("vectors", {}) or {}).items():
+            found[vid] = vec.get("metadata", {}) or {}
+    return found
+
+@router.post("/gen/description/batch")
+def gen_description_batch(req: GenBatchRequest = Body(...)):
+    """
+    Generate many descriptions in padded, length-grouped batches. Streams
+    NDJSON: one line per item as its batch finishes, then a summary line.
+    With save=true, metadata updates are written once everything is generated.
+    """
+    items = [GenBatchItem(uniq_id=u) for u in req.uniq_ids] + list(req.items)
+    if not items:
+        raise HTTPException(status_code=422, detail="Provide uniq_ids or items")
+    try:
+        fetched = _fetch_metas(sorted({it.uniq_id for it in items if it.uniq_id and not it.meta}))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"fetch failed: {e}")
+
+    metas, seeds, pos, errors = [], [], [], []
+    for i, it in enumerate(items):
+        meta = it.meta or (fetched.get(it.uniq_id) if it.uniq_id else None)
+        if not meta:
+            errors.append({"index": i, "uniq_id": it.uniq_id, "error": "not found" if it.uniq_id else "empty meta"})
+            continue
+        metas.append(meta)
+        seeds.append(it.seed if it.seed is not None else req.seed)
+        pos.append(i)
+
+    def stream():
+        for err in errors:
+            yield json.dumps(err) + "\n"
+        to_save: Dict[str, str] = {}
+        for batch in generate_descriptions(
+            metas,
+            style=req.style,
+            max_new_tokens=req.max_new_tokens,
+            temperature=req.temperature,
+            top_p=req.top_p,
+            seeds=seeds,
+            batch_size=req.batch_size,
+        ):
+            for j, text in batch:
+                it = items[pos[j]]
+                if req.save and it.uniq_id and metas[j].get("gen_description") != text:
+                    to_save[it.uniq_id] = text
+                yield json.dumps({"index": pos[j], "uniq_id": it.uniq_id, "description": text}) + "\n"
+
+        saved, save_errors = 0, []
+        for uid, text in to_save.items():
+            try:
+                _write_description(uid, text)
+                saved += 1
+            except Exception as e:
+                save_errors.append({"uniq_id": uid, "error": str(e)})
+        if saved:
+            invalidate_search()
+        yield json.dumps({"done": True, "generated": len(metas), "saved": saved, "errors": save_errors}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -1,4 +1,5 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from ...core.config import settings
 from ...models.schemas import HealthOut
 
@@ -7,3 +8,34 @@ router = APIRouter()
 @router.get("/health", response_model=HealthOut)
 def health():
     return HealthOut(name=settings.APP_NAME, env=settings.APP_ENV, status="ok")
+
+@router.get("/ready")
+def ready():
+    """Readiness (separate from liveness): 503 until the warm-up task finishes."""
+    from ...services.loader import readiness
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@router.get("/health/batching")
+def batching():
+    """Batch-size and queue-wait stats of the embedding micro-batchers."""
+    from ...services.embeddings import batching_stats
+    return batching_stats()
+
+@router.get("/health/dedup")
+def dedup():
+    """Size of the near-duplicate map behind collapse_duplicates."""
+    from ...services.dedup import dedup_stats
+    return dedup_stats()
+
+@router.get("/health/cache")
+def cache():
+    """Entry counts, bytes and hit rates of the search caches."""
+    from ...services.cache import cache_stats
+    from ...services.fetcher import embedding_cache
+    from ...services.gencache import generation_cache
+    from ...services.lexical import lexical_stats
+    from ...services.rerank import reranker
+    from ...services.suggest import suggest_stats
+    return {**cache_stats(), **embedding_cache.stats(), "rerank_scores": reranker.cache.stats(),
+            "generations": generation_cache.stats(), "lexical": lexical_stats(), "suggest": suggest_stats()}
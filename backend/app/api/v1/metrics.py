@@ -0,0 +1,61 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from ...core.metrics import REGISTRY
+
+router = APIRouter()
+
+_CACHE_FIELDS = (
+    ("hits", "counter", "Cache lookups that hit."),
+    ("misses", "counter", "Cache lookups that missed."),
+    ("evictions", "counter", "Entries evicted for size."),
+    ("entries", "gauge", "Entries currently cached."),
+    ("bytes", "gauge", "Approximate bytes currently cached."),
+    ("hit_rate", "gauge", "Hits / lookups since start."),
+)
+
+_BATCH_FIELDS = (
+    ("batches", "counter", "Micro-batches run."),
+    ("items", "counter", "Items run through micro-batches."),
+    ("queued", "gauge", "Items waiting for the next micro-batch."),
+    ("queue_wait_ms_p95", "gauge", "p95 queue wait over the recent window (ms)."),
+)
+
+
+@REGISTRY.collector
+def _caches():
+    from ...services.cache import cache_stats
+    from ...services.fetcher import embedding_cache
+    from ...services.gencache import generation_cache
+    from ...services.rerank import reranker
+    stats = [*cache_stats().values(), *embedding_cache.stats().values(), reranker.cache.stats(),
+             generation_cache.stats()]
+    names = {"hits": "app_cache_hits_total", "misses": "app_cache_misses_total",
+             "evictions": "app_cache_evictions_total", "hit_rate": "app_cache_hit_ratio"}
+    for key, kind, help in _CACHE_FIELDS:
+        yield names.get(key, f"app_cache_{key}"), kind, help, [({"cache": s["name"]}, s[key]) for s in stats]
+
+
+@REGISTRY.collector
+def _batchers():
+    from ...services.embeddings import batching_stats
+    stats = batching_stats()
+    for key, kind, help in _BATCH_FIELDS:
+        name = f"app_batch_{key}_total" if kind == "counter" else f"app_batch_{key}"
+        yield name, kind, help, [({"batcher": b}, s[key]) for b, s in stats.items()]
+
+
+@REGISTRY.collector
+def _models():
+    from ...services.loader import model_status
+    status = model_status()
+    yield ("app_model_loaded", "gauge", "1 once the model is loaded.",
+           [({"model": m}, float(s["loaded"])) for m, s in status.items()])
+    yield ("app_model_load_seconds", "gauge", "Time the model took to load.",
+           [({"model": m}, s["load_s"]) for m, s in status.items() if s["load_s"] is not None])
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text exposition of stage histograms, HTTP metrics, caches, batchers and models."""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,106 +1,211 @@
 # app/api/v1/search.py
+import asyncio
 import logging
-import io
-import json
-import requests
-from typing import Dict, Any, Optional
+import time
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query
-from PIL import Image
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 
-from ...models.schemas import SearchRequest, SearchResponse, SearchHit
-from ...services.embeddings import encode_text, encode_image, get_reranker
+from .deps import hits_response, parse_filters, require_role
+from ...core.metrics import timed
+from ...core.timing import StageTimer
+from ...models.schemas import SearchRequest, SearchResponse
+from ...core.config import settings
+from ...services.embeddings import encode_clip_text_async, encode_image_async, encode_text, encode_text_async
+from ...services.fusion import FUSIONS, fuse, rrf_fuse
+from ...services.lexical import get_lexical_index
+from ...services.metastore import hydrate, include_metadata, parse_fields, project
+from ...services.rerank import PAIR_FIELDS, reranker
+from ...services.suggest import record_query
 from ...services.vectorstore import text_index, image_index
+from ...services.imaging import ImageRejected, preprocess_async
+from ...services.fetcher import content_digest, embedding_cache, fetcher
+from ...services.cache import canonical_key, normalize_prompt, query_vectors, search_results
+from ...services.dedup import collapse, get_duplicates, overfetch, wants_collapse
+from ...services.modelserver import ModelServerError
 
 logger = logging.getLogger(__name__)
 router = APIRouter()  # <-- this must be defined before any @router.* decorators
 
+_COLLAPSE_HELP = "One hit per near-duplicate cluster; defaults to DEDUP_COLLAPSE_DEFAULT"
+
 
 # ----------------------------- TEXT SEARCH -----------------------------------
 def _query_text_index(qvec: list[float], top_k: int, filters: dict | None):
     res = text_index.query(
         vector=qvec,
         top_k=top_k if top_k and top_k > 0 else 12,
-        include_metadata=True,
+        include_metadata=include_metadata(),
         filter=filters or {},
         namespace="default",
     )
     return res.get("matches", [])
 
 
-@router.post("/search", response_model=SearchResponse, tags=["search"])
+@router.post("/search", response_model=SearchResponse, tags=["search"], dependencies=[Depends(require_role("text"))])
 def search(req: SearchRequest):
+    started = time.perf_counter()
+    filters = parse_filters(req.filters)
     try:
-        qvec = encode_text(req.prompt)
-        matches = _query_text_index(qvec, top_k=max(10, req.top_k or 12), filters=req.filters)
-
-        # Optional rerank
+        prompt = normalize_prompt(req.prompt)
         use_rerank = req.use_reranker if req.use_reranker is not None else False
-        reranker = get_reranker() if use_rerank else None
-        if reranker and matches:
-            pairs = [(req.prompt, m["metadata"].get("title", "")) for m in matches]
-            scores = reranker.predict(pairs).tolist()
-            matches = [m for _, m in sorted(zip(scores, matches), key=lambda x: -x[0])]
-
-        items = [
-            SearchHit(id=m["id"], score=float(m.get("score", 0.0)), metadata=m.get("metadata", {}))
-            for m in matches[: (req.top_k or 12)]
-        ]
-        return SearchResponse(items=items)
+        hybrid = req.hybrid if req.hybrid is not None else settings.HYBRID_SEARCH
+        fields = parse_fields(req.fields)
+        dedup = wants_collapse(req.collapse_duplicates)
+        result_key = canonical_key(prompt, req.top_k, filters, use_rerank, hybrid, fields or "*",
+                                   get_duplicates().built_at if dedup else None)
+        cached = search_results.get(result_key)
+        if cached is not None:
+            record_query(prompt)
+            return Response(cached, media_type="application/json")
+
+        qvec = query_vectors.get(prompt)
+        if qvec is None:
+            qvec = encode_text(prompt)
+            query_vectors.set(prompt, qvec)
+        top_k = req.top_k or 12
+        window = overfetch(top_k) if dedup else top_k  # hits kept before collapsing duplicates
+        fetch_k = max(10, window)
+        if use_rerank:
+            fetch_k = max(fetch_k, reranker.candidates)
+        matches = _query_text_index(qvec, top_k=fetch_k, filters=filters)
+
+        # Hybrid: exact brand/model tokens via BM25, fused by reciprocal rank;
+        # hits keep the vector similarity as score (None if BM25-only) and the RRF value as fused_score
+        if hybrid:
+            with timed("lexical"):
+                lexical = get_lexical_index().search(prompt, top_k=settings.LEXICAL_CANDIDATES, filter=filters)
+            if lexical:
+                matches = rrf_fuse(matches, lexical, k=settings.RRF_K, score_from=0)
+
+        # Optional rerank, within the request's latency budget
+        cacheable = True
+        if use_rerank and matches:
+            need = None if fields is None else sorted(set(fields) | set(PAIR_FIELDS))
+            matches = hydrate(matches[: max(window, reranker.candidates)], need, text_index)
+            budget_ms = req.rerank_budget_ms if req.rerank_budget_ms is not None else settings.RERANK_BUDGET_MS
+            deadline = started + budget_ms / 1000.0 if budget_ms and budget_ms > 0 else None
+            matches, info = reranker.rerank(prompt, matches, deadline=deadline)
+            # a ranking the budget cut short must not be served to requests that could wait for all of it
+            cacheable = not (info["truncated"] or info["skipped"])
+            items = [{"id": m["id"], "score": m["score"], "metadata": project(m["metadata"], fields),
+                      **({"fused_score": m["fused_score"]} if "fused_score" in m else {})}
+                     for m in matches[:window]]
+        else:
+            items = hydrate(matches[:window], fields, text_index)
+        if dedup:
+            items = collapse(items, top_k)
+
+        resp = hits_response(items)
+        if cacheable:
+            search_results.set(result_key, resp.body)
+        if items:
+            record_query(prompt)
+        return resp
+    except ModelServerError:
+        raise
     except Exception as e:
         logger.exception("search failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ---------------------------- IMAGE SEARCH -----------------------------------
-@router.post("/search/image", response_model=SearchResponse, tags=["search"])
-def search_by_image_url(
+def _image_hits(res, fields, top_k: int = 0, dedup: bool = False) -> list[dict]:
+    items = hydrate(res.get("matches", []), fields, image_index)
+    return collapse(items, top_k) if dedup else items
+
+
+async def _image_url_vec(image_url: str, timer: StageTimer) -> list[float]:
+    """CLIP embedding for a URL; cached by URL and by content hash."""
+    digest = await embedding_cache.digest_for_async(image_url)
+    qvec = await embedding_cache.embedding_for_async(digest) if digest else None
+    if qvec is None:
+        with timer.stage("fetch"):
+            raw = await fetcher.fetch(image_url)
+        digest = content_digest(raw)
+        qvec = await embedding_cache.embedding_for_async(digest)
+        if qvec is None:
+            with timer.stage("decode"):
+                img = await preprocess_async(raw)
+            with timer.stage("embed"):
+                qvec = await encode_image_async(img)
+        await embedding_cache.put_async(image_url, digest, qvec)
+    return qvec
+
+
+@router.post("/search/image", response_model=SearchResponse, tags=["search"], dependencies=[Depends(require_role("image"))])
+async def search_by_image_url(
     image_url: str = Query(..., description="Public URL to a JPG/PNG/WEBP image"),
     top_k: int = Query(8, ge=1, le=100),
+    fields: Optional[str] = Query(None, description="Comma-separated metadata fields; * for all"),
+    collapse_duplicates: Optional[bool] = Query(None, description=_COLLAPSE_HELP),
 ):
     """
     Pass an image URL; we fetch, embed with CLIP, and query the Pinecone image index.
+    Embeddings are cached by URL and by content hash, so repeats skip fetch and encode.
     """
     if image_index is None:
         raise HTTPException(status_code=400, detail="Image index not available.")
+    timer = StageTimer()
+    dedup = wants_collapse(collapse_duplicates)
     try:
-        resp = requests.get(image_url, timeout=15, headers={"User-Agent": "Mozilla/5.0"})
-        resp.raise_for_status()
-        img = Image.open(io.BytesIO(resp.content)).convert("RGB")
-        img.thumbnail((256, 256), Image.BICUBIC)
-        qvec = encode_image(img)
-        res = image_index.query(vector=qvec, top_k=top_k, include_metadata=True, namespace="default")
-        items = [SearchHit(id=m["id"], score=float(m.get("score", 0.0)), metadata=m.get("metadata", {}))
-                 for m in res.get("matches", [])]
-        return SearchResponse(items=items)
+        qvec = await _image_url_vec(image_url, timer)
+        with timer.stage("query"):
+            res = await run_in_threadpool(
+                image_index.query, vector=qvec, top_k=overfetch(top_k) if dedup else top_k,
+                include_metadata=include_metadata(), namespace="default"
+            )
+        with timer.stage("hydrate"):
+            items = await run_in_threadpool(_image_hits, res, parse_fields(fields), top_k, dedup)
+        return hits_response(items, timer.ms())
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ModelServerError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"image_url failed: {e}")
 
 
-@router.post("/search/image/upload", response_model=SearchResponse, tags=["search"])
+@router.post("/search/image/upload", response_model=SearchResponse, tags=["search"], dependencies=[Depends(require_role("image"))])
 async def search_by_image_upload(
     file: UploadFile = File(..., description="JPEG/PNG/WEBP image file"),
     top_k: int = Form(8),
+    fields: Optional[str] = Form(None, description="Comma-separated metadata fields; * for all"),
+    collapse_duplicates: Optional[bool] = Form(None, description=_COLLAPSE_HELP),
 ):
     """
     Multipart form-data upload (key: file). Returns top_k visually similar items.
     """
     if image_index is None:
         raise HTTPException(status_code=400, detail="Image index not available.")
+    timer = StageTimer()
     try:
-        raw = await file.read()
-        img = Image.open(io.BytesIO(raw)).convert("RGB")
-        img.thumbnail((256, 256), Image.BICUBIC)
-        qvec = encode_image(img)
-        res = image_index.query(vector=qvec, top_k=top_k, include_metadata=True, namespace="default")
-        items = [SearchHit(id=m["id"], score=float(m.get("score", 0.0)), metadata=m.get("metadata", {}))
-                 for m in res.get("matches", [])]
-        return SearchResponse(items=items)
+        with timer.stage("read"):
+            raw = await file.read()
+        with timer.stage("decode"):
+            img = await preprocess_async(raw)
+        with timer.stage("embed"):
+            qvec = await encode_image_async(img)
+        dedup = wants_collapse(collapse_duplicates)
+        with timer.stage("query"):
+            res = await run_in_threadpool(
+                image_index.query, vector=qvec, top_k=overfetch(top_k) if dedup else top_k,
+                include_metadata=include_metadata(), namespace="default"
+            )
+        with timer.stage("hydrate"):
+            items = await run_in_threadpool(_image_hits, res, parse_fields(fields), top_k, dedup)
+        return hits_response(items, timer.ms())
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ModelServerError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"upload failed: {e}")
 
 
-@router.post("/search/image/upload-check", tags=["search"])
+@router.post("/search/image/upload-check", tags=["search"], dependencies=[Depends(require_role("image"))])
 async def search_by_image_upload_check(
     file: UploadFile = File(..., description="JPEG/PNG/WEBP image file"),
     top_k: int = Form(8),
@@ -109,62 +214,145 @@ async def search_by_image_upload_check(
         None,
         description='Optional Pinecone metadata filter as JSON, e.g. {"brand":{"$ne":""},"price":{"$gt":0}}'
     ),
+    fields: Optional[str] = Form(None, description="Comma-separated metadata fields; * for all"),
 ):
     """
     Upload an image; downscale, embed with CLIP, query Pinecone image index, and
     return matches plus a boolean 'found_similar' if best score >= threshold.
     """
-    import time
-    t0 = time.perf_counter()
+    timer = StageTimer()
 
     if image_index is None:
         raise HTTPException(status_code=400, detail="Image index not available.")
 
-    raw = await file.read()
-    try:
-        img = Image.open(io.BytesIO(raw)).convert("RGB")
-    except Exception:
-        raise HTTPException(status_code=422, detail="Invalid image file.")
-
-    # Downscale for speed on CPU
-    img.thumbnail((256, 256), Image.BICUBIC)
-
-    pinecone_filter: Dict[str, Any] = {}
-    if filters:
+    with timer.stage("read"):
+        raw = await file.read()
+    # Downscale for speed on CPU (draft decode in the preprocessing pool)
+    with timer.stage("decode"):
         try:
-            pinecone_filter = json.loads(filters)
-            if not isinstance(pinecone_filter, dict):
-                raise ValueError("filters must be a JSON object")
-        except Exception as e:
-            raise HTTPException(status_code=422, detail=f"Invalid filters JSON: {e}")
+            img = await preprocess_async(raw)
+        except ImageRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
 
-    t1 = time.perf_counter()
-    qvec = encode_image(img)
-    t2 = time.perf_counter()
+    pinecone_filter = parse_filters(filters)
 
-    res = image_index.query(
-        vector=qvec,
-        top_k=top_k if top_k and top_k > 0 else 8,
-        include_metadata=True,
-        namespace="default",
-        filter=pinecone_filter or {},
-    )
-    matches = res.get("matches", [])
-    items = [SearchHit(id=m["id"], score=float(m.get("score", 0.0)), metadata=m.get("metadata", {}))
-             for m in matches]
+    with timer.stage("embed"):
+        qvec = await encode_image_async(img)
+
+    with timer.stage("query"):
+        res = await run_in_threadpool(
+            image_index.query,
+            vector=qvec,
+            top_k=top_k if top_k and top_k > 0 else 8,
+            include_metadata=include_metadata(),
+            namespace="default",
+            filter=pinecone_filter or {},
+        )
+    with timer.stage("hydrate"):
+        items = await run_in_threadpool(_image_hits, res, parse_fields(fields))
     best = items[0] if items else None
-    found_similar = bool(best and best.score >= threshold)
-    t3 = time.perf_counter()
-
-    return {
-        "found_similar": found_similar,
-        "threshold": threshold,
-        "best_match": best.model_dump() if best else None,
-        "items": [i.model_dump() for i in items],
-        "timings_ms": {
-            "total": round((t3 - t0) * 1000, 1),
-            "open_resize": round((t1 - t0) * 1000, 1),
-            "embed": round((t2 - t1) * 1000, 1),
-            "pinecone_query": round((t3 - t2) * 1000, 1),
-        },
-    }
+    found_similar = bool(best and best["score"] >= threshold)
+
+    timings = timer.ms()
+    # keep the original key names for existing clients
+    timings["open_resize"] = round(timings.get("read", 0.0) + timings.get("decode", 0.0), 1)
+    timings["pinecone_query"] = timings.get("query", 0.0)
+    return hits_response(items, timings, found_similar=found_similar, threshold=threshold, best_match=best)
+
+
+# -------------------------- MULTIMODAL SEARCH --------------------------------
+@router.post("/search/multimodal", response_model=SearchResponse, tags=["search"])
+async def search_multimodal(
+    prompt: Optional[str] = Form(None, description='Text part of the query, e.g. "but in walnut"'),
+    file: Optional[UploadFile] = File(None, description="JPEG/PNG/WEBP image file"),
+    image_url: Optional[str] = Form(None, description="Public image URL (instead of file)"),
+    top_k: int = Form(12, ge=1, le=100),
+    text_weight: Optional[float] = Form(None, ge=0, description="Defaults to MULTIMODAL_TEXT_WEIGHT"),
+    image_weight: Optional[float] = Form(None, ge=0, description="Defaults to MULTIMODAL_IMAGE_WEIGHT"),
+    fusion: Optional[str] = Form(None, description="rrf | score (defaults to MULTIMODAL_FUSION)"),
+    text_encoder: str = Form("minilm", description="minilm: text index | clip: CLIP text tower on the image index"),
+    filters: Optional[str] = Form(None, description='Metadata filter as JSON, e.g. {"price":{"$lt":200}}'),
+    fields: Optional[str] = Form(None, description="Comma-separated metadata fields; * for all"),
+    collapse_duplicates: Optional[bool] = Form(None, description=_COLLAPSE_HELP),
+):
+    """
+    Prompt + image in one round trip ("this photo but in walnut"). Both sides
+    are encoded concurrently, their indexes are queried in parallel, and the
+    two hit lists are fused with the given weights.
+    """
+    prompt = normalize_prompt(prompt or "")
+    has_image = file is not None or bool(image_url)
+    if not prompt and not has_image:
+        raise HTTPException(status_code=422, detail="Provide a prompt, an image, or both")
+    fusion = fusion or settings.MULTIMODAL_FUSION
+    if fusion not in FUSIONS:
+        raise HTTPException(status_code=422, detail=f"fusion must be one of {', '.join(FUSIONS)}")
+    if text_encoder not in ("minilm", "clip"):
+        raise HTTPException(status_code=422, detail="text_encoder must be minilm or clip")
+    if prompt:
+        require_role("text" if text_encoder == "minilm" else "image")()
+    if has_image:
+        require_role("image")()
+    flt = parse_filters(filters)
+    fields = parse_fields(fields)
+    dedup = wants_collapse(collapse_duplicates)
+    window = overfetch(top_k) if dedup else top_k
+    # over-fetch each side so the fused ranking has overlap to work with
+    fetch_k = max(2 * window, 20)
+    timer = StageTimer()
+
+    def _query(index, vec):
+        return index.query(vector=vec, top_k=fetch_k, include_metadata=include_metadata(),
+                           filter=flt, namespace="default").get("matches", [])
+
+    async def text_side():
+        with timer.stage("text_embed"):
+            if text_encoder == "clip":
+                vec, index = await encode_clip_text_async(prompt), image_index
+            else:
+                vec, index = query_vectors.get(prompt), text_index
+                if vec is None:
+                    vec = await encode_text_async(prompt)
+                    query_vectors.set(prompt, vec)
+        with timer.stage("text_query"):
+            return await run_in_threadpool(_query, index, vec)
+
+    async def image_side():
+        if file is not None:
+            with timer.stage("read"):
+                raw = await file.read()
+            with timer.stage("decode"):
+                img = await preprocess_async(raw)
+            with timer.stage("embed"):
+                vec = await encode_image_async(img)
+        else:
+            vec = await _image_url_vec(image_url, timer)
+        with timer.stage("image_query"):
+            return await run_in_threadpool(_query, image_index, vec)
+
+    try:
+        sides, weights = [], []
+        if prompt:
+            sides.append(text_side())
+            weights.append(settings.MULTIMODAL_TEXT_WEIGHT if text_weight is None else text_weight)
+        if has_image:
+            sides.append(image_side())
+            weights.append(settings.MULTIMODAL_IMAGE_WEIGHT if image_weight is None else image_weight)
+        with timer.stage("fan_out"):
+            ranked = await asyncio.gather(*sides)
+        with timer.stage("fuse"):
+            matches = fuse(fusion, *ranked, weights=weights, k=settings.RRF_K)[:window]
+        with timer.stage("hydrate"):
+            items = await run_in_threadpool(hydrate, matches, fields, text_index)
+        if dedup:
+            items = collapse(items, top_k)
+        return hits_response(items, timer.ms(), fusion=fusion, weights=weights)
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
+    except ModelServerError:
+        raise
+    except Exception as e:
+        logger.exception("multimodal search failed")
+        raise HTTPException(status_code=500, detail=f"multimodal search failed: {e}")
@@ -1,12 +1,19 @@
-import logging, io, base64
-from typing import Literal
-from fastapi import APIRouter, HTTPException, Query
+import logging, base64
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from PIL import Image
 
-from ...models.schemas import SearchHit, SimilarResponse
+from .deps import hits_response, require_role
+from ...core.timing import StageTimer
+from ...models.schemas import SimilarResponse
 from ...services.embeddings import encode_text, encode_image
 from ...services.vectorstore import text_index, image_index
+from ...services.neighbors import get_table
+from ...services.embstore import get_store
+from ...services.dedup import collapse, overfetch, wants_collapse
+from ...services.imaging import ImageRejected, preprocess
+from ...services.metastore import hydrate, include_metadata, parse_fields
+from ...services.modelserver import ModelServerError
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -14,21 +21,52 @@ router = APIRouter()
 class ImageQuery(BaseModel):
     image_b64: str  # base64-encoded image bytes (JPEG/PNG)
 
+_FIELDS_Q = Query(None, description="Comma-separated metadata fields; * for all")
+_COLLAPSE_Q = Query(None, description="One hit per near-duplicate cluster; defaults to DEDUP_COLLAPSE_DEFAULT")
+
+def _from_table(modality: str, uniq_id: str, top_k: int, fields, window: int = 0):
+    """Serve from the precomputed neighbor table; None when the id isn't in it."""
+    table = get_table(modality)
+    # an over-fetch window for collapsing is capped at the table's width
+    hits = table.lookup(uniq_id, max(top_k, min(window, table.top_n))) if table else None
+    if hits is None:
+        return None
+    index = text_index if modality == "text" else image_index
+    return hydrate([{"id": i, "score": s} for i, s in hits], fields, index)
+
 @router.get("/similar/{uniq_id}", response_model=SimilarResponse)
 def similar_by_id(
     uniq_id: str,
     modality: Literal["text","image"] = Query("text"),
-    top_k: int = Query(12, ge=1, le=100)
+    top_k: int = Query(12, ge=1, le=100),
+    fields: Optional[str] = _FIELDS_Q,
+    collapse_duplicates: Optional[bool] = _COLLAPSE_Q,
 ):
+    dedup = wants_collapse(collapse_duplicates)
+    window = overfetch(top_k) if dedup else top_k
+
+    def _collapsed(items):
+        # the product's own duplicates aren't "similar items" either
+        return collapse(items, top_k, exclude=uniq_id) if dedup else items
+
     try:
+        require_role(modality)()
+        fields = parse_fields(fields)
+        items = _from_table(modality, uniq_id, top_k, fields, window)
+        if items is not None:
+            return hits_response(_collapsed(items))
+
+        # Live fallback for ids the table doesn't cover
         index = text_index if modality == "text" else image_index
         if index is None and modality == "image":
             raise HTTPException(status_code=400, detail="Image index not available.")
-        if modality == "text":
-            get_res = index.fetch(ids=[uniq_id], namespace="default")
-            md = None
-            for vec in get_res.get("vectors", {}).values():
-                md = vec.get("metadata")
+        store = get_store(modality)
+        vec = store.vector(uniq_id) if store is not None else None
+        if vec is not None:
+            # the product's own catalog embedding (memory-mapped): no fetch, no encode
+            res = index.query(vector=vec.tolist(), top_k=window+1, include_metadata=include_metadata(), namespace="default")
+        elif modality == "text":
+            md = hydrate([{"id": uniq_id}], None, index)[0]["metadata"]
             if not md:
                 raise HTTPException(status_code=404, detail="Item not found in text index")
             parts = [md.get("title",""), md.get("brand","")]
@@ -36,34 +74,48 @@ def similar_by_id(
                 parts += md["categories"]
             q = " | ".join([p for p in parts if p])
             qvec = encode_text(q if q.strip() else md.get("title",""))
-            res = index.query(vector=qvec, top_k=top_k+1, include_metadata=True, namespace="default")
+            res = index.query(vector=qvec, top_k=window+1, include_metadata=include_metadata(), namespace="default")
         else:
-            raise HTTPException(status_code=400, detail="Use POST /api/similar/image for image probes.")
+            # Query by the stored image vector itself
+            res = index.query(id=uniq_id, top_k=window+1, include_metadata=include_metadata(), namespace="default")
         matches = res.get("matches", [])
         matches = [m for m in matches if m["id"] != uniq_id]
-        items = [SearchHit(id=m["id"], score=float(m.get("score",0.0)), metadata=m.get("metadata",{}))
-                 for m in matches[:top_k]]
-        return SimilarResponse(items=items)
+        return hits_response(_collapsed(hydrate(matches[:window], fields, index)))
     except HTTPException:
         raise
+    except ModelServerError:
+        raise
     except Exception as e:
         logger.exception("similar_by_id failed")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/similar/image", response_model=SimilarResponse)
-def similar_by_image(body: ImageQuery, top_k: int = Query(12, ge=1, le=100)):
+@router.post("/similar/image", response_model=SimilarResponse, dependencies=[Depends(require_role("image"))])
+def similar_by_image(body: ImageQuery, top_k: int = Query(12, ge=1, le=100), fields: Optional[str] = _FIELDS_Q,
+                     collapse_duplicates: Optional[bool] = _COLLAPSE_Q):
+    timer = StageTimer()
+    dedup = wants_collapse(collapse_duplicates)
     try:
         if image_index is None:
             raise HTTPException(status_code=400, detail="Image index not available.")
-        raw = base64.b64decode(body.image_b64)
-        img = Image.open(io.BytesIO(raw)).convert("RGB")
-        qvec = encode_image(img)
-        res = image_index.query(vector=qvec, top_k=top_k, include_metadata=True, namespace="default")
-        items = [SearchHit(id=m["id"], score=float(m.get("score",0.0)), metadata=m.get("metadata",{}))
-                 for m in res.get("matches", [])]
-        return SimilarResponse(items=items)
+        with timer.stage("decode"):
+            raw = base64.b64decode(body.image_b64)
+            img = preprocess(raw)
+        with timer.stage("embed"):
+            qvec = encode_image(img)
+        with timer.stage("query"):
+            res = image_index.query(vector=qvec, top_k=overfetch(top_k) if dedup else top_k,
+                                    include_metadata=include_metadata(), namespace="default")
+        with timer.stage("hydrate"):
+            items = hydrate(res.get("matches", []), parse_fields(fields), image_index)
+            if dedup:
+                items = collapse(items, top_k)
+        return hits_response(items, timer.ms())
     except HTTPException:
         raise
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ModelServerError:
+        raise
     except Exception as e:
         logger.exception("similar_by_image failed")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,28 @@
+import logging
+
+import orjson
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
+
+from ...services.suggest import get_suggest_index
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.get("/suggest", tags=["search"])
+def suggest(
+    q: str = Query(..., max_length=200, description="What the user has typed so far"),
+    limit: int = Query(8, ge=1, le=20),
+):
+    """
+    Typeahead completions (titles, brands, categories, popular searches) for
+    a prefix, ranked by popularity. Served from memory: no model or vector
+    query is involved.
+    """
+    try:
+        items = get_suggest_index().suggest(q, limit)
+    except Exception as e:
+        logger.exception("suggest failed")
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(orjson.dumps({"q": q, "items": items}), media_type="application/json")
@@ -8,6 +8,20 @@ class Settings(BaseSettings):
     APP_ENV: str = "dev"
     API_V1_STR: str = "/api"
 
+    # Capabilities this process serves: "all" or a comma list of text,image,gen.
+    # Models load lazily on first use; WARMUP_ON_STARTUP preloads them in the
+    # background and /api/ready reports 503 until that finishes.
+    SERVICE_ROLES: str = "all"
+    WARMUP_ON_STARTUP: bool = False
+
+    # Multi-worker mode (python -m backend.app.serve --workers N): workers send
+    # model calls to one model-server process on this unix socket ("" = in-process)
+    MODEL_SERVER: str = ""
+    MODEL_SERVER_AUTHKEY: str = ""
+    MODEL_SERVER_LIMITS: str = "text=4,image=2,rerank=2,gen=1"  # concurrent calls per model
+    MODEL_SERVER_MAX_QUEUE: int = 64         # waiting calls per model before 503
+    MODEL_SERVER_TIMEOUT_S: float = 120.0
+
     # Accept list or comma-separated string
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] | List[str] = ["http://localhost:5173"]
 
@@ -17,6 +31,28 @@ class Settings(BaseSettings):
     PINECONE_TEXT_INDEX: str = "products-text"
     PINECONE_IMAGE_INDEX: str = "products-image"
 
+    # Vector store backend: "pinecone" (remote) or "local" (in-process NumPy/IVF)
+    VECTOR_BACKEND: str = "pinecone"
+    LOCAL_INDEX_DIR: str = "data/index"      # holds text/ and image/ subdirectories
+    LOCAL_INDEX_KIND: str = "auto"           # auto|exact|ivf
+    LOCAL_IVF_MIN_ROWS: int = 20000          # auto switches to IVF at this size
+    LOCAL_IVF_NLIST: int = 0                 # 0 -> ~sqrt(n) lists
+    LOCAL_IVF_NPROBE: int = 8
+    # Compressed first pass per index: float32 (off) | int8 | pq | pq:<sub-vectors>;
+    # a shortlist of top_k * LOCAL_RESCORE is re-scored with the full vectors.
+    # Compare settings with python -m backend.app.jobs.vector_report
+    LOCAL_TEXT_CODEC: str = "float32"
+    LOCAL_IMAGE_CODEC: str = "float32"
+    LOCAL_RESCORE: int = 4
+
+    # Precomputed /similar neighbor tables (python -m backend.app.jobs.build_neighbors)
+    NEIGHBOR_DIR: str = "data/neighbors"
+
+    # Versioned, memory-mapped catalog embeddings (jobs/ingest, jobs/build_embeddings)
+    EMBEDDING_DIR: str = "data/embeddings"
+    EMBEDDING_DTYPE: str = "float16"         # float16|float32 on disk
+    EMBEDDING_KEEP_VERSIONS: int = 2
+
     # Embedding models (accept legacy env names too)
     TEXT_MODEL: str = Field(
         default="sentence-transformers/all-MiniLM-L6-v2",
@@ -28,6 +64,37 @@ class Settings(BaseSettings):
     )
     DEVICE: str = "auto"  # auto|cpu|cuda
 
+    # CPU inference backend: torch (fp32) | int8 | onnx | onnx-int8
+    INFERENCE_BACKEND: str = "torch"
+    MODEL_CACHE_DIR: str = "data/models"      # converted int8/ONNX artifacts
+
+    # Micro-batching of concurrent encode_text/encode_image calls
+    EMBED_BATCHING: bool = True
+    EMBED_BATCH_MAX_SIZE: int = 32
+    EMBED_BATCH_MAX_WAIT_MS: float = 5.0
+
+    # Image preprocessing (decode + downscale) for the image routes
+    IMAGE_DECODE_POOL: str = "thread"        # thread|process
+    IMAGE_DECODE_WORKERS: int = 0            # 0 -> executor default
+    MAX_IMAGE_BYTES: int = 10 * 1024 * 1024
+    MAX_IMAGE_PIXELS: int = 40_000_000
+
+    # /search/image URL fetching (pooled async client) and embedding cache
+    IMAGE_FETCH_MAX_CONNECTIONS: int = 64
+    IMAGE_FETCH_PER_HOST: int = 8
+    IMAGE_FETCH_TIMEOUT_S: float = 15.0
+    IMAGE_CACHE_MAX_ENTRIES: int = 4096
+    IMAGE_CACHE_TTL_S: float = 86400.0       # url -> content hash
+    IMAGE_CACHE_DIR: str = ""                # optional disk mirror ("" = memory only)
+    IMAGE_CACHE_DISK_MAX_ENTRIES: int = 50_000  # files per disk-mirror tier (oldest pruned)
+
+    # /api/search caches (query embedding + final hits), LRU with TTL
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_TTL_S: float = 600.0
+    SEARCH_CACHE_MAX_ENTRIES: int = 4096
+    QUERY_VECTOR_CACHE_MB: float = 32.0
+    SEARCH_RESULT_CACHE_MB: float = 64.0
+
     # Reranker flag + model (accept legacy env names)
     USE_RERANKER: bool = Field(
         default=False,
@@ -37,6 +104,66 @@ class Settings(BaseSettings):
         default="cross-encoder/ms-marco-MiniLM-L-6-v2",
         validation_alias=AliasChoices("RERANKER_MODEL", "reranker_model"),
     )
+    RERANK_CANDIDATES: int = 50        # vector hits scored by the cross-encoder
+    RERANK_BATCH_SIZE: int = 16
+    RERANK_BUDGET_MS: float = 0.0      # per-request deadline for /search; 0 = none
+    RERANK_CACHE_MAX_ENTRIES: int = 100_000
+
+    # /api/facets over the catalog (Pinecone backend): catch up with metadata-store writes
+    FACET_REFRESH_S: float = 30.0
+
+    # Hybrid retrieval: BM25 over catalog metadata fused with vector hits (RRF)
+    HYBRID_SEARCH: bool = True
+    LEXICAL_CANDIDATES: int = 50
+    LEXICAL_REFRESH_S: float = 30.0          # catch up with metadata-store writes
+    RRF_K: int = 60
+
+    # /search/multimodal: prompt + image fan-out and fusion ("rrf" | "score")
+    MULTIMODAL_FUSION: str = "rrf"
+    MULTIMODAL_TEXT_WEIGHT: float = 0.5
+    MULTIMODAL_IMAGE_WEIGHT: float = 0.5
+
+    # Near-duplicate listings (jobs/ingest, jobs/build_dedup): image pHash + text
+    # LSH clusters; collapse_duplicates on /search and /similar keeps one per cluster
+    DEDUP_DIR: str = "data/dedup"
+    DEDUP_PHASH_MAX_DISTANCE: int = 6        # differing bits of a 64-bit image hash
+    DEDUP_TEXT_THRESHOLD: float = 0.95       # cosine between text embeddings
+    DEDUP_LSH_BANDS: int = 16
+    DEDUP_LSH_BITS: int = 12
+    DEDUP_COLLAPSE_DEFAULT: bool = False
+    DEDUP_OVERFETCH: int = 2                 # hits retrieved per top_k slot when collapsing
+
+    # /api/suggest typeahead: catalog phrases + past searches ranked by popularity
+    SUGGEST_QUERY_WEIGHT: float = 5.0        # score per past search (a product counts 1)
+    SUGGEST_MIN_QUERY_COUNT: int = 2         # searches before a query is suggested
+    SUGGEST_MAX_QUERIES: int = 5000
+    SUGGEST_QUERIES_DB: str = "data/queries.sqlite3"
+    SUGGEST_REFRESH_S: float = 30.0
+
+    # Generated descriptions cached on disk by (prompt, model, sampling, seed)
+    GEN_CACHE_ENABLED: bool = True
+    GEN_CACHE_DB: str = "data/generations.sqlite3"
+    GEN_CACHE_MAX_MB: float = 64.0
+
+    # Local metadata store (SQLite) and default response projection ("*" = all fields)
+    METADATA_DB: str = "data/metadata.sqlite3"
+    RESPONSE_FIELDS: str = (
+        "uniq_id,title,brand,price,categories,images,image_url,material,color,country_of_origin,"
+        "gen_description,predicted_category,pred_conf,cluster_tag"
+    )
+
+    # Catalog aggregates behind /api/analytics/summary, snapshotted for fast restarts
+    ANALYTICS_SNAPSHOT: str = "data/analytics.json"
+    ANALYTICS_SNAPSHOT_INTERVAL_S: float = 60.0  # min seconds between snapshots of live updates
+
+    # Instrumentation: /metrics, per-request Server-Timing traces (send
+    # TRACE_HEADER: 1) and request profiles (sampled, or TRACE_HEADER: profile
+    # when PROFILE_ON_DEMAND is set)
+    METRICS_ENABLED: bool = True
+    TRACE_HEADER: str = "X-Trace"
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_ON_DEMAND: bool = False
+    PROFILE_DIR: str = "data/profiles"
 
     # Optional, ignored but tolerated so pydantic doesn’t complain if present
     NORMALIZE_EMBEDDINGS: Optional[bool] = Field(
@@ -74,4 +201,12 @@ class Settings(BaseSettings):
             return parts
         return v
 
+    @property
+    def roles(self) -> set[str]:
+        roles = {r.strip().lower() for r in self.SERVICE_ROLES.split(",") if r.strip()}
+        return {"text", "image", "gen"} if not roles or "all" in roles else roles
+
+    def has_role(self, role: str) -> bool:
+        return role in self.roles
+
 settings = Settings()
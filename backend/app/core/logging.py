@@ -1,10 +1,22 @@
 import logging, sys
 
+
+class _TraceFilter(logging.Filter):
+    """Tags records logged while serving a traced request with its trace id."""
+
+    def filter(self, record):
+        from .metrics import trace_id
+        tid = trace_id()
+        record.trace = f" [trace={tid}]" if tid else ""
+        return True
+
+
 def setup_logging():
     logger = logging.getLogger()
     if not logger.handlers:
         handler = logging.StreamHandler(sys.stdout)
-        fmt = logging.Formatter("[%(levelname)s] %(asctime)s - %(name)s: %(message)s")
+        fmt = logging.Formatter("[%(levelname)s] %(asctime)s - %(name)s%(trace)s: %(message)s")
         handler.setFormatter(fmt)
+        handler.addFilter(_TraceFilter())
         logger.addHandler(handler)
         logger.setLevel(logging.INFO)
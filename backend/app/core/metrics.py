@@ -0,0 +1,321 @@
+# app/core/metrics.py
+"""
+In-process metrics rendered in the Prometheus text format (no client library).
+
+- ``STAGE_SECONDS``: hot-path stage latency (decode, embed_*, vector_query_*,
+  lexical, rerank, hydrate, generate, serialize), observed with ``timed()``
+- ``BATCH_SIZE``: items per micro-batch, by batcher
+- ``HTTP_SECONDS`` / ``HTTP_IN_FLIGHT``: per-route latency and concurrency,
+  recorded by ``MetricsMiddleware``
+- collectors: callbacks that turn existing stats (caches, batch queues, model
+  load times) into samples at scrape time
+
+A request carrying ``TRACE_HEADER`` gets a ``Server-Timing`` header with every
+stage timed on its behalf. Sampled requests (``PROFILE_SAMPLE_RATE``) and,
+with ``PROFILE_ON_DEMAND``, ``X-Trace: profile`` ones are also profiled into
+``PROFILE_DIR``.
+"""
+from __future__ import annotations
+
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+Labels = Tuple[Tuple[str, str], ...]
+# (name, type, help, [(labels, value), ...])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]
+
+
+def _fmt_labels(labels: Iterable[Tuple[str, Any]]) -> str:
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if v == int(v) and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v))
+
+
+# ------------------------------- METRIC TYPES --------------------------------
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Labels:
+        return tuple((k, str(labels.get(k, ""))) for k in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_fmt_labels(k)} {_fmt_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts (non-cumulative, last = +Inf), sum]
+        self._values: Dict[Labels, List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            slot = self._values.get(key)
+            if slot is None:
+                slot = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            slot[0][i] += 1
+            slot[1] += value
+
+    def _samples(self) -> List[str]:
+        out = []
+        with self._lock:
+            items = [(k, list(c), s) for k, (c, s) in self._values.items()]
+        for key, counts, total in items:
+            acc = 0
+            for le, c in zip(self.buckets + (math.inf,), counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_fmt_labels(key + (('le', _fmt_value(le)),))} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_value(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(key)} {acc}")
+        return out
+
+
+# --------------------------------- REGISTRY ----------------------------------
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], Iterable[Family]]) -> Callable[[], Iterable[Family]]:
+        """Register a scrape-time callback yielding (name, type, help, [(labels, value)]) families."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines += m.render()
+        for fn in self._collectors:
+            try:
+                families = list(fn())
+            except Exception as e:
+                logger.warning(f"metrics collector {getattr(fn, '__name__', fn)} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                lines += [f"{name}{_fmt_labels(sorted(lbl.items()))} {_fmt_value(float(v))}" for lbl, v in samples]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS: Histogram = REGISTRY.register(
+    Histogram("app_stage_seconds", "Wall time of hot-path stages.", ("stage",)))
+BATCH_SIZE: Histogram = REGISTRY.register(
+    Histogram("app_batch_size", "Items per model micro-batch.", ("batcher",), buckets=SIZE_BUCKETS))
+HTTP_SECONDS: Histogram = REGISTRY.register(
+    Histogram("app_http_request_seconds", "HTTP request latency.", ("method", "route", "status")))
+HTTP_IN_FLIGHT: Gauge = REGISTRY.register(
+    Gauge("app_http_requests_in_flight", "HTTP requests currently being served."))
+
+
+# ---------------------------------- TRACING ----------------------------------
+class _Trace:
+    __slots__ = ("id", "stages")
+
+    def __init__(self, trace_id: str):
+        self.id = trace_id
+        self.stages: List[Tuple[str, float]] = []
+
+
+_trace: contextvars.ContextVar[Optional[_Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def trace_id() -> Optional[str]:
+    t = _trace.get()
+    return t.id if t is not None else None
+
+
+def observe_stage(stage: str, seconds: float):
+    if not settings.METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    t = _trace.get()
+    if t is not None:
+        t.stages.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str):
+    """Observe the block's wall time under ``stage`` (and in the active request trace)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def server_timing(stages: Sequence[Tuple[str, float]], total_s: float) -> str:
+    merged: Dict[str, List[float]] = {}
+    for name, s in stages:
+        slot = merged.setdefault(name, [0.0, 0])
+        slot[0] += s
+        slot[1] += 1
+    parts = [f'{name};dur={s * 1000:.2f}' + (f';desc="x{n}"' if n > 1 else "") for name, (s, n) in merged.items()]
+    parts.append(f"total;dur={total_s * 1000:.2f}")
+    return ", ".join(parts)
+
+
+# --------------------------------- PROFILING ---------------------------------
+class _Profile:
+    """pyinstrument (sampling, async-aware) when installed, else cProfile."""
+
+    def __init__(self, name: str):
+        self.name = name
+        try:
+            from pyinstrument import Profiler
+            self._p, self._kind = Profiler(async_mode="enabled"), "pyinstrument"
+        except ImportError:
+            import cProfile
+            self._p, self._kind = cProfile.Profile(), "cprofile"
+
+    def start(self) -> bool:
+        try:
+            if self._kind == "pyinstrument":
+                self._p.start()
+            else:
+                self._p.enable()
+            return True
+        except (RuntimeError, ValueError) as e:  # another profiler is already active
+            logger.debug(f"profile {self.name} skipped: {e}")
+            return False
+
+    def stop(self):
+        try:
+            out = Path(settings.PROFILE_DIR)
+            out.mkdir(parents=True, exist_ok=True)
+            if self._kind == "pyinstrument":
+                self._p.stop()
+                path = out / f"{self.name}.html"
+                path.write_text(self._p.output_html(), encoding="utf-8")
+            else:
+                self._p.disable()
+                path = out / f"{self.name}.prof"
+                self._p.dump_stats(str(path))
+            logger.info(f"Profile written to {path}")
+        except Exception as e:
+            logger.warning(f"profile {self.name} not written: {e}")
+
+
+# -------------------------------- MIDDLEWARE ---------------------------------
+def _route_of(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI (streaming-safe): HTTP latency/in-flight metrics, opt-in traces and profiles."""
+
+    def __init__(self, app):
+        self.app = app
+        self._trace_header = settings.TRACE_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        flag = dict(scope.get("headers") or ()).get(self._trace_header, b"").decode("latin-1").strip().lower()
+        traced = flag not in ("", "0", "false", "off")
+        sampled = settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+        trace = _Trace(uuid.uuid4().hex[:16]) if traced or sampled else None
+        token = _trace.set(trace)
+        profile = _Profile(f"{int(time.time())}-{trace.id}") if trace is not None and (
+            sampled or (flag == "profile" and settings.PROFILE_ON_DEMAND)) else None
+
+        t0 = time.perf_counter()
+        status = 500
+        HTTP_IN_FLIGHT.inc()
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if traced:
+                    headers = list(message.get("headers") or ())
+                    headers.append((b"server-timing",
+                                    server_timing(trace.stages, time.perf_counter() - t0).encode("latin-1")))
+                    headers.append((b"x-trace-id", trace.id.encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        if profile is not None and not profile.start():
+            profile = None
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            if profile is not None:
+                profile.stop()
+            HTTP_IN_FLIGHT.dec()
+            HTTP_SECONDS.observe(time.perf_counter() - t0, method=scope.get("method", ""),
+                                 route=_route_of(scope), status=status)
+            _trace.reset(token)
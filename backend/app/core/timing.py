@@ -0,0 +1,23 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+class StageTimer:
+    """Accumulates per-stage wall time for a request; ms() gives the timings_ms dict."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - t)
+
+    def ms(self) -> Dict[str, float]:
+        out = {k: round(v * 1000, 1) for k, v in self.stages.items()}
+        out["total"] = round((time.perf_counter() - self.t0) * 1000, 1)
+        return out
@@ -0,0 +1,325 @@
+# app/jobs/benchmark.py
+"""
+Load / latency benchmark for the API routes: ``/search``,
+``/search/image/upload``, ``/similar/{id}`` and ``/gen/description`` at a fixed
+concurrency, reporting p50/p95/p99 latency, throughput and peak RSS, and
+comparing against a saved baseline.
+
+    python -m backend.app.jobs.benchmark --prepare
+    python -m backend.app.jobs.benchmark --concurrency 8 --requests 200 \
+        --out data/bench/latest.json --baseline data/bench/baseline.json
+
+By default the app runs in-process (httpx ASGI transport) against a local
+vector store under ``--data-dir`` (``VECTOR_BACKEND=local``); ``--prepare``
+ingests the catalog CSV and sample images into it first. ``--url`` drives a
+running server instead (``--server-pid`` reads its peak RSS from /proc).
+
+The query set is derived from the catalog with a fixed seed: title prefixes
+for /search, images from ``--image-dir`` for uploads, uniq_ids for /similar
+and /gen/description. Generation requests go out unseeded so they are never
+answered from the generation cache. In-process mode keeps every artifact the
+app writes (index, metadata, embeddings, neighbors, dedup, analytics, query
+log, generation cache) under ``--data-dir``. Exits 1 when a route regresses
+past ``--tolerance``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Only the stdlib-level logging helper at import time: the app's settings are
+# read from the environment, which main() points at the local stand-in first.
+from ..core.logging import setup_logging
+
+logger = logging.getLogger(__name__)
+
+ROUTES = ("search", "image_upload", "similar", "gen")
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+Call = Tuple[str, str, Dict[str, Any]]  # (method, path, httpx request kwargs)
+
+
+# ------------------------------- WORKLOAD ------------------------------------
+@dataclass
+class Workload:
+    prompts: List[str] = field(default_factory=list)
+    ids: List[str] = field(default_factory=list)
+    images: List[Tuple[str, bytes]] = field(default_factory=list)
+
+
+def build_workload(csv_path: str, image_dir: str, seed: int, max_images: int = 64) -> Workload:
+    """Seeded, catalog-derived queries: short title prefixes read like user searches."""
+    rng = random.Random(seed)
+    wl = Workload()
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            uid, words = (row.get("uniq_id") or "").strip(), (row.get("title") or "").split()
+            if uid:
+                wl.ids.append(uid)
+            if words:
+                wl.prompts.append(" ".join(words[: rng.randint(2, 6)]))
+    rng.shuffle(wl.prompts)
+    rng.shuffle(wl.ids)
+
+    root = Path(image_dir)
+    paths = sorted(p for p in root.rglob("*") if p.suffix.lower() in _IMAGE_EXTS) if root.is_dir() else []
+    for p in rng.sample(paths, min(max_images, len(paths))):
+        wl.images.append((p.name, p.read_bytes()))
+    logger.info(f"Workload: {len(wl.prompts)} prompts, {len(wl.ids)} ids, {len(wl.images)} images (seed {seed})")
+    return wl
+
+
+def scenarios(wl: Workload, api: str, top_k: int, gen_tokens: int) -> Dict[str, Callable[[int], Call]]:
+    def search(i: int) -> Call:
+        return "POST", f"{api}/search", {"json": {"prompt": wl.prompts[i % len(wl.prompts)], "top_k": top_k}}
+
+    def image_upload(i: int) -> Call:
+        name, raw = wl.images[i % len(wl.images)]
+        return "POST", f"{api}/search/image/upload", {"files": {"file": (name, raw, "image/jpeg")},
+                                                       "data": {"top_k": str(top_k)}}
+
+    def similar(i: int) -> Call:
+        return "GET", f"{api}/similar/{wl.ids[i % len(wl.ids)]}", {"params": {"top_k": top_k}}
+
+    def gen(i: int) -> Call:
+        return "POST", f"{api}/gen/description", {"json": {"uniq_id": wl.ids[i % len(wl.ids)],
+                                                           "max_new_tokens": gen_tokens, "save": False,
+                                                           "seed": None}}
+
+    out = {"search": search, "image_upload": image_upload, "similar": similar, "gen": gen}
+    if not wl.prompts:
+        out.pop("search")
+    if not wl.images:
+        out.pop("image_upload")
+    if not wl.ids:
+        out.pop("similar")
+        out.pop("gen")
+    return out
+
+
+# -------------------------------- RUNNER -------------------------------------
+def peak_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Peak resident set size of this process, or of ``pid`` via /proc (Linux)."""
+    if pid is None:
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(kb / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError as e:
+        logger.warning(f"peak RSS of pid {pid} unavailable: {e}")
+    return None
+
+
+def summarize(lat_s: List[float], errors: Counter, wall_s: float) -> Dict[str, Any]:
+    ms = np.asarray(lat_s) * 1000.0
+    pct = (lambda p: round(float(np.percentile(ms, p)), 2)) if len(ms) else (lambda p: None)
+    return {
+        "requests": len(lat_s) + sum(errors.values()),
+        "errors": sum(errors.values()),
+        "error_codes": dict(errors),
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(lat_s) / wall_s, 2) if wall_s > 0 else 0.0,
+        "latency_ms": {
+            "p50": pct(50), "p95": pct(95), "p99": pct(99),
+            "mean": round(float(ms.mean()), 2) if len(ms) else None,
+            "max": round(float(ms.max()), 2) if len(ms) else None,
+        },
+    }
+
+
+async def run_route(client, make: Callable[[int], Call], requests: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    import httpx
+
+    async def call(i: int) -> Tuple[bool, str]:
+        method, path, kw = make(i)
+        try:
+            r = await client.request(method, path, **kw)
+        except httpx.HTTPError as e:
+            return False, type(e).__name__
+        return r.status_code < 400, str(r.status_code)
+
+    for i in range(warmup):  # model loads, index opens, JIT paths
+        await call(i)
+
+    lat: List[float] = []
+    errors: Counter = Counter()
+    ticket = itertools.count()
+
+    async def worker():
+        while (i := next(ticket)) < requests:
+            t = time.perf_counter()
+            ok, code = await call(warmup + i)
+            if ok:
+                lat.append(time.perf_counter() - t)
+            else:
+                errors[code] += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return summarize(lat, errors, time.perf_counter() - t0)
+
+
+async def run(args, wl: Workload) -> Dict[str, Any]:
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url.rstrip("/"), timeout=args.timeout)
+    else:
+        from ..main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=args.timeout)
+
+    makers = scenarios(wl, args.api_prefix.rstrip("/"), args.top_k, args.gen_tokens)
+    results: Dict[str, Any] = {}
+    async with client:
+        for route in args.routes:
+            if route not in makers:
+                logger.warning(f"[{route}] skipped: no inputs for it in the workload")
+                continue
+            n = args.gen_requests if route == "gen" else args.requests
+            logger.info(f"[{route}] {n} requests at concurrency {args.concurrency}")
+            results[route] = await run_route(client, makers[route], n, args.concurrency, args.warmup)
+            results[route]["peak_rss_mb"] = peak_rss_mb(args.server_pid)
+            lm = results[route]["latency_ms"]
+            logger.info(f"[{route}] p50 {lm['p50']} ms | p95 {lm['p95']} ms | p99 {lm['p99']} ms | "
+                        f"{results[route]['throughput_rps']} req/s | {results[route]['errors']} errors")
+    return results
+
+
+# ------------------------------- BASELINE ------------------------------------
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Print per-route deltas; return the regressions beyond ``tolerance`` (fractional)."""
+    regressions: List[str] = []
+    print(f"{'route':<14}{'metric':<16}{'baseline':>12}{'current':>12}{'delta':>10}")
+    for route, cur in current["routes"].items():
+        base = baseline.get("routes", {}).get(route)
+        if base is None:
+            print(f"{route:<14}{'(no baseline)':<16}")
+            continue
+        rows = [(f"p{p}_ms", base["latency_ms"][f"p{p}"], cur["latency_ms"][f"p{p}"], +1) for p in (50, 95, 99)]
+        rows += [("throughput_rps", base["throughput_rps"], cur["throughput_rps"], -1),
+                 ("peak_rss_mb", base.get("peak_rss_mb"), cur.get("peak_rss_mb"), +1)]
+        for metric, b, c, worse in rows:
+            if b is None or c is None:
+                continue
+            delta = (c - b) / b if b else 0.0
+            flag = ""
+            if delta * worse > tolerance:
+                flag = "  REGRESSION"
+                regressions.append(f"{route}.{metric}: {b} -> {c} ({delta:+.1%})")
+            print(f"{route:<14}{metric:<16}{b:>12}{c:>12}{delta:>+10.1%}{flag}")
+        if cur["errors"] > base.get("errors", 0):
+            regressions.append(f"{route}.errors: {base.get('errors', 0)} -> {cur['errors']}")
+    return regressions
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _use_local_store(args):
+    root = Path(args.data_dir)
+    os.environ["VECTOR_BACKEND"] = "local"
+    os.environ["LOCAL_INDEX_DIR"] = str(root / "index")
+    os.environ["METADATA_DB"] = str(root / "metadata.sqlite3")
+    os.environ["EMBEDDING_DIR"] = str(root / "embeddings")
+    os.environ["NEIGHBOR_DIR"] = str(root / "neighbors")
+    os.environ["DEDUP_DIR"] = str(root / "dedup")
+    os.environ["ANALYTICS_SNAPSHOT"] = str(root / "analytics.json")
+    os.environ["SUGGEST_QUERIES_DB"] = str(root / "queries.sqlite3")
+    os.environ["GEN_CACHE_DB"] = str(root / "generations.sqlite3")
+    if args.no_cache:
+        os.environ["SEARCH_CACHE_ENABLED"] = "false"
+        os.environ["GEN_CACHE_ENABLED"] = "false"
+
+
+def main(argv=None):
+    setup_logging()
+    ap = argparse.ArgumentParser(description="Latency / throughput benchmark of the API routes")
+    ap.add_argument("--csv", default="notebooks/intern_data_ikarus.csv")
+    ap.add_argument("--image-dir", default="notebooks/data/images_all")
+    ap.add_argument("--routes", default=",".join(ROUTES), help=f"comma-separated subset of {', '.join(ROUTES)}")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=200, help="timed requests per route")
+    ap.add_argument("--gen-requests", type=int, default=20, help="timed requests for /gen/description")
+    ap.add_argument("--gen-tokens", type=int, default=64, help="max_new_tokens for /gen/description")
+    ap.add_argument("--warmup", type=int, default=3, help="untimed requests per route first")
+    ap.add_argument("--top-k", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--api-prefix", default="/api")
+    ap.add_argument("--url", default="", help="benchmark a running server instead of the in-process app")
+    ap.add_argument("--server-pid", type=int, default=None, help="with --url: read the server's peak RSS")
+    ap.add_argument("--data-dir", default="data/bench", help="local index + metadata store (in-process mode)")
+    ap.add_argument("--prepare", action="store_true", help="ingest --csv/--image-dir into --data-dir first")
+    ap.add_argument("--no-cache", action="store_true", help="disable the search and generation caches (in-process mode)")
+    ap.add_argument("--out", default="", help="write the report JSON here")
+    ap.add_argument("--baseline", default="", help="compare against this report JSON")
+    ap.add_argument("--update-baseline", action="store_true", help="write this run to --baseline")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="allowed fractional regression")
+    args = ap.parse_args(argv)
+    args.routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = set(args.routes) - set(ROUTES)
+    if unknown:
+        ap.error(f"unknown routes: {', '.join(sorted(unknown))}")
+
+    if not args.url:
+        _use_local_store(args)
+        if args.prepare:
+            from . import ingest
+            ingest.main(["--csv", args.csv, "--image-dir", args.image_dir,
+                         "--checkpoint", str(Path(args.data_dir) / "ingest_checkpoint.json")])
+
+    wl = build_workload(args.csv, args.image_dir, args.seed)
+    routes = asyncio.run(run(args, wl))
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_rev": _git_rev(),
+        "mode": args.url or "in-process",
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {k: getattr(args, k) for k in ("concurrency", "requests", "gen_requests", "gen_tokens",
+                                                  "warmup", "top_k", "seed", "no_cache")},
+        "routes": routes,
+        "peak_rss_mb": peak_rss_mb(args.server_pid),
+    }
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        logger.info(f"Report written to {args.out}")
+
+    regressions: List[str] = []
+    if args.baseline and Path(args.baseline).exists() and not args.update_baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for r in regressions:
+            logger.warning(f"regression: {r}")
+    elif args.baseline:
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.baseline).write_text(json.dumps(report, indent=2))
+        logger.info(f"Baseline written to {args.baseline}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
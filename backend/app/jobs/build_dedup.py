@@ -0,0 +1,51 @@
+# app/jobs/build_dedup.py
+"""
+Offline job: rebuild the near-duplicate map behind ``collapse_duplicates``
+without a full ingest (e.g. after changing the DEDUP_* thresholds). Image
+hashes recorded by ingest are reused; ``--image-dir`` hashes products that
+don't have them yet. Text vectors come from the embedding store, else the
+index.
+
+    python -m backend.app.jobs.build_dedup --image-dir notebooks/data/images_all
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from ..core.config import settings
+from ..core.logging import setup_logging
+from ..services import dedup
+from .ingest import hash_images, image_paths
+
+logger = logging.getLogger(__name__)
+
+
+def backfill(image_dir: Path, hashes: dedup.PHashes, workers: int) -> int:
+    todo = [d.name for d in sorted(image_dir.iterdir()) if d.is_dir() and d.name not in hashes]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for uid in todo:
+            paths = image_paths(image_dir, uid)
+            if paths:
+                hash_images(uid, paths, hashes, pool)
+    hashes.flush()
+    return len(todo)
+
+
+def main(argv=None):
+    setup_logging()
+    ap = argparse.ArgumentParser(description="Rebuild the near-duplicate product map")
+    ap.add_argument("--image-dir", default="", help="<dir>/<uniq_id>/*.jpg; hash products missing image hashes")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="image decode threads")
+    args = ap.parse_args(argv)
+    hashes = dedup.PHashes(Path(settings.DEDUP_DIR) / "phash.json")
+    if args.image_dir:
+        logger.info(f"hashed images of {backfill(Path(args.image_dir), hashes, args.workers)} products")
+    logger.info(f"duplicate map: {dedup.rebuild(hashes).stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# app/jobs/build_embeddings.py
+"""
+Offline job: snapshot the catalog vectors the indexes already hold (e.g.
+Pinecone indexes populated by the notebooks) into the versioned, memory-mapped
+embedding store, without re-encoding anything.
+
+    python -m backend.app.jobs.build_embeddings --modality text image --dtype float16
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+from pathlib import Path
+
+from ..core.config import settings
+from ..core.logging import setup_logging
+from ..services.embstore import model_for, write_store
+from ..services.vectorstore import export_vectors, image_index, text_index
+
+logger = logging.getLogger(__name__)
+
+
+def build(modality: str, out_dir: Path, dtype: str):
+    index = text_index if modality == "text" else image_index
+    t0 = time.perf_counter()
+    ids, vecs, _ = export_vectors(index, namespace="default")
+    if not ids:
+        logger.warning(f"{modality}: index is empty, skipping")
+        return
+    write_store(out_dir / modality, ids, vecs, model_for(modality), dtype=dtype, modality=modality, source="index")
+    logger.info(f"{modality}: {len(ids)} vectors exported in {time.perf_counter() - t0:.1f}s")
+
+
+def main(argv=None):
+    setup_logging()
+    ap = argparse.ArgumentParser(description="Snapshot index vectors into the on-disk embedding store")
+    ap.add_argument("--modality", nargs="+", choices=["text", "image"], default=["text", "image"])
+    ap.add_argument("--dtype", choices=["float16", "float32"], default=settings.EMBEDDING_DTYPE)
+    ap.add_argument("--out", default=settings.EMBEDDING_DIR)
+    args = ap.parse_args(argv)
+    for modality in args.modality:
+        build(modality, Path(args.out), args.dtype)
+
+
+if __name__ == "__main__":
+    main()
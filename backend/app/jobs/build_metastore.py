@@ -0,0 +1,58 @@
+# app/jobs/build_metastore.py
+"""
+Offline job: backfill the local metadata store from what the vector indexes
+already hold (e.g. Pinecone indexes populated by the notebooks), optionally
+merging the full CSV rows for descriptions and image URLs.
+
+    python -m backend.app.jobs.build_metastore --csv notebooks/intern_data_ikarus.csv
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+from typing import Any, Dict
+
+from ..core.config import settings
+from ..core.logging import setup_logging
+from ..services.metastore import MetaStore
+from ..services.vectorstore import export_vectors, image_index, text_index
+
+logger = logging.getLogger(__name__)
+
+
+def build(store: MetaStore, csv_path: str = "") -> int:
+    t0 = time.perf_counter()
+    records: Dict[str, Dict[str, Any]] = {}
+    # image metadata first so the text index (where gen_description lives) wins
+    for index in (image_index, text_index):
+        try:
+            ids, _, metas = export_vectors(index, namespace="default")
+        except Exception as e:
+            logger.warning(f"export failed: {e}")
+            continue
+        for uid, meta in zip(ids, metas):
+            records.setdefault(uid, {}).update(meta)
+    if csv_path:
+        from .ingest import read_chunks
+        from ..services.catalog import meta_from_row
+        for chunk in read_chunks(csv_path, 1000):
+            for r in chunk:
+                rec = records.setdefault(r["uniq_id"], {})
+                records[r["uniq_id"]] = {**r, **meta_from_row(r), **rec}
+    n = store.upsert(records.items())
+    logger.info(f"Metadata store: {n} records written -> {store.path} in {time.perf_counter() - t0:.1f}s")
+    return n
+
+
+def main(argv=None):
+    setup_logging()
+    ap = argparse.ArgumentParser(description="Backfill the local metadata store from the vector indexes")
+    ap.add_argument("--csv", default="", help="Optional catalog CSV to merge full product rows from")
+    ap.add_argument("--db", default=settings.METADATA_DB)
+    args = ap.parse_args(argv)
+    build(MetaStore(args.db), args.csv)
+
+
+if __name__ == "__main__":
+    main()
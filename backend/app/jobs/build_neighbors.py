@@ -0,0 +1,58 @@
+# app/jobs/build_neighbors.py
+"""
+Offline job: compute the top-N text and image neighbors of every product in
+one batched pass and write the memory-mapped tables served by /similar.
+Vectors come from the on-disk embedding store when it has been built, else
+they are exported from the index.
+
+    python -m backend.app.jobs.build_neighbors --top-n 50 --modality text image
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+from pathlib import Path
+
+from ..core.config import settings
+from ..core.logging import setup_logging
+from ..services.embstore import get_store
+from ..services.neighbors import compute_neighbors, write_table
+from ..services.vectorstore import export_vectors, image_index, text_index
+
+logger = logging.getLogger(__name__)
+
+
+def build(modality: str, top_n: int, out_dir: Path):
+    index = text_index if modality == "text" else image_index
+    t0 = time.perf_counter()
+    store = get_store(modality)
+    if store is not None:
+        ids, vecs = store.ids, store.vectors  # memory-mapped, no export round trips
+    else:
+        ids, vecs, _ = export_vectors(index, namespace="default")
+    t1 = time.perf_counter()
+    if not ids:
+        logger.warning(f"{modality}: index is empty, skipping")
+        return
+    nbrs, scores = compute_neighbors(vecs, top_n)
+    write_table(out_dir / modality, ids, nbrs, scores, modality=modality, dim=int(vecs.shape[1]))
+    logger.info(
+        f"{modality}: {len(ids)} ids x {top_n} neighbors "
+        f"(export {t1 - t0:.1f}s, compute {time.perf_counter() - t1:.1f}s) -> {out_dir / modality}"
+    )
+
+
+def main(argv=None):
+    setup_logging()
+    ap = argparse.ArgumentParser(description="Build precomputed neighbor tables for /similar")
+    ap.add_argument("--modality", nargs="+", choices=["text", "image"], default=["text", "image"])
+    ap.add_argument("--top-n", type=int, default=50)
+    ap.add_argument("--out", default=settings.NEIGHBOR_DIR)
+    args = ap.parse_args(argv)
+    for modality in args.modality:
+        build(modality, args.top_n, Path(args.out))
+
+
+if __name__ == "__main__":
+    main()
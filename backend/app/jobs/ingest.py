@@ -0,0 +1,278 @@
+# app/jobs/ingest.py
+"""
+Catalog ingestion: stream the product CSV in chunks, normalize rows, batch-
+encode text and images, and bulk-upsert into the configured vector store.
+
+    python -m backend.app.jobs.ingest --csv notebooks/intern_data_ikarus.csv \
+        --image-dir notebooks/data/images_all
+
+Full product records are written to the local metadata store, and every
+vector encoded is merged into the versioned embedding store (``embstore``).
+Each product's text and image inputs are content-hashed and recorded in a
+checkpoint file only after the local index and embedding stores holding its
+vectors are saved (every ``--checkpoint-every`` chunks), so an interrupted
+run resumes where it stopped and re-runs only touch products that changed (or that the
+embedding store doesn't hold yet). Perceptual hashes of the decoded images
+are kept for the near-duplicate map (``dedup``), rebuilt at the end.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from ..core.config import settings
+from ..core.logging import setup_logging
+from ..services import analytics, dedup, embeddings
+from ..services.catalog import content_hash, meta_from_row, normalize_row, product_text
+from ..services.embstore import get_store, model_for, reload_stores, update_store
+from ..services.metastore import metastore
+from ..services.vectorstore import image_index, persist_indexes, text_index
+
+logger = logging.getLogger(__name__)
+
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+MAX_IMG = 8  # cap per product to control runtime/memory (as in the notebook)
+
+
+# ----------------------------- CHECKPOINT ------------------------------------
+class Checkpoint:
+    """uniq_id -> {"text": hash, "image": hash}, rewritten atomically by commit()."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.state: Dict[str, Dict[str, str]] = {}
+        if path.exists():
+            self.state = json.loads(path.read_text())
+
+    def unchanged(self, uid: str, kind: str, h: str) -> bool:
+        return self.state.get(uid, {}).get(kind) == h
+
+    def mark(self, uid: str, kind: str, h: str):
+        self.state.setdefault(uid, {})[kind] = h
+
+    def flush(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state))
+        os.replace(tmp, self.path)
+
+
+class EmbeddingSink:
+    """Vectors encoded this run, merged into the modality's embedding store by flush()."""
+
+    def __init__(self, modality: str, enabled: bool = True):
+        self.modality = modality
+        self.enabled = enabled
+        self.store = get_store(modality) if enabled else None
+        self.ids: List[str] = []
+        self.vecs: List[np.ndarray] = []
+
+    def missing(self, uid: str) -> bool:
+        return self.enabled and (self.store is None or uid not in self.store)
+
+    def add(self, ids: List[str], vecs: np.ndarray):
+        if self.enabled and len(ids):
+            self.ids += ids
+            self.vecs.append(np.asarray(vecs, dtype=np.float32))
+
+    def flush(self):
+        if self.ids:
+            update_store(Path(settings.EMBEDDING_DIR) / self.modality, self.ids, np.concatenate(self.vecs),
+                         model_for(self.modality), modality=self.modality)
+            self.ids, self.vecs = [], []
+
+
+# ------------------------------- INPUTS --------------------------------------
+def read_chunks(csv_path: str, size: int) -> Iterator[List[Dict[str, Any]]]:
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        chunk: List[Dict[str, Any]] = []
+        for raw in csv.DictReader(f):
+            row = normalize_row(raw)
+            if not row["uniq_id"]:
+                continue
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def image_paths(image_dir: Optional[Path], uid: str) -> List[Path]:
+    if image_dir is None:
+        return []
+    d = image_dir / uid
+    if not d.is_dir():
+        return []
+    return sorted(p for p in d.iterdir() if p.suffix.lower() in _IMAGE_EXTS)[:MAX_IMG]
+
+
+def _image_fingerprint(paths: List[Path]) -> List[Any]:
+    return [(p.name, p.stat().st_size, int(p.stat().st_mtime)) for p in paths]
+
+
+def _load_image(path: Path) -> Optional[Image.Image]:
+    try:
+        img = Image.open(path)
+        img.draft("RGB", (448, 448))  # JPEG: decode at reduced scale
+        img = img.convert("RGB")
+        img.thumbnail((256, 256), Image.BICUBIC)
+        return img
+    except Exception as e:
+        logger.debug(f"skip image {path}: {e}")
+        return None
+
+
+# ------------------------------- STAGES --------------------------------------
+def commit(ckpt: Checkpoint, sinks: Dict[str, EmbeddingSink], hashes: dedup.PHashes):
+    """Persist what was upserted so far, then record it as done."""
+    if not persist_indexes():
+        # don't mark products done whose vectors aren't on disk; the next run re-embeds them
+        raise RuntimeError(f"local index not saved (changed on disk by another process?); "
+                           f"checkpoint {ckpt.path} left at the last saved chunk")
+    for sink in sinks.values():
+        sink.flush()
+    ckpt.flush()
+    hashes.flush()
+
+
+def _upsert(index, vectors: List[Dict[str, Any]], batch: int):
+    for i in range(0, len(vectors), batch):
+        index.upsert(vectors=vectors[i:i + batch], namespace="default")
+
+
+def ingest_text(rows, ckpt: Checkpoint, sink: EmbeddingSink, args) -> int:
+    todo = []
+    for r in rows:
+        meta, text = meta_from_row(r), product_text(r)
+        h = content_hash(meta, text)
+        if args.force or not ckpt.unchanged(r["uniq_id"], "text", h) or sink.missing(r["uniq_id"]):
+            todo.append((r["uniq_id"], meta, text, h))
+    if not todo:
+        return 0
+    vecs = np.concatenate([
+        embeddings.encode_texts([t for _, _, t, _ in todo[i:i + args.batch_size]])
+        for i in range(0, len(todo), args.batch_size)
+    ])
+    _upsert(text_index, [{"id": uid, "values": v.tolist(), "metadata": meta}
+                         for (uid, meta, _, _), v in zip(todo, vecs)], args.upsert_batch)
+    sink.add([uid for uid, _, _, _ in todo], vecs)
+    for uid, _, _, h in todo:
+        ckpt.mark(uid, "text", h)
+    return len(todo)
+
+
+def hash_images(uid: str, paths: List[Path], hashes: dedup.PHashes, pool: ThreadPoolExecutor):
+    hashes.set(uid, [im for im in pool.map(_load_image, paths) if im is not None])
+
+
+def ingest_images(rows, ckpt: Checkpoint, sink: EmbeddingSink, pool: ThreadPoolExecutor, image_dir: Path,
+                  hashes: dedup.PHashes, args) -> int:
+    todo = []
+    for r in rows:
+        paths = image_paths(image_dir, r["uniq_id"])
+        if not paths:
+            continue
+        meta = meta_from_row(r)
+        h = content_hash(meta, _image_fingerprint(paths))
+        if args.force or not ckpt.unchanged(r["uniq_id"], "image", h) or sink.missing(r["uniq_id"]):
+            todo.append((r["uniq_id"], meta, paths, h))
+        elif r["uniq_id"] not in hashes:
+            hash_images(r["uniq_id"], paths, hashes, pool)  # embedded before dedup existed
+    if not todo:
+        return 0
+
+    # decode in the pool, encode every image of the chunk in batched passes
+    flat = [(k, p) for k, (_, _, paths, _) in enumerate(todo) for p in paths]
+    imgs = list(pool.map(_load_image, [p for _, p in flat]))
+    owners = [k for (k, _), im in zip(flat, imgs) if im is not None]
+    imgs = [im for im in imgs if im is not None]
+    if not imgs:
+        return 0
+    embs = np.concatenate([
+        embeddings.encode_images(imgs[i:i + args.batch_size]) for i in range(0, len(imgs), args.batch_size)
+    ])
+    owners = np.asarray(owners)
+    for k, (uid, _, _, _) in enumerate(todo):
+        hashes.set(uid, [imgs[i] for i in np.flatnonzero(owners == k)])
+    vectors = []
+    for k, (uid, meta, _, h) in enumerate(todo):
+        mine = embs[owners == k]
+        if not len(mine):
+            continue
+        vec = mine.mean(axis=0)
+        vec = vec / (np.linalg.norm(vec) + 1e-12)
+        vectors.append({"id": uid, "values": vec.tolist(), "metadata": meta})
+    _upsert(image_index, vectors, args.upsert_batch)
+    if vectors:
+        sink.add([v["id"] for v in vectors], np.array([v["values"] for v in vectors], np.float32))
+    done = {v["id"] for v in vectors}
+    for uid, _, _, h in todo:
+        if uid in done:
+            ckpt.mark(uid, "image", h)
+    return len(vectors)
+
+
+def run(args) -> Dict[str, int]:
+    ckpt = Checkpoint(Path(args.checkpoint))
+    image_dir = None if args.no_images else Path(args.image_dir)
+    if image_dir is not None and not image_dir.is_dir():
+        logger.warning(f"Image dir {image_dir} not found; text only")
+        image_dir = None
+
+    sinks = {m: EmbeddingSink(m, enabled=not args.no_embstore) for m in ("text", "image")}
+    hashes = dedup.PHashes(Path(settings.DEDUP_DIR) / "phash.json")
+    totals = {"rows": 0, "text": 0, "image": 0}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for n, chunk in enumerate(read_chunks(args.csv, args.chunk_size), 1):
+            totals["rows"] += len(chunk)
+            # full records (description, image urls, ...) go to the local store; the
+            # index keeps the slim filterable metadata
+            metastore.upsert((r["uniq_id"], {**r, **meta_from_row(r)}) for r in chunk)
+            totals["text"] += ingest_text(chunk, ckpt, sinks["text"], args)
+            if image_dir is not None:
+                totals["image"] += ingest_images(chunk, ckpt, sinks["image"], pool, image_dir, hashes, args)
+            if n % max(1, args.checkpoint_every) == 0:
+                commit(ckpt, sinks, hashes)
+            logger.info(f"{totals['rows']} rows | text upserts {totals['text']} | image upserts {totals['image']}")
+    commit(ckpt, sinks, hashes)
+    reload_stores()
+    analytics.refresh()  # replays the rows just written, re-snapshots for the API
+    if not args.no_dedup:
+        dedup.rebuild(hashes)
+    logger.info(f"Ingestion finished in {time.perf_counter() - t0:.1f}s: {totals}")
+    return totals
+
+
+def main(argv=None):
+    setup_logging()
+    ap = argparse.ArgumentParser(description="Ingest the product catalog into the vector store")
+    ap.add_argument("--csv", default="notebooks/intern_data_ikarus.csv")
+    ap.add_argument("--image-dir", default="notebooks/data/images_all", help="<dir>/<uniq_id>/*.jpg")
+    ap.add_argument("--no-images", action="store_true")
+    ap.add_argument("--chunk-size", type=int, default=256, help="CSV rows per chunk / checkpoint")
+    ap.add_argument("--batch-size", type=int, default=64, help="items per encode call")
+    ap.add_argument("--upsert-batch", type=int, default=100, help="vectors per upsert call")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="image decode threads")
+    ap.add_argument("--checkpoint", default="data/ingest_checkpoint.json")
+    ap.add_argument("--checkpoint-every", type=int, default=8,
+                    help="chunks between saving the index / embedding stores and the checkpoint")
+    ap.add_argument("--force", action="store_true", help="re-embed everything, ignoring the checkpoint")
+    ap.add_argument("--no-embstore", action="store_true", help="don't write the on-disk embedding store")
+    ap.add_argument("--no-dedup", action="store_true", help="don't rebuild the near-duplicate map")
+    run(ap.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
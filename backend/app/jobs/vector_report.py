@@ -0,0 +1,143 @@
+# app/jobs/vector_report.py
+"""
+Recall vs. memory for the local index codecs (``LOCAL_TEXT_CODEC`` /
+``LOCAL_IMAGE_CODEC``, ``LOCAL_RESCORE``), to pick a setting per index.
+
+A seeded sample of catalog vectors is held out as queries; the rest are
+indexed once per setting (float32, int8, PQ at several sub-vector counts,
+each with several re-score factors) and every setting's top-k is compared to
+the exact float32 top-k over the same rows.
+
+    python -m backend.app.jobs.vector_report --modality text image --queries 200 --k 10
+    python -m backend.app.jobs.vector_report --codecs int8,pq:48 --rescore 2,4,8 --out data/vector_report.json
+
+Columns: recall@k, RAM per vector (the codes the first pass scans; float32
+keeps the full vectors in RAM, the codecs memory-map them), total RAM and
+mapped MB, codec training time and mean / p95 query latency.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from ..core.config import settings
+from ..core.logging import setup_logging
+from ..services.embstore import get_store
+from ..services.localindex import LocalIndex
+from ..services.vectorstore import export_vectors, image_index, text_index
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+
+def _catalog(modality: str):
+    store = get_store(modality)
+    if store is not None:
+        return list(store.ids), np.asarray(store.vectors, np.float32)
+    ids, vecs, _ = export_vectors(text_index if modality == "text" else image_index, namespace="default")
+    return list(ids), np.asarray(vecs, np.float32)
+
+
+def default_codecs(dim: int) -> List[str]:
+    pq = [f"pq:{m}" for m in (dim // 16, dim // 8, dim // 4) if m and dim % m == 0]
+    return ["float32", "int8"] + list(dict.fromkeys(pq))
+
+
+def evaluate(base: np.ndarray, queries: np.ndarray, k: int, codec: str, rescore: int, kind: str) -> Dict[str, Any]:
+    truth = np.argsort(-(queries @ base.T), axis=1)[:, :k]
+    index = LocalIndex(f"report-{codec}", kind=kind, codec=codec, rescore=rescore)
+    index.upsert(((str(i), v) for i, v in enumerate(base)), namespace="default")
+    t0 = time.perf_counter()
+    index.query(vector=queries[0].tolist(), top_k=k, namespace="default")  # trains the codec (and IVF)
+    train_s = time.perf_counter() - t0
+
+    hits, lat = 0, []
+    for q, want in zip(queries, truth):
+        t = time.perf_counter()
+        res = index.query(vector=q.tolist(), top_k=k, namespace="default")
+        lat.append(time.perf_counter() - t)
+        hits += len({int(m["id"]) for m in res["matches"]} & set(want.tolist()))
+
+    mem = index.memory_stats()["namespaces"]["default"]
+    full = mem["vector_bytes"]
+    ram = full if codec == "float32" else mem["code_bytes"] + mem["codec_bytes"]
+    return {
+        "codec": codec,
+        "rescore": rescore if codec != "float32" else None,
+        "recall": round(hits / (len(queries) * k), 4),
+        "ram_bytes_per_vector": mem["bytes_per_vector"],
+        "ram_mb": round(ram / _MB, 3),
+        "mapped_mb": round(full / _MB, 3) if codec != "float32" else 0.0,
+        "train_s": round(train_s, 3),
+        "mean_ms": round(1000 * float(np.mean(lat)), 3),
+        "p95_ms": round(1000 * float(np.percentile(lat, 95)), 3),
+    }
+
+
+def report(modality: str, n_queries: int, k: int, codecs: List[str], rescores: List[int],
+           kind: str, seed: int) -> Dict[str, Any]:
+    ids, vecs = _catalog(modality)
+    if len(ids) < 2:
+        logger.warning(f"{modality}: not enough vectors to evaluate, skipping")
+        return {}
+    vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+    n_queries = max(1, min(n_queries, len(ids) // 5 or 1))
+    held = np.random.default_rng(seed).choice(len(ids), n_queries, replace=False)
+    rest = np.setdiff1d(np.arange(len(ids)), held)
+    base, queries = vecs[rest], vecs[held]
+    k = min(k, len(base))
+    rows = []
+    for codec in codecs or default_codecs(vecs.shape[1]):
+        for rescore in ([1] if codec == "float32" else rescores):
+            rows.append(evaluate(base, queries, k, codec, rescore, kind))
+            logger.info(f"{modality}: {codec} x{rescore}: recall@{k} {rows[-1]['recall']:.3f}")
+    return {"modality": modality, "vectors": len(base), "queries": n_queries, "dim": int(vecs.shape[1]),
+            "k": k, "kind": kind, "results": rows}
+
+
+def print_report(rep: Dict[str, Any]):
+    print(f"\n{rep['modality']}: {rep['vectors']} vectors x {rep['dim']}d, {rep['queries']} held-out queries, "
+          f"recall@{rep['k']} ({rep['kind']})")
+    print(f"{'codec':<10}{'rescore':>8}{'recall':>9}{'B/vec':>8}{'RAM MB':>10}{'mapped MB':>11}"
+          f"{'train s':>9}{'mean ms':>9}{'p95 ms':>9}")
+    for r in rep["results"]:
+        print(f"{r['codec']:<10}{r['rescore'] or '-':>8}{r['recall']:>9.3f}{r['ram_bytes_per_vector']:>8}"
+              f"{r['ram_mb']:>10.2f}{r['mapped_mb']:>11.2f}{r['train_s']:>9.2f}{r['mean_ms']:>9.3f}{r['p95_ms']:>9.3f}")
+
+
+def main(argv=None):
+    setup_logging()
+    ap = argparse.ArgumentParser(description="Recall vs. memory of the local index vector codecs")
+    ap.add_argument("--modality", nargs="+", choices=["text", "image"], default=["text", "image"])
+    ap.add_argument("--queries", type=int, default=200, help="catalog vectors held out as queries")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--codecs", default="", help="comma list, e.g. float32,int8,pq:48 (default: float32, int8, "
+                                                 "pq at dim/16, dim/8, dim/4 sub-vectors)")
+    ap.add_argument("--rescore", default="1,4,16", help="comma list of shortlist factors (top_k * factor)")
+    ap.add_argument("--kind", default=settings.LOCAL_INDEX_KIND, choices=["auto", "exact", "ivf"])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="", help="write the report JSON here")
+    args = ap.parse_args(argv)
+
+    codecs = [c.strip() for c in args.codecs.split(",") if c.strip()]
+    rescores = [int(r) for r in args.rescore.split(",") if r.strip()]
+    reports = []
+    for modality in args.modality:
+        rep = report(modality, args.queries, args.k, codecs, rescores, args.kind, args.seed)
+        if rep:
+            print_report(rep)
+            reports.append(rep)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,11 @@ from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from .core.config import settings
+from .core.logging import setup_logging
+from .core.metrics import MetricsMiddleware
+from .services.modelserver import ModelServerError
+
+setup_logging()
 
 log = logging.getLogger(__name__)
 
@@ -41,28 +46,72 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Trace-Id"],
 )
 
-# -----------------------------------------------------------------------------
-# Health
-# -----------------------------------------------------------------------------
-@app.get("/api/health")
-def health():
-    return {"name": "AI Product API", "env": settings.ENV, "status": "ok"}
+# Per-route latency / in-flight metrics and opt-in request traces (see core/metrics.py)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(ModelServerError)
+async def _model_server_error(request: Request, exc: ModelServerError):
+    """Model server unreachable (502) or saturated (503, retry shortly)."""
+    headers = {"Retry-After": "1"} if exc.status_code == 503 else None
+    return JSONResponse({"detail": str(exc)}, status_code=exc.status_code, headers=headers)
 
 # -----------------------------------------------------------------------------
 # API Routers
 # -----------------------------------------------------------------------------
+from .api.v1.health import router as health_router  # noqa: E402
 from .api.v1.search import router as search_router  # noqa: E402
+from .api.v1.similar import router as similar_router  # noqa: E402
+from .api.v1.facets import router as facets_router  # noqa: E402
+from .api.v1.metrics import router as metrics_router  # noqa: E402
+from .api.v1.analytics import router as analytics_router  # noqa: E402
+from .api.v1.suggest import router as suggest_router  # noqa: E402
+
+app.include_router(health_router, prefix=settings.API_V1_STR)
+app.include_router(analytics_router, prefix=settings.API_V1_STR)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_router)  # scraped at /metrics, outside the API prefix
+if settings.has_role("text") or settings.has_role("image"):
+    app.include_router(search_router, prefix=settings.API_V1_STR)
+    app.include_router(similar_router, prefix=settings.API_V1_STR)
+    app.include_router(facets_router, prefix=settings.API_V1_STR)
+    app.include_router(suggest_router, prefix=settings.API_V1_STR)
+
+if settings.has_role("gen"):
+    try:
+        from .api.v1.gen import router as gen_router  # noqa: E402
+
+        app.include_router(gen_router, prefix=settings.API_V1_STR)
+    except Exception as e:
+        log.warning(f"GenAI routes not loaded: {e}")
+
+
+@app.on_event("startup")
+def _warm_models():
+    if settings.WARMUP_ON_STARTUP:
+        from .services.loader import start_background_warmup
+
+        start_background_warmup()
+
+
+@app.on_event("shutdown")
+def _flush_indexes():
+    from .services.vectorstore import persist_indexes
+    from .services import analytics, imaging
+
+    persist_indexes()
+    analytics.save_snapshot()
+    imaging.shutdown()
 
-app.include_router(search_router, prefix=settings.API_V1_STR)
 
-try:
-    from .api.v1.gen import router as gen_router  # noqa: E402
+@app.on_event("shutdown")
+async def _close_fetcher():
+    from .services.fetcher import fetcher
 
-    app.include_router(gen_router, prefix=settings.API_V1_STR)
-except Exception as e:
-    log.warning(f"GenAI routes not loaded: {e}")
+    await fetcher.aclose()
 
 # -----------------------------------------------------------------------------
 # Serve React SPA (built files copied to /app/frontend_build by Docker)
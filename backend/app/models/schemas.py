@@ -11,17 +11,25 @@ class SearchRequest(BaseModel):
     top_k: int = 12
     filters: Optional[Dict[str, Any]] = None  # Pinecone metadata filter
     use_reranker: Optional[bool] = None       # override env default
+    rerank_budget_ms: Optional[float] = None  # override RERANK_BUDGET_MS
+    hybrid: Optional[bool] = None             # BM25 + vector fusion; override HYBRID_SEARCH
+    fields: Optional[List[str]] = None        # metadata projection; ["*"] = all, default RESPONSE_FIELDS
+    collapse_duplicates: Optional[bool] = None  # one hit per near-duplicate cluster; override DEDUP_COLLAPSE_DEFAULT
 
 class SearchHit(BaseModel):
     id: str
-    score: float
+    score: Optional[float]                  # vector similarity; None for a BM25-only hybrid hit
+    fused_score: Optional[float] = None     # RRF / weighted fusion value the hits are ordered by
     metadata: Dict[str, Any]
+    duplicates: Optional[List[str]] = None  # collapsed near-duplicates of this hit
 
 class SearchResponse(BaseModel):
     items: List[SearchHit]
+    timings_ms: Optional[Dict[str, float]] = None
 
 class SimilarResponse(BaseModel):
     items: List[SearchHit]
+    timings_ms: Optional[Dict[str, float]] = None
 
 class Modality(BaseModel):
     modality: Literal["text","image"] = "text"
@@ -0,0 +1,70 @@
+# app/serve.py
+"""
+Production entry point. With one worker this is plain uvicorn; with more, a
+model-server process is started first and every uvicorn worker talks to it
+(see services/modelserver.py), so the model weights are loaded once.
+
+    python -m backend.app.serve --host 0.0.0.0 --port 8000 --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import secrets
+import time
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+APP = "backend.app.main:app"
+
+
+def _wait_for_socket(path: str, proc, timeout_s: float = 30.0):
+    deadline = time.monotonic() + timeout_s
+    while not os.path.exists(path):
+        if not proc.is_alive():
+            raise SystemExit(f"model server exited with code {proc.exitcode}")
+        if time.monotonic() > deadline:
+            raise SystemExit(f"model server socket {path} did not appear within {timeout_s:.0f}s")
+        time.sleep(0.1)
+
+
+def _model_server(address: str):
+    from .services.modelserver import run_server
+    run_server(address)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run the API, sharing one model server across workers")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    ap.add_argument("--socket", default=os.getenv("MODEL_SERVER") or f"/tmp/furnishiq-models-{os.getpid()}.sock")
+    args = ap.parse_args(argv)
+
+    if args.workers <= 1:
+        uvicorn.run(APP, host=args.host, port=args.port)
+        return
+
+    # Workers (and the model server) read these through settings
+    os.environ["MODEL_SERVER"] = args.socket
+    os.environ.setdefault("MODEL_SERVER_AUTHKEY", secrets.token_hex(16))
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    proc = mp.get_context("spawn").Process(target=_model_server, args=(args.socket,), name="model-server")
+    proc.start()
+    try:
+        _wait_for_socket(args.socket, proc)
+        uvicorn.run(APP, host=args.host, port=args.port, workers=args.workers)
+    finally:
+        proc.terminate()
+        proc.join(10)
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
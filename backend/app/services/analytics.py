@@ -0,0 +1,315 @@
+# app/services/analytics.py
+"""
+Catalog aggregates for the Analytics page (``/api/analytics/summary``), kept
+as materialized state instead of scanning the metadata per request:
+
+- product counts per (leaf) category
+- running price sums / counts per brand (``safe_float``; 0 means unpriced)
+- products first seen per month (cumulated into the growth series)
+
+Each product's contribution is remembered, so an upsert or metadata patch
+subtracts the old one and adds the new one in O(1). The state is snapshotted
+to ``ANALYTICS_SNAPSHOT`` with a watermark (newest metastore ``updated_at``
+applied); a restart loads the snapshot and only replays rows written after
+it. ``jobs/ingest`` catches up and re-snapshots at the end of a run, and
+serving processes pick a newer snapshot up on their next request.
+
+The summary body and its ETag are rendered once per change, so serving it is
+constant time.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import orjson
+
+from ..core.config import settings
+from .utils import safe_float
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 1
+UNCATEGORIZED = "Uncategorized"
+
+# uniq_id -> (category, brand, price or None, first-seen month "YYYY-MM")
+Entry = Tuple[str, str, Optional[float], str]
+
+
+def _month(ts: float) -> str:
+    return time.strftime("%Y-%m", time.gmtime(ts))
+
+
+def _category(v: Any) -> str:
+    if isinstance(v, (list, tuple)):
+        v = v[-1] if v else ""
+    return str(v or "").strip() or UNCATEGORIZED
+
+
+def _price(v: Any) -> Optional[float]:
+    p = safe_float(v, default=0.0)
+    return p if p > 0 else None
+
+
+class CatalogAggregates:
+    def __init__(self):
+        self.rows: Dict[str, Entry] = {}
+        self.by_category: Counter = Counter()
+        self.brand_price: Dict[str, List[float]] = {}  # brand -> [sum, n]
+        self.price_sum = 0.0
+        self.price_n = 0
+        self.by_month: Counter = Counter()
+        self.watermark = 0.0
+        self.generation = 0
+        self._rendered: Dict[int, Tuple[int, bytes, str]] = {}  # limit -> (generation, body, etag)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    # ---- write path ----
+    def _apply(self, entry: Entry, sign: int):
+        cat, brand, price, month = entry
+        self.by_category[cat] += sign
+        if self.by_category[cat] <= 0:
+            del self.by_category[cat]
+        self.by_month[month] += sign
+        if self.by_month[month] <= 0:
+            del self.by_month[month]
+        if price is None:
+            return
+        self.price_sum += sign * price
+        self.price_n += sign
+        if brand:
+            acc = self.brand_price.setdefault(brand, [0.0, 0])
+            acc[0] += sign * price
+            acc[1] += sign
+            if acc[1] <= 0:
+                del self.brand_price[brand]
+
+    def _set(self, uid: str, entry: Optional[Entry]) -> bool:
+        old = self.rows.get(uid)
+        if old == entry:
+            return False
+        if old is not None:
+            self._apply(old, -1)
+            del self.rows[uid]
+        if entry is not None:
+            self._apply(entry, +1)
+            self.rows[uid] = entry
+        return True
+
+    def upsert(self, items: Iterable[Tuple[str, Dict[str, Any]]], ts: Optional[float] = None) -> int:
+        """Index (uid, metadata) pairs; ``ts`` (default now) dates products not seen before."""
+        changed = 0
+        with self._lock:
+            for uid, meta in items:
+                old = self.rows.get(uid)
+                month = old[3] if old is not None else _month(ts or time.time())
+                entry = (_category(meta.get("categories")), str(meta.get("brand") or "").strip(),
+                         _price(meta.get("price")), month)
+                changed += self._set(uid, entry)
+            if changed:
+                self.generation += 1
+        return changed
+
+    def update(self, uid: str, fields: Dict[str, Any]) -> bool:
+        """Apply a metadata patch to a known product (fields it doesn't carry keep their values)."""
+        with self._lock:
+            old = self.rows.get(uid)
+            if old is None or not ({"categories", "brand", "price"} & fields.keys()):
+                return False
+            cat, brand, price, month = old
+            if "categories" in fields:
+                cat = _category(fields["categories"])
+            if "brand" in fields:
+                brand = str(fields["brand"] or "").strip()
+            if "price" in fields:
+                price = _price(fields["price"])
+            if not self._set(uid, (cat, brand, price, month)):
+                return False
+            self.generation += 1
+            return True
+
+    def delete(self, ids: Sequence[str]) -> int:
+        with self._lock:
+            changed = sum(self._set(uid, None) for uid in ids)
+            if changed:
+                self.generation += 1
+        return changed
+
+    # ---- read path ----
+    def summary(self, limit: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            months = sorted(self.by_month.items())
+            series, total = [], 0
+            for month, added in months:
+                total += added
+                series.append({"month": month, "products": total, "added": added})
+            before = series[-2]["products"] if len(series) > 1 else 0
+            growth = round(100.0 * (total - before) / before, 1) if before else 0.0
+            cats = sorted(self.by_category.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+            brands = sorted(self.brand_price.items(), key=lambda kv: (-kv[1][1], kv[0]))[:limit]
+            return {
+                "totals": {
+                    "products": len(self.rows),
+                    "avgPrice": round(self.price_sum / self.price_n, 2) if self.price_n else 0.0,
+                    "growthPct": growth,
+                    "categories": len(self.by_category),
+                    "brands": len(self.brand_price),
+                },
+                "byCategory": [{"name": c, "value": n} for c, n in cats],
+                "avgPriceByBrand": [{"name": b, "value": round(s / n, 2), "products": int(n)}
+                                    for b, (s, n) in brands],
+                "growthSeries": series,
+            }
+
+    def rendered(self, limit: int = 20) -> Tuple[bytes, str]:
+        """(JSON body, ETag) for ``summary(limit)``, re-rendered only after a change."""
+        with self._lock:
+            hit = self._rendered.get(limit)
+            if hit is not None and hit[0] == self.generation:
+                return hit[1], hit[2]
+            body = orjson.dumps(self.summary(limit))
+            etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+            self._rendered[limit] = (self.generation, body, etag)
+            return body, etag
+
+    # ---- snapshots ----
+    def save(self, path: str | Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            state = {"format": FORMAT, "watermark": self.watermark, "generation": self.generation,
+                     "saved_at": time.time(), "rows": self.rows}
+            data = orjson.dumps(state)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "CatalogAggregates":
+        state = orjson.loads(Path(path).read_bytes())
+        if state.get("format") != FORMAT:
+            raise ValueError(f"unsupported analytics snapshot format {state.get('format')!r}")
+        agg = cls()
+        for uid, (cat, brand, price, month) in state["rows"].items():
+            agg._set(uid, (cat, brand, price, month))
+        agg.watermark = float(state["watermark"])
+        agg.generation = int(state["generation"])
+        return agg
+
+    def catch_up(self) -> int:
+        """Replay metastore rows written after the watermark and drop products it no longer has."""
+        from .metastore import metastore
+        n = 0
+        for uid, meta, updated_at in metastore.changed_since(self.watermark):
+            n += self.upsert([(uid, meta)], ts=updated_at)
+            self.watermark = max(self.watermark, updated_at)
+        if len(self.rows) != metastore.count():
+            stored = set(metastore.ids())
+            n += self.delete([uid for uid in self.rows if uid not in stored])
+            if len(self.rows) != len(stored):  # snapshot of another store: start over
+                logger.info(f"analytics: snapshot doesn't match {metastore.path}; rebuilding")
+                self.delete(list(self.rows))
+                self.watermark = 0.0
+                return self.catch_up()
+        return n
+
+
+def _from_index() -> CatalogAggregates:
+    """Without a populated metastore (Pinecone-only deployments) aggregate the index's metadata."""
+    from .vectorstore import export_vectors, text_index
+    agg = CatalogAggregates()
+    ids, _, metas = export_vectors(text_index, "default")
+    agg.upsert(zip(ids, metas))
+    return agg
+
+
+def build() -> CatalogAggregates:
+    """Snapshot (if any) caught up with the metastore, or aggregated from the index."""
+    from .metastore import metastore
+    t0 = time.perf_counter()
+    agg = CatalogAggregates()
+    path = Path(settings.ANALYTICS_SNAPSHOT)
+    if path.exists():
+        try:
+            agg = CatalogAggregates.load(path)
+        except Exception as e:
+            logger.warning(f"analytics snapshot {path} unreadable ({e}); rebuilding")
+    try:
+        if metastore.ready():
+            replayed = agg.catch_up()
+        else:
+            agg, replayed = _from_index(), -1
+    except (sqlite3.Error, RuntimeError) as e:
+        logger.warning(f"analytics: catalog source unavailable: {e}")
+        replayed = 0
+    logger.info(f"Analytics aggregates: {len(agg)} products, {replayed} replayed "
+                f"in {time.perf_counter() - t0:.2f}s")
+    return agg
+
+
+# ------------------------------ serving --------------------------------------
+_agg: Optional[CatalogAggregates] = None
+_snapshot_mtime = 0.0
+_saved_at = 0.0
+_lock = threading.Lock()
+
+
+def _mtime() -> float:
+    try:
+        return os.stat(settings.ANALYTICS_SNAPSHOT).st_mtime
+    except OSError:
+        return 0.0
+
+
+def get_aggregates() -> CatalogAggregates:
+    """Built on first use; reloaded when another process (ingest, a sibling worker) writes a newer snapshot."""
+    global _agg, _snapshot_mtime
+    if _agg is None or _mtime() > _snapshot_mtime:
+        with _lock:
+            mtime = _mtime()
+            if _agg is None or mtime > _snapshot_mtime:
+                _agg, _snapshot_mtime = build(), mtime
+    return _agg
+
+
+def save_snapshot(force: bool = True):
+    """Persist the live aggregates; unforced saves are throttled to ANALYTICS_SNAPSHOT_INTERVAL_S."""
+    global _snapshot_mtime, _saved_at
+    if _agg is None or (not force and time.time() - _saved_at < settings.ANALYTICS_SNAPSHOT_INTERVAL_S):
+        return
+    with _lock:
+        try:
+            _agg.save(settings.ANALYTICS_SNAPSHOT)
+        except OSError as e:
+            logger.warning(f"analytics snapshot not written: {e}")
+            return
+        _snapshot_mtime, _saved_at = _mtime(), time.time()
+
+
+def refresh() -> CatalogAggregates:
+    """Catch up with the metastore and snapshot (run by jobs/ingest after writing it)."""
+    global _agg, _snapshot_mtime
+    with _lock:
+        _agg, _snapshot_mtime = build(), _mtime()
+    save_snapshot()
+    return _agg
+
+
+def on_metadata_update(uid: str, set_metadata: Dict[str, Any]):
+    if _agg is not None and _agg.update(uid, set_metadata):
+        save_snapshot(force=False)
+
+
+def on_delete(ids: Sequence[str]):
+    if _agg is not None and _agg.delete(ids):
+        save_snapshot(force=False)
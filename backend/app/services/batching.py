@@ -0,0 +1,134 @@
+# app/services/batching.py
+"""
+Micro-batching for model calls: concurrent single-item requests are gathered
+for up to ``max_wait_ms`` (or until ``max_batch_size`` items are queued) and
+run through one batched call on a background worker thread.
+
+Sync callers block on ``__call__``; async callers ``await submit_async(...)``
+so the event loop is never blocked by a forward pass.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Sequence, Tuple
+
+from ..core.metrics import BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def _pct(values: Sequence[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = "batch",
+        window: int = 1024,
+    ):
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._q: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+        # metrics
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+        self._sizes: Deque[int] = deque(maxlen=window)
+        self._waits_ms: Deque[float] = deque(maxlen=window)
+
+    # ---- public API ----
+    def submit(self, item: Any) -> Future:
+        self._ensure_worker()
+        fut: Future = Future()
+        self._q.put((item, fut, time.perf_counter()))
+        return fut
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    async def submit_async(self, item: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(item))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            sizes, waits = list(self._sizes), list(self._waits_ms)
+            return {
+                "name": self.name,
+                "batches": self.batches,
+                "items": self.items,
+                "queued": self._q.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batch_size_avg": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "batch_size_p50": _pct(sizes, 50),
+                "batch_size_max": self.max_seen_batch,
+                "queue_wait_ms_p50": round(_pct(waits, 50), 3),
+                "queue_wait_ms_p95": round(_pct(waits, 95), 3),
+                "queue_wait_ms_max": round(max(waits), 3) if waits else 0.0,
+            }
+
+    # ---- worker ----
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[Any, Future, float]]:
+        batch = [self._q.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            live = [(item, fut, t) for item, fut, t in batch if fut.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            self._record(len(live), [(started - t) * 1000.0 for _, _, t in live])
+            try:
+                results = self.fn([item for item, _, _ in live])
+                for (_, fut, _), res in zip(live, results):
+                    fut.set_result(res)
+            except Exception as e:
+                logger.exception(f"[{self.name}] batch of {len(live)} failed")
+                for _, fut, _ in live:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _record(self, size: int, waits_ms: List[float]):
+        BATCH_SIZE.observe(size, batcher=self.name)
+        with self._stats_lock:
+            self.batches += 1
+            self.items += size
+            self.max_seen_batch = max(self.max_seen_batch, size)
+            self._sizes.append(size)
+            self._waits_ms.extend(waits_ms)
@@ -0,0 +1,176 @@
+# app/services/cache.py
+"""
+Memory-bounded LRU caches with TTL expiry and hit/miss counters.
+
+Two process-wide instances back ``/api/search``:
+  - ``query_vectors``:  normalised prompt -> embedding
+  - ``search_results``: (prompt, top_k, filters, reranker flag) -> response
+
+Anything that changes catalog metadata must call ``invalidate_search()``.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+
+def approx_size(value: Any) -> int:
+    """Cheap byte estimate used for the memory bound (not exact)."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value) + 49
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], float):
+            return 8 * len(value) + 24 * len(value) + 56
+        return sys.getsizeof(value) + sum(approx_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if hasattr(value, "model_dump"):
+        return approx_size(value.model_dump())
+    return sys.getsizeof(value)
+
+
+def _canonical(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        items = [_canonical(v) for v in obj]
+        # $in / $nin arrays are sets semantically; sort homogeneous scalars
+        if items and all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in items):
+            if len({type(v) is str for v in items}) == 1:
+                return sorted(items)
+        return items
+    return obj
+
+
+def canonical_key(*parts: Any) -> str:
+    """Stable hash for request parts; dict key order and $in order don't matter."""
+    blob = json.dumps(_canonical(list(parts)), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join((prompt or "").split())
+
+
+class LRUCache:
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 4096,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_s: float = 600.0,
+        sizeof: Callable[[Any], int] = approx_size,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires, _ = entry
+            if expires and expires < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_s: Optional[float] = None):
+        """``ttl_s`` overrides the cache's TTL for this entry (e.g. what's left of one read back from disk)."""
+        size = self.sizeof(value)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        ttl_s = self.ttl_s if ttl_s is None else ttl_s
+        expires = time.monotonic() + ttl_s if ttl_s > 0 else 0.0
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, expires, size)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _drop(self, key: Hashable):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_MB = 1024 * 1024
+_enabled = settings.SEARCH_CACHE_ENABLED
+
+query_vectors = LRUCache(
+    "query_vectors",
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES if _enabled else 0,
+    max_bytes=int(settings.QUERY_VECTOR_CACHE_MB * _MB),
+    ttl_s=settings.SEARCH_CACHE_TTL_S,
+)
+search_results = LRUCache(
+    "search_results",
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES if _enabled else 0,
+    max_bytes=int(settings.SEARCH_RESULT_CACHE_MB * _MB),
+    ttl_s=settings.SEARCH_CACHE_TTL_S,
+)
+
+
+def invalidate_search():
+    """Drop cached hits after a metadata write; query embeddings stay valid."""
+    search_results.clear()
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {c.name: c.stats() for c in (query_vectors, search_results)}
@@ -0,0 +1,89 @@
+# app/services/catalog.py
+"""
+Catalog row normalization shared by ingestion and the serving code. These
+mirror the cleaning in notebooks/data.ipynb (list parsing, price parsing,
+product text and metadata layout) without the pandas dependency.
+"""
+from __future__ import annotations
+
+import ast
+import hashlib
+import json
+from typing import Any, Dict, List
+
+from .utils import safe_float
+
+CSV_COLUMNS = [
+    "uniq_id", "title", "brand", "description", "price", "categories", "images",
+    "manufacturer", "package_dimensions", "country_of_origin", "material", "color",
+]
+
+
+def _s(x: Any) -> str:
+    if x is None:
+        return ""
+    s = str(x).strip()
+    return "" if s.lower() in ("nan", "none") else s
+
+
+def to_list(x: Any) -> List[str]:
+    """"['a', 'b']" or "a, b" -> ['a', 'b'] (as in the notebook's to_list)."""
+    if isinstance(x, list):
+        return [str(v).strip() for v in x if str(v).strip()]
+    s = _s(x)
+    if not s:
+        return []
+    if s.startswith("["):
+        try:
+            return [str(v).strip() for v in ast.literal_eval(s) if str(v).strip()]
+        except (ValueError, SyntaxError):
+            pass
+    return [v.strip() for v in s.split(",") if v.strip()]
+
+
+def parse_price(x: Any) -> float:
+    """'$1,299.00' -> 1299.0; thousands separators are dropped before safe_float."""
+    if isinstance(x, (int, float)):
+        return safe_float(x)
+    return safe_float(_s(x).replace(",", "").replace("₹", ""), default=0.0)
+
+
+def normalize_row(raw: Dict[str, Any]) -> Dict[str, Any]:
+    row = {c: _s(raw.get(c)) for c in CSV_COLUMNS}
+    row["categories"] = to_list(raw.get("categories"))
+    row["images"] = to_list(raw.get("images"))
+    row["price"] = parse_price(raw.get("price"))
+    return row
+
+
+def product_text(row: Dict[str, Any]) -> str:
+    cats = ", ".join(row.get("categories") or [])
+    parts = [
+        f"Title: {row['title']}" if row.get("title") else "",
+        f"Brand: {row['brand']}" if row.get("brand") else "",
+        f"Category: {cats}" if cats else "",
+        f"Material: {row['material']}" if row.get("material") else "",
+        f"Color: {row['color']}" if row.get("color") else "",
+        f"Country: {row['country_of_origin']}" if row.get("country_of_origin") else "",
+        f"Price: {safe_float(row.get('price'))}" if row.get("price") else "",
+        f"Description: {row['description']}" if row.get("description") else "",
+    ]
+    return " | ".join(p for p in parts if p)
+
+
+def meta_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "uniq_id": str(row["uniq_id"]),
+        "title": row.get("title", ""),
+        "brand": row.get("brand", ""),
+        "price": safe_float(row.get("price"), default=0.0),
+        "categories": list(row.get("categories") or []),
+        "material": row.get("material", ""),
+        "color": row.get("color", ""),
+        "country_of_origin": row.get("country_of_origin", ""),
+    }
+
+
+def content_hash(*parts: Any) -> str:
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
@@ -0,0 +1,320 @@
+# app/services/dedup.py
+"""
+Near-duplicate listings: the same item under several uniq_ids (re-listings,
+colour variants), clustered at ingest time so results can show one of them.
+
+Two products are duplicates when either signal matches:
+
+- images: 64-bit DCT perceptual hashes (``phash``) within
+  ``DEDUP_PHASH_MAX_DISTANCE`` bits for any pair of their images. Candidates
+  come from cutting the hash into ``distance + 1`` bands: a pair within the
+  distance agrees exactly on at least one band, so the lookup misses nothing.
+- text: random-hyperplane LSH over the text embeddings
+  (``DEDUP_LSH_BANDS`` x ``DEDUP_LSH_BITS`` sign bits); products sharing a
+  band are verified at cosine >= ``DEDUP_TEXT_THRESHOLD``.
+
+Matches are merged with union-find, and only clusters of two or more are
+written to ``DEDUP_DIR/clusters.json``, so the id -> cluster map is as small
+as the duplicates. Per-image hashes are kept in ``DEDUP_DIR/phash.json`` so
+re-runs only hash new images. ``collapse`` keeps the best-ranked hit of each
+cluster in one pass over a result list.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MAX_BUCKET = 5000     # LSH buckets above this are too generic to verify pairwise
+_PLACEHOLDER = 20      # an image hash shared by more products is a stock/placeholder image
+
+
+# ------------------------------ signatures -----------------------------------
+def _dct_matrix(n: int = 32) -> np.ndarray:
+    k = np.arange(n)
+    return np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)).astype(np.float32)
+
+
+_DCT = _dct_matrix()
+
+
+def phash(img: Image.Image) -> int:
+    """64-bit perceptual hash: signs of the 8x8 lowest DCT frequencies of a 32x32 grey thumbnail vs. their median."""
+    g = np.asarray(img.convert("L").resize((32, 32), Image.BILINEAR), np.float32)
+    low = (_DCT @ g @ _DCT.T)[:8, :8].ravel()
+    bits = low > np.median(low)
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+_M1, _M2, _M4, _H01 = (np.uint64(m) for m in (0x5555555555555555, 0x3333333333333333,
+                                                0x0F0F0F0F0F0F0F0F, 0x0101010101010101))
+
+
+def _hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise bit distances between two uint64 hash arrays, (len(a), len(b)) (SWAR popcount)."""
+    x = a[:, None] ^ b[None, :]
+    x -= (x >> np.uint64(1)) & _M1
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return (x * _H01) >> np.uint64(56)
+
+
+class PHashes:
+    """uniq_id -> image hashes, rewritten atomically on flush."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.hashes: Dict[str, List[int]] = {}
+        self._dirty = False
+        if self.path.exists():
+            try:
+                self.hashes = json.loads(self.path.read_text())
+            except ValueError as e:
+                logger.warning(f"ignoring unreadable image hashes {self.path}: {e}")
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self.hashes
+
+    def set(self, uid: str, images: Iterable[Image.Image]):
+        self.hashes[uid] = [phash(im) for im in images]
+        self._dirty = True
+
+    def flush(self):
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.hashes))
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+
+# ------------------------------- clustering ----------------------------------
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int) -> bool:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return False
+        self.parent[max(ra, rb)] = min(ra, rb)
+        return True
+
+
+def _image_pairs(ids: Sequence[str], hashes: Dict[str, List[int]], max_distance: int, uf: _UnionFind) -> int:
+    rows = {uid: i for i, uid in enumerate(ids)}
+    owners: Dict[int, set] = defaultdict(set)
+    for uid, hs in hashes.items():
+        if uid in rows:
+            for h in hs:
+                owners[h].add(rows[uid])
+    uniq = [h for h, rs in owners.items() if len(rs) <= _PLACEHOLDER]
+    merged = 0
+    if not uniq:
+        return merged
+    arr = np.array(uniq, np.uint64)
+    n_bands = max_distance + 1
+    width = 64 // n_bands
+    for b in range(n_bands):
+        keys = (arr >> np.uint64(b * width)) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind="stable")
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for members in np.split(order, bounds):
+            if len(members) < 2 or len(members) > _MAX_BUCKET:
+                continue
+            for start in range(0, len(members), 256):
+                dist = _hamming(arr[members[start:start + 256]], arr[members[start:]])
+                for i, j in zip(*np.nonzero(dist <= max_distance)):
+                    if i < j:
+                        a, c = uniq[members[start + i]], uniq[members[start + j]]
+                        ra, *rest = owners[a] | owners[c]
+                        merged += sum(uf.union(ra, r) for r in rest)
+    # the same hash on several products is one bucket entry: merge those directly
+    for rs in owners.values():
+        if 1 < len(rs) <= _PLACEHOLDER:
+            ra, *rest = rs
+            merged += sum(uf.union(ra, r) for r in rest)
+    return merged
+
+
+def _text_pairs(vectors: np.ndarray, bands: int, bits: int, threshold: float, uf: _UnionFind,
+                seed: int = 0) -> int:
+    vecs = np.asarray(vectors, np.float32)
+    vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+    planes = np.random.default_rng(seed).standard_normal((vecs.shape[1], bands * bits)).astype(np.float32)
+    merged, skipped = 0, 0
+    for b in range(bands):
+        signs = (vecs @ planes[:, b * bits:(b + 1) * bits]) > 0
+        keys = signs.astype(np.int64) @ (1 << np.arange(bits, dtype=np.int64))
+        order = np.argsort(keys, kind="stable")
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for members in np.split(order, bounds):
+            if len(members) < 2:
+                continue
+            if len(members) > _MAX_BUCKET:
+                skipped += 1
+                continue
+            for start in range(0, len(members), 256):
+                sims = vecs[members[start:start + 256]] @ vecs[members].T
+                for i, j in zip(*np.nonzero(sims >= threshold)):
+                    if start + i < j:
+                        merged += uf.union(int(members[start + i]), int(members[j]))
+    if skipped:
+        logger.info(f"dedup: skipped {skipped} oversized text buckets")
+    return merged
+
+
+def cluster(ids: Sequence[str], vectors: Optional[np.ndarray], hashes: Dict[str, List[int]]) -> List[List[str]]:
+    """Duplicate clusters (two or more ids each, in ``ids`` order) from text vectors and image hashes."""
+    uf = _UnionFind(len(ids))
+    by_image = _image_pairs(ids, hashes, settings.DEDUP_PHASH_MAX_DISTANCE, uf)
+    by_text = 0
+    if vectors is not None and len(vectors):
+        by_text = _text_pairs(vectors, settings.DEDUP_LSH_BANDS, settings.DEDUP_LSH_BITS,
+                              settings.DEDUP_TEXT_THRESHOLD, uf)
+    groups: Dict[int, List[str]] = defaultdict(list)
+    for i, uid in enumerate(ids):
+        groups[uf.find(i)].append(uid)
+    clusters = [g for g in groups.values() if len(g) > 1]
+    logger.info(f"dedup: {len(clusters)} clusters over {sum(map(len, clusters))} of {len(ids)} products "
+                f"({by_image} image merges, {by_text} text merges)")
+    return clusters
+
+
+# ------------------------------- lookups -------------------------------------
+class DuplicateMap:
+    def __init__(self, clusters: List[List[str]], built_at: float = 0.0):
+        self.clusters = clusters
+        self.built_at = built_at
+        self.cluster_of: Dict[str, int] = {uid: c for c, ids in enumerate(clusters) for uid in ids}
+
+    def __len__(self) -> int:
+        return len(self.clusters)
+
+    def collapse(self, hits: List[Dict[str, Any]], top_k: int, exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        First (best-ranked) hit per cluster, up to ``top_k``; later members are
+        listed under the kept hit's ``duplicates``. ``exclude`` drops the query
+        product's own cluster (/similar).
+        """
+        skip = self.cluster_of.get(exclude) if exclude is not None else None
+        kept: Dict[Any, Dict[str, Any]] = {}
+        for h in hits:
+            c = self.cluster_of.get(h["id"])
+            if c is None:
+                if len(kept) < top_k:
+                    kept[h["id"]] = h
+            elif c != skip:
+                first = kept.get(c)
+                if first is not None:
+                    first.setdefault("duplicates", []).append(h["id"])
+                elif len(kept) < top_k:
+                    kept[c] = h
+        return list(kept.values())
+
+    def save(self, path: str | Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"built_at": self.built_at, "clusters": self.clusters}))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "DuplicateMap":
+        data = json.loads(Path(path).read_text())
+        return cls(data.get("clusters", []), data.get("built_at", 0.0))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"clusters": len(self.clusters), "products": len(self.cluster_of),
+                "largest": max(map(len, self.clusters), default=0), "built_at": self.built_at}
+
+
+_map: Optional[DuplicateMap] = None
+_map_mtime = 0.0
+_lock = threading.Lock()
+
+
+def _clusters_path() -> Path:
+    return Path(settings.DEDUP_DIR) / "clusters.json"
+
+
+def _mtime() -> float:
+    try:
+        return _clusters_path().stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def get_duplicates() -> DuplicateMap:
+    """Loaded on first use and again whenever ingest writes a newer map; empty until one is built."""
+    global _map, _map_mtime
+    if _map is None or _mtime() > _map_mtime:
+        with _lock:
+            mtime = _mtime()
+            if _map is None or mtime > _map_mtime:
+                try:
+                    _map = DuplicateMap.load(_clusters_path()) if mtime else DuplicateMap([])
+                except (OSError, ValueError) as e:
+                    logger.warning(f"duplicate map unreadable: {e}")
+                    _map = _map or DuplicateMap([])
+                _map_mtime = mtime
+    return _map
+
+
+def collapse(hits: List[Dict[str, Any]], top_k: int, exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+    return get_duplicates().collapse(hits, top_k, exclude)
+
+
+def wants_collapse(flag: Optional[bool]) -> bool:
+    return settings.DEDUP_COLLAPSE_DEFAULT if flag is None else flag
+
+
+def overfetch(top_k: int) -> int:
+    """Hits to retrieve so ``top_k`` remain after collapsing."""
+    return top_k * max(1, settings.DEDUP_OVERFETCH)
+
+
+def rebuild(hashes: Optional[PHashes] = None) -> DuplicateMap:
+    """Re-cluster the catalog (text vectors from the embedding store or the index) and write the map."""
+    from .embstore import get_store
+    from .vectorstore import export_vectors, text_index
+    t0 = time.perf_counter()
+    hashes = hashes or PHashes(Path(settings.DEDUP_DIR) / "phash.json")
+    store = get_store("text")
+    if store is not None:
+        ids, vecs = list(store.ids), store.vectors
+    else:
+        ids, vecs, _ = export_vectors(text_index, namespace="default")
+    vecs = np.asarray(vecs, np.float32) if len(ids) else None
+    # products with images but no text vector still cluster by image (zero vectors match nothing)
+    known = set(ids)
+    ids = list(ids) + [uid for uid in hashes.hashes if uid not in known]
+    if vecs is not None and len(vecs) < len(ids):
+        vecs = np.concatenate([vecs, np.zeros((len(ids) - len(vecs), vecs.shape[1]), np.float32)])
+    dmap = DuplicateMap(cluster(ids, vecs, hashes.hashes), built_at=time.time())
+    dmap.save(_clusters_path())
+    logger.info(f"dedup: map written in {time.perf_counter() - t0:.1f}s -> {_clusters_path()}")
+    return dmap
+
+
+def dedup_stats() -> Dict[str, Any]:
+    return get_duplicates().stats()
@@ -1,9 +1,14 @@
+import asyncio
 import logging
 from PIL import Image
 import numpy as np
 import torch
-from sentence_transformers import SentenceTransformer
 from ..core.config import settings
+from ..core.metrics import timed
+from .batching import MicroBatcher
+from .loader import lazy_model
+from .modelserver import model_client, remote, remote_reranker
+from .inference import load_cross_encoder, load_sentence_model
 
 logger = logging.getLogger(__name__)
 
@@ -13,19 +18,78 @@ def _pick_device() -> str:
     return "cuda" if torch.cuda.is_available() else "cpu"
 
 _DEVICE = _pick_device()
-logger.info(f"Loading ST models on device: {_DEVICE}")
 
-_text_model = SentenceTransformer(settings.TEXT_MODEL, device=_DEVICE)
-_img_model = SentenceTransformer(settings.IMAGE_MODEL, device=_DEVICE)
+def _load_st(name: str, allow_onnx: bool = True):
+    logger.info(f"Loading ST model {name} on device: {_DEVICE} ({settings.INFERENCE_BACKEND})")
+    return load_sentence_model(name, _DEVICE, allow_onnx=allow_onnx)
+
+# Loaded on first use (or by the warm-up task), never at import
+_text_model = lazy_model("text_encoder", lambda: _load_st(settings.TEXT_MODEL))
+_img_model = lazy_model("image_encoder", lambda: _load_st(settings.IMAGE_MODEL, allow_onnx=False))
+
+def get_text_model():
+    return _text_model.get()
+
+def get_image_model():
+    return _img_model.get()
+
+def encode_texts(texts: list[str]) -> np.ndarray:
+    with timed("embed_text"):
+        if remote():
+            return model_client().call("encode_text", list(texts))
+        return get_text_model().encode(texts, batch_size=max(1, len(texts)), normalize_embeddings=True, convert_to_numpy=True)
+
+def encode_images(images: list[Image.Image]) -> np.ndarray:
+    with timed("embed_image"):
+        if remote():
+            return model_client().call("encode_image", list(images))
+        return get_image_model().encode(images, batch_size=max(1, len(images)), normalize_embeddings=True, convert_to_numpy=True)
+
+def encode_clip_texts(texts: list[str]) -> np.ndarray:
+    """CLIP text tower: prompts in the image index's embedding space."""
+    with timed("embed_clip_text"):
+        if remote():
+            return model_client().call("encode_clip_text", list(texts))
+        return get_image_model().encode(texts, batch_size=max(1, len(texts)), normalize_embeddings=True, convert_to_numpy=True)
+
+# Concurrent single-item calls are coalesced into one forward pass per window
+_text_batcher = _img_batcher = _clip_text_batcher = None
+if settings.EMBED_BATCHING:
+    _text_batcher = MicroBatcher(encode_texts, settings.EMBED_BATCH_MAX_SIZE, settings.EMBED_BATCH_MAX_WAIT_MS, name="text")
+    _img_batcher = MicroBatcher(encode_images, settings.EMBED_BATCH_MAX_SIZE, settings.EMBED_BATCH_MAX_WAIT_MS, name="image")
+    _clip_text_batcher = MicroBatcher(encode_clip_texts, settings.EMBED_BATCH_MAX_SIZE, settings.EMBED_BATCH_MAX_WAIT_MS, name="clip_text")
 
 def encode_text(text: str) -> list[float]:
-    vec = _text_model.encode([text], normalize_embeddings=True, convert_to_numpy=True)[0]
+    vec = _text_batcher(text) if _text_batcher else encode_texts([text])[0]
     return vec.tolist()
 
 def encode_image(pil_image: Image.Image) -> list[float]:
-    vec = _img_model.encode([pil_image], normalize_embeddings=True, convert_to_numpy=True)[0]
+    vec = _img_batcher(pil_image) if _img_batcher else encode_images([pil_image])[0]
     return vec.tolist()
 
+def encode_clip_text(text: str) -> list[float]:
+    vec = _clip_text_batcher(text) if _clip_text_batcher else encode_clip_texts([text])[0]
+    return vec.tolist()
+
+# Without batching the forward pass runs in a worker thread, never on the event loop
+async def encode_text_async(text: str) -> list[float]:
+    if _text_batcher is None:
+        return await asyncio.to_thread(encode_text, text)
+    return (await _text_batcher.submit_async(text)).tolist()
+
+async def encode_image_async(pil_image: Image.Image) -> list[float]:
+    if _img_batcher is None:
+        return await asyncio.to_thread(encode_image, pil_image)
+    return (await _img_batcher.submit_async(pil_image)).tolist()
+
+async def encode_clip_text_async(text: str) -> list[float]:
+    if _clip_text_batcher is None:
+        return await asyncio.to_thread(encode_clip_text, text)
+    return (await _clip_text_batcher.submit_async(text)).tolist()
+
+def batching_stats() -> dict:
+    return {b.name: b.stats() for b in (_text_batcher, _img_batcher, _clip_text_batcher) if b is not None}
+
 _reranker = None
 def get_reranker():
     global _reranker
@@ -33,9 +97,10 @@ def get_reranker():
         return _reranker
     if not settings.USE_RERANKER:
         return None
+    if remote():
+        return remote_reranker
     try:
-        from sentence_transformers import CrossEncoder
-        _reranker = CrossEncoder(settings.RERANKER_MODEL, device=_DEVICE)
+        _reranker = load_cross_encoder(settings.RERANKER_MODEL, _DEVICE)
         return _reranker
     except Exception as e:
         logger.warning(f"Reranker not available: {e}")
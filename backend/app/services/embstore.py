@@ -0,0 +1,187 @@
+# app/services/embstore.py
+"""
+Versioned on-disk catalog embeddings, one store per modality under
+``EMBEDDING_DIR``:
+
+  <modality>/CURRENT          name of the active version directory
+  <modality>/v000003/
+    vectors.npy               (n, dim) float16|float32, L2-normalized   (memory-mapped)
+    ids.json                  row -> uniq_id
+    header.json               {"format", "version", "model", "dim", "dtype", "n", ...}
+
+Readers ``np.load(..., mmap_mode="r")`` the matrix, so lookups are zero-copy
+and every worker process shares the same page-cache pages instead of holding
+its own copy. Writers build a new version directory and swap ``CURRENT``
+atomically; the previous ``EMBEDDING_KEEP_VERSIONS`` stay on disk for
+processes that still have them open.
+
+Written by ``jobs/ingest`` (as it encodes) and ``jobs/build_embeddings``
+(backfill from the vector indexes).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 1
+_DTYPES = ("float16", "float32")
+
+
+def model_for(modality: str) -> str:
+    return settings.TEXT_MODEL if modality == "text" else settings.IMAGE_MODEL
+
+
+class EmbeddingStore:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.header = json.loads((self.path / "header.json").read_text())
+        if self.header.get("format") != FORMAT:
+            raise ValueError(f"unsupported embedding store format {self.header.get('format')!r}")
+        self.ids: List[str] = json.loads((self.path / "ids.json").read_text())
+        self.rows: Dict[str, int] = {uid: i for i, uid in enumerate(self.ids)}
+        self.vectors: np.ndarray = np.load(self.path / "vectors.npy", mmap_mode="r")
+        if self.vectors.shape != (self.header["n"], self.header["dim"]) or len(self.ids) != self.header["n"]:
+            raise ValueError(f"embedding store at {self.path} is inconsistent with its header")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self.rows
+
+    @property
+    def model(self) -> str:
+        return self.header["model"]
+
+    @property
+    def dim(self) -> int:
+        return int(self.header["dim"])
+
+    @property
+    def version(self) -> int:
+        return int(self.header["version"])
+
+    def vector(self, uid: str) -> Optional[np.ndarray]:
+        row = self.rows.get(uid)
+        return None if row is None else np.asarray(self.vectors[row], dtype=np.float32)
+
+    def get_many(self, ids: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """(found ids, float32 rows) in request order; unknown ids are dropped."""
+        found = [i for i in ids if i in self.rows]
+        rows = np.fromiter((self.rows[i] for i in found), dtype=np.int64, count=len(found))
+        return found, np.asarray(self.vectors[rows], dtype=np.float32)
+
+
+# ------------------------------ writing --------------------------------------
+def _current(root: Path) -> Optional[Path]:
+    try:
+        name = (root / "CURRENT").read_text().strip()
+    except FileNotFoundError:
+        return None
+    return root / name if name and (root / name).is_dir() else None
+
+
+def write_store(root: str | Path, ids: Sequence[str], vectors: np.ndarray, model: str,
+                dtype: str = "", **info) -> Path:
+    """Write a new version of the store at ``root`` and make it current."""
+    root = Path(root)
+    dtype = dtype or settings.EMBEDDING_DTYPE
+    if dtype not in _DTYPES:
+        raise ValueError(f"EMBEDDING_DTYPE must be one of {', '.join(_DTYPES)}")
+    vecs = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+    vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+
+    cur = _current(root)
+    version = (json.loads((cur / "header.json").read_text())["version"] + 1) if cur is not None else 1
+    final = root / f"v{version:06d}"
+    tmp = root / f".v{version:06d}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    np.save(tmp / "vectors.npy", vecs.astype(dtype))
+    (tmp / "ids.json").write_text(json.dumps(list(ids)))
+    header = {"format": FORMAT, "version": version, "model": model, "dim": int(vecs.shape[1]),
+              "dtype": dtype, "n": len(ids), "normalized": True, "built_at": time.time(), **info}
+    (tmp / "header.json").write_text(json.dumps(header))
+    os.replace(tmp, final)
+
+    pointer = root / "CURRENT.tmp"
+    pointer.write_text(final.name)
+    os.replace(pointer, root / "CURRENT")
+    _prune(root, keep=max(1, settings.EMBEDDING_KEEP_VERSIONS))
+    logger.info(f"Embedding store {root}: v{version} with {len(ids)} x {header['dim']} {dtype} ({model})")
+    return final
+
+
+def update_store(root: str | Path, ids: Sequence[str], vectors: np.ndarray, model: str,
+                 delete: Sequence[str] = (), **info) -> Path:
+    """New version = current rows (minus ``delete``) overridden/extended by ``ids``/``vectors``."""
+    root = Path(root)
+    cur = _current(root)
+    new = dict(zip(ids, range(len(ids))))
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+    if cur is None:
+        return write_store(root, list(new), vectors[list(new.values())], model, **info)
+
+    old = EmbeddingStore(cur)
+    if old.model != model or (len(ids) and old.dim != vectors.shape[1]):
+        logger.warning(f"{root}: model changed ({old.model} -> {model}); previous rows dropped")
+        return write_store(root, list(new), vectors[list(new.values())], model, **info)
+    drop = set(delete) | set(new)
+    keep = [i for i in range(len(old)) if old.ids[i] not in drop]
+    out_ids = [old.ids[i] for i in keep] + list(new)
+    out = np.empty((len(out_ids), old.dim), np.float32)
+    out[: len(keep)] = old.vectors[keep]
+    out[len(keep):] = vectors[list(new.values())]
+    return write_store(root, out_ids, out, model, **info)
+
+
+def _prune(root: Path, keep: int):
+    versions = sorted(p for p in root.glob("v[0-9]*") if p.is_dir())
+    for old in versions[:-keep]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+# ------------------------------ serving --------------------------------------
+_stores: Dict[str, Optional[EmbeddingStore]] = {}
+_lock = threading.Lock()
+
+
+def get_store(modality: str) -> Optional[EmbeddingStore]:
+    """The current store for a modality, opened lazily; None if missing or built by another model."""
+    if modality not in _stores:
+        with _lock:
+            if modality not in _stores:
+                root = Path(settings.EMBEDDING_DIR) / modality
+                store, cur = None, _current(root)
+                if cur is not None:
+                    try:
+                        store = EmbeddingStore(cur)
+                        if store.model != model_for(modality):
+                            logger.warning(f"{modality} embedding store was built with {store.model}, "
+                                           f"not {model_for(modality)}; ignoring it")
+                            store = None
+                        else:
+                            logger.info(f"Opened {modality} embedding store v{store.version}: "
+                                        f"{len(store)} x {store.dim} {store.header['dtype']}")
+                    except Exception as e:
+                        logger.warning(f"Embedding store at {cur} unreadable: {e}")
+                        store = None
+                _stores[modality] = store
+    return _stores[modality]
+
+
+def reload_stores():
+    with _lock:
+        _stores.clear()
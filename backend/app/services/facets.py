@@ -0,0 +1,395 @@
+# app/services/facets.py
+"""
+Structured pre-filtering over catalog facets.
+
+- categorical fields (brand, material, color, categories, country_of_origin):
+  one packed bitmap (``np.uint8``, 1 bit per row) per distinct value
+- price: per-row float array (``safe_float``) plus a lazily re-sorted order,
+  so range ops are two ``searchsorted`` calls
+- ``validate_filter`` checks a filter is well formed ($eq/$ne/$in/$nin/$gt/
+  $gte/$lt/$lte/$exists, $and/$or) before anything reaches an index; with
+  ``facets_only`` it also checks the bitmaps can evaluate it
+
+``FacetIndex.mask`` turns a validated filter into a row mask that
+``LocalIndex`` applies before scoring, and ``counts`` backs ``/api/facets``.
+Semantics match ``localindex.match_filter``: list fields match if any element
+does, and negative ops also match rows where the field is missing.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .utils import safe_float
+
+logger = logging.getLogger(__name__)
+
+CATEGORICAL = ("brand", "material", "color", "categories", "country_of_origin")
+NUMERIC = ("price",)
+_VALUE_OPS = ("$eq", "$ne", "$in", "$nin")
+_RANGE_OPS = ("$gt", "$gte", "$lt", "$lte")
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+
+
+class FilterError(ValueError):
+    """Filter outside the supported grammar (surfaced as HTTP 422)."""
+
+
+# ----------------------------- GRAMMAR ---------------------------------------
+def _scalar(v: Any) -> bool:
+    return isinstance(v, (str, int, float, bool)) and not (isinstance(v, float) and math.isnan(v))
+
+
+def validate_filter(flt: Any, facets_only: bool = False) -> Dict[str, Any]:
+    """
+    Normalized copy of a metadata filter (bare values become {"$eq": v});
+    FilterError if it's malformed (bad types, unknown operators). Any field
+    and ``$exists`` are accepted, as Pinecone and ``match_filter`` evaluate
+    them; ``facets_only`` also rejects what the bitmap index can't evaluate
+    (fields outside CATEGORICAL / NUMERIC, ``$exists``, ranges on text).
+    """
+    if flt is None:
+        return {}
+    if not isinstance(flt, dict):
+        raise FilterError("filter must be a JSON object")
+    out: Dict[str, Any] = {}
+    for key, cond in flt.items():
+        if key in ("$and", "$or"):
+            if not isinstance(cond, list) or not cond:
+                raise FilterError(f"{key} expects a non-empty list of filters")
+            out[key] = [validate_filter(c, facets_only) for c in cond]
+            continue
+        if key.startswith("$"):
+            raise FilterError(f"unsupported filter operator: {key}")
+        facet = key in CATEGORICAL or key in NUMERIC
+        if facets_only and not facet:
+            raise FilterError(f"unsupported filter field: {key!r} "
+                              f"(allowed: {', '.join(CATEGORICAL + NUMERIC)})")
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        if not cond:
+            raise FilterError(f"empty condition for {key!r}")
+        norm: Dict[str, Any] = {}
+        for op, arg in cond.items():
+            if op in ("$in", "$nin"):
+                if not isinstance(arg, list) or not all(_scalar(a) for a in arg):
+                    raise FilterError(f"{key}.{op} expects a list of values")
+            elif op in ("$eq", "$ne"):
+                if not _scalar(arg):
+                    raise FilterError(f"{key}.{op} expects a string, number or boolean")
+            elif op in _RANGE_OPS:
+                if facets_only and key not in NUMERIC:
+                    raise FilterError(f"{op} is only supported on {', '.join(NUMERIC)}")
+                if isinstance(arg, bool) or not isinstance(arg, (int, float)):
+                    raise FilterError(f"{key}.{op} expects a number")
+            elif op == "$exists":
+                if facets_only:
+                    raise FilterError("$exists is not supported by the facet index")
+                if not isinstance(arg, bool):
+                    raise FilterError(f"{key}.$exists expects true or false")
+            else:
+                raise FilterError(f"unsupported filter operator: {op}")
+            if key in NUMERIC and op in _VALUE_OPS:
+                vals = arg if isinstance(arg, list) else [arg]
+                if any(isinstance(v, (bool, str)) for v in vals):
+                    raise FilterError(f"{key}.{op} expects numbers")
+            norm[op] = arg
+        out[key] = norm
+    return out
+
+
+# ------------------------------ INDEX ----------------------------------------
+def _values(v: Any) -> Tuple[Any, ...]:
+    if v is None:
+        return ()
+    if isinstance(v, (list, tuple, set)):
+        return tuple(x for x in v if _scalar(x))
+    return (v,) if _scalar(v) else ()
+
+
+class FacetIndex:
+    """Row-addressed facet bitmaps; rows are whatever the owner (e.g. a namespace) uses."""
+
+    def __init__(self, capacity: int = 0):
+        self.size = 0
+        self._cap = 0
+        self.bitmaps: Dict[str, Dict[Any, np.ndarray]] = {f: {} for f in CATEGORICAL}
+        self.prices = np.zeros(0, np.float64)
+        self._row_values: List[Optional[Dict[str, Tuple[Any, ...]]]] = []
+        self._order: Optional[np.ndarray] = None
+        self._sorted: Optional[np.ndarray] = None
+        self._lock = threading.RLock()
+        self._grow(capacity)
+
+    @classmethod
+    def build(cls, metas: Sequence[Optional[Dict[str, Any]]]) -> "FacetIndex":
+        fi = cls(len(metas))
+        for row, meta in enumerate(metas):
+            fi.set(row, meta)
+        return fi
+
+    def _grow(self, n: int):
+        if n <= self._cap:
+            return
+        cap = max(n, 2 * self._cap, 64)
+        nbytes = (cap + 7) // 8
+        for values in self.bitmaps.values():
+            for v, bm in values.items():
+                grown = np.zeros(nbytes, np.uint8)
+                grown[: len(bm)] = bm
+                values[v] = grown
+        prices = np.full(cap, np.nan)
+        prices[: len(self.prices)] = self.prices
+        self.prices = prices
+        self._cap = cap
+
+    # ---- write path (rows are updated in place) ----
+    def set(self, row: int, meta: Optional[Dict[str, Any]]):
+        """(Re)index one row; meta=None clears it (deleted row)."""
+        with self._lock:
+            self._grow(row + 1)
+            self.size = max(self.size, row + 1)
+            while len(self._row_values) < self.size:
+                self._row_values.append(None)
+            byte, bit = row >> 3, np.uint8(0x80 >> (row & 7))
+            old = self._row_values[row] or {}
+            for field, vals in old.items():
+                for v in vals:
+                    self.bitmaps[field][v][byte] &= ~bit
+            if meta is None:
+                self._row_values[row] = None
+                self.prices[row] = np.nan
+            else:
+                new = {}
+                for field in CATEGORICAL:
+                    vals = _values(meta.get(field))
+                    for v in vals:
+                        bm = self.bitmaps[field].get(v)
+                        if bm is None:
+                            bm = self.bitmaps[field][v] = np.zeros((self._cap + 7) // 8, np.uint8)
+                        bm[byte] |= bit
+                    if vals:
+                        new[field] = vals
+                self._row_values[row] = new
+                p = meta.get("price")
+                self.prices[row] = safe_float(p, default=math.nan) if p not in (None, "") else math.nan
+            self._order = None
+
+    # ---- evaluation ----
+    def _price_sorted(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._order is None:
+            prices = self.prices[: self.size]
+            have = np.flatnonzero(~np.isnan(prices))
+            order = have[np.argsort(prices[have], kind="stable")]
+            self._order, self._sorted = order, prices[order]
+        return self._order, self._sorted
+
+    def _empty(self) -> np.ndarray:
+        return np.zeros((self.size + 7) // 8, np.uint8)
+
+    def _full(self) -> np.ndarray:
+        return np.packbits(np.ones(self.size, bool))
+
+    def _from_rows(self, rows: np.ndarray) -> np.ndarray:
+        m = np.zeros(self.size, bool)
+        m[rows] = True
+        return np.packbits(m)
+
+    def _bitmap(self, field: str, value: Any) -> np.ndarray:
+        bm = self.bitmaps[field].get(value)
+        return self._empty() if bm is None else bm[: (self.size + 7) // 8]
+
+    def _price_range(self, lo: float, lo_incl: bool, hi: float, hi_incl: bool) -> np.ndarray:
+        order, srt = self._price_sorted()
+        a = np.searchsorted(srt, lo, "left" if lo_incl else "right")
+        b = np.searchsorted(srt, hi, "right" if hi_incl else "left")
+        return self._from_rows(order[a:b]) if b > a else self._empty()
+
+    def _cond(self, field: str, op: str, arg: Any) -> np.ndarray:
+        if field in NUMERIC:
+            if op in ("$eq", "$in", "$ne", "$nin"):
+                acc = self._empty()
+                for v in (arg if isinstance(arg, list) else [arg]):
+                    acc |= self._price_range(float(v), True, float(v), True)
+                return acc if op in ("$eq", "$in") else ~acc
+            inf = math.inf
+            if op == "$gt": return self._price_range(float(arg), False, inf, True)
+            if op == "$gte": return self._price_range(float(arg), True, inf, True)
+            if op == "$lt": return self._price_range(-inf, True, float(arg), False)
+            return self._price_range(-inf, True, float(arg), True)
+        acc = self._empty()
+        for v in (arg if isinstance(arg, list) else [arg]):
+            acc |= self._bitmap(field, v)
+        return acc if op in ("$eq", "$in") else ~acc
+
+    def _eval(self, flt: Dict[str, Any]) -> np.ndarray:
+        acc = self._full()
+        for key, cond in flt.items():
+            if key == "$and":
+                for c in cond:
+                    acc &= self._eval(c)
+            elif key == "$or":
+                any_ = self._empty()
+                for c in cond:
+                    any_ |= self._eval(c)
+                acc &= any_
+            else:
+                for op, arg in cond.items():
+                    acc &= self._cond(key, op, arg)
+        return acc
+
+    def mask(self, flt: Dict[str, Any], size: Optional[int] = None) -> np.ndarray:
+        """Boolean row mask for a validated filter (length ``size``, default all rows)."""
+        with self._lock:
+            packed = self._eval(flt)
+            n = self.size
+        m = np.unpackbits(packed, count=n).view(bool)
+        if size is not None and size != n:
+            out = np.zeros(size, bool)
+            out[: min(size, n)] = m[:size]
+            return out
+        return m
+
+    def counts(self, fields: Iterable[str], flt: Optional[Dict[str, Any]] = None,
+               alive: Optional[np.ndarray] = None, limit: int = 50) -> Dict[str, Any]:
+        """Per-value hit counts under a filter; price gets min/max over the matching rows."""
+        with self._lock:
+            base = self._eval(flt) if flt else self._full()
+            if alive is not None:
+                base &= np.packbits(alive[: self.size])
+            total = int(_POPCOUNT[base].sum())
+            out: Dict[str, Any] = {"total": total}
+            for field in fields:
+                if field in CATEGORICAL:
+                    nb = len(base)
+                    cs = [(v, int(_POPCOUNT[bm[:nb] & base].sum()))
+                          for v, bm in self.bitmaps[field].items() if v != ""]
+                    cs = sorted((c for c in cs if c[1]), key=lambda c: (-c[1], str(c[0])))[:limit]
+                    out[field] = [{"value": v, "count": c} for v, c in cs]
+                elif field in NUMERIC:
+                    rows = np.flatnonzero(np.unpackbits(base, count=self.size))
+                    vals = self.prices[rows]
+                    vals = vals[~np.isnan(vals)]
+                    out[field] = ({"min": float(vals.min()), "max": float(vals.max()), "count": int(len(vals))}
+                                  if len(vals) else {"min": None, "max": None, "count": 0})
+                else:
+                    raise FilterError(f"unknown facet field: {field!r}")
+            return out
+
+
+def supports(flt: Optional[Dict[str, Any]]) -> bool:
+    """True when every clause is facet-indexable (so the bitmap path is exact)."""
+    try:
+        validate_filter(flt, facets_only=True)
+        return True
+    except FilterError:
+        return False
+
+
+# --------------------------- catalog facets ----------------------------------
+class CatalogFacets:
+    """Facets over the whole catalog, with the uid -> row map and metastore watermark they were built to."""
+
+    def __init__(self, ids: Sequence[str], index: FacetIndex, from_store: bool):
+        self.rows: Dict[str, int] = {uid: i for i, uid in enumerate(ids)}
+        self.index, self.from_store = index, from_store
+        self.size = len(ids)
+        self._alive = np.ones(max(self.size, 64), bool)
+        self.watermark = 0.0
+        self.checked = time.monotonic()
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._alive[: self.size]
+
+    def _row(self, uid: str) -> int:
+        row = self.rows.get(uid)
+        if row is None:
+            row = self.rows[uid] = self.size  # deleted rows are never reused
+            self.size += 1
+            if self.size > len(self._alive):
+                self._alive = np.concatenate([self._alive, np.ones(len(self._alive), bool)])
+        return row
+
+    def catch_up(self, metastore):
+        """Fold in metastore writes (ingest runs, patches from other workers) since the last refresh."""
+        for uid, meta, updated_at in metastore.changed_since(self.watermark):
+            with self.index._lock:  # counts() must see alive and the index at the same size
+                self.index.set(self._row(uid), meta)
+            self.watermark = max(self.watermark, updated_at)
+        if metastore.count() < len(self.rows):
+            ids = set(metastore.ids())
+            for uid in [u for u in self.rows if u not in ids]:
+                row = self.rows.pop(uid)
+                self._alive[row] = False
+                self.index.set(row, None)
+
+    def counts(self, fields: Iterable[str], flt: Optional[Dict[str, Any]] = None, limit: int = 50):
+        with self.index._lock:
+            return self.index.counts(fields, flt, alive=self.alive, limit=limit)
+
+
+_catalog: Optional[CatalogFacets] = None
+_catalog_lock = threading.Lock()
+
+
+def _build_catalog(metastore) -> CatalogFacets:
+    t0 = time.perf_counter()
+    if metastore.ready():
+        catalog = CatalogFacets([], FacetIndex(metastore.count()), from_store=True)
+        catalog.catch_up(metastore)
+    else:
+        from .vectorstore import export_vectors, text_index
+        ids, _, metas = export_vectors(text_index, "default")
+        catalog = CatalogFacets(ids, FacetIndex.build(list(metas)), from_store=False)
+    logger.info(f"Catalog facets built over {len(catalog.rows)} products in {time.perf_counter() - t0:.2f}s")
+    return catalog
+
+
+def _refresh(metastore):
+    try:
+        if not _catalog.from_store and metastore.ready():
+            reset_catalog_facets()  # the store was filled after an index-built catalog; rebuild from it
+        elif metastore.ready():
+            _catalog.catch_up(metastore)
+    except Exception:
+        logger.exception("catalog facets refresh failed")
+
+
+def catalog_facets() -> CatalogFacets:
+    """
+    Facets over the whole catalog (metadata store if populated, else text index
+    metadata). Kept in step with the metadata store by a background catch-up
+    every FACET_REFRESH_S.
+    """
+    global _catalog
+    from .metastore import metastore
+    catalog = _catalog
+    if catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = _build_catalog(metastore)
+            catalog = _catalog
+    elif time.monotonic() - catalog.checked > settings.FACET_REFRESH_S and _catalog_lock.acquire(blocking=False):
+        catalog.checked = time.monotonic()
+
+        def run():
+            try:
+                _refresh(metastore)
+            finally:
+                _catalog_lock.release()
+        threading.Thread(target=run, name="facets-refresh", daemon=True).start()
+    return catalog
+
+
+def reset_catalog_facets():
+    """Drop the catalog facets; the next call rebuilds them."""
+    global _catalog
+    _catalog = None
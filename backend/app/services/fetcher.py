@@ -0,0 +1,252 @@
+# app/services/fetcher.py
+"""
+Async image fetching for ``/search/image``: one pooled ``httpx.AsyncClient``
+(keep-alive, no per-call TLS handshake), per-host concurrency limits and a
+streamed byte cap.
+
+``EmbeddingCache`` remembers url -> content hash and content hash -> CLIP
+embedding (in memory, optionally mirrored to ``IMAGE_CACHE_DIR``), so a
+repeated URL skips both the download and the encode, and a different URL
+serving identical bytes skips the encode. url -> hash entries expire after
+``IMAGE_CACHE_TTL_S`` on disk as in memory (the image behind a URL can
+change), and each disk tier is capped at ``IMAGE_CACHE_DISK_MAX_ENTRIES``.
+The ``*_async`` methods keep the disk tier off the event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from ..core.config import settings
+from .cache import LRUCache
+from .imaging import ImageRejected
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+
+class ImageFetcher:
+    def __init__(
+        self,
+        max_connections: int = 64,
+        per_host: int = 8,
+        timeout_s: float = 15.0,
+        max_bytes: int = 10 * _MB,
+        transport=None,
+    ):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout_s = timeout_s
+        self.max_bytes = max_bytes
+        self._transport = transport
+        self._client = None
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._host_users: Dict[str, int] = {}  # in-flight + waiting requests per host
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout_s,
+                follow_redirects=True,
+                headers={"User-Agent": "Mozilla/5.0"},
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                transport=self._transport,
+            )
+        return self._client
+
+    @contextlib.asynccontextmanager
+    async def _host_slot(self, url: str):
+        """Per-host concurrency limit; a host's semaphore lives only while it has requests."""
+        host = urlsplit(url).netloc.lower()
+        sem = self._hosts.get(host)
+        if sem is None:
+            sem = self._hosts[host] = asyncio.Semaphore(self.per_host)
+        self._host_users[host] = self._host_users.get(host, 0) + 1
+        try:
+            async with sem:
+                yield
+        finally:
+            self._host_users[host] -= 1
+            if not self._host_users[host]:
+                del self._host_users[host]
+                del self._hosts[host]
+
+    async def fetch(self, url: str) -> bytes:
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise ImageRejected("image_url must be http(s)")
+        async with self._host_slot(url):
+            async with self._get_client().stream("GET", url) as resp:
+                resp.raise_for_status()
+                declared = int(resp.headers.get("content-length") or 0)
+                if declared > self.max_bytes:
+                    raise ImageRejected(f"Image is {declared} bytes; limit is {self.max_bytes}", 413)
+                chunks: List[bytes] = []
+                size = 0
+                async for chunk in resp.aiter_bytes():
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ImageRejected(f"Image exceeds {self.max_bytes} bytes", 413)
+                    chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def content_digest(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+class EmbeddingCache:
+    """url -> content hash -> embedding; memory LRU with an optional disk mirror."""
+
+    _PRUNE_EVERY = 256  # disk writes between checks of the disk tiers' size
+
+    def __init__(self, max_entries: int = 4096, ttl_s: float = 86400.0, disk_dir: Optional[str] = None,
+                 disk_max_entries: int = 50_000):
+        self.ttl_s = ttl_s
+        self.urls = LRUCache("image_urls", max_entries=max_entries, max_bytes=16 * _MB, ttl_s=ttl_s)
+        self.vectors = LRUCache("image_vectors", max_entries=max_entries, max_bytes=64 * _MB, ttl_s=0)
+        self.disk = Path(disk_dir) if disk_dir else None
+        self.disk_max_entries = disk_max_entries
+        self._writes = 0
+        self._writes_lock = threading.Lock()  # put_async writes from worker threads
+        self._pruning = threading.Lock()
+        if self.disk:
+            (self.disk / "url").mkdir(parents=True, exist_ok=True)
+            (self.disk / "emb").mkdir(parents=True, exist_ok=True)
+            self._prune()
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def digest_for(self, url: str) -> Optional[str]:
+        digest = self.urls.get(url)
+        if digest is None and self.disk:
+            digest = self._disk_digest(url)
+        return digest
+
+    def embedding_for(self, digest: str) -> Optional[List[float]]:
+        vec = self.vectors.get(digest)
+        if vec is None and self.disk:
+            vec = self._disk_embedding(digest)
+        return vec
+
+    def put(self, url: str, digest: str, vec: List[float]):
+        self.urls.set(url, digest)
+        self.vectors.set(digest, vec)
+        if self.disk:
+            if self._disk_put(url, digest, vec):
+                self._prune()
+
+    # async variants for the request path: memory hits stay on the event loop,
+    # disk reads/writes run in a worker thread and pruning in the background
+    async def digest_for_async(self, url: str) -> Optional[str]:
+        digest = self.urls.get(url)
+        if digest is None and self.disk:
+            digest = await asyncio.to_thread(self._disk_digest, url)
+        return digest
+
+    async def embedding_for_async(self, digest: str) -> Optional[List[float]]:
+        vec = self.vectors.get(digest)
+        if vec is None and self.disk:
+            vec = await asyncio.to_thread(self._disk_embedding, digest)
+        return vec
+
+    async def put_async(self, url: str, digest: str, vec: List[float]):
+        self.urls.set(url, digest)
+        self.vectors.set(digest, vec)
+        if self.disk:
+            if await asyncio.to_thread(self._disk_put, url, digest, vec):
+                asyncio.get_running_loop().run_in_executor(None, self._prune)
+
+    def _disk_digest(self, url: str) -> Optional[str]:
+        f = self.disk / "url" / self._url_key(url)
+        try:
+            parts = f.read_text().split()
+            # "<digest> <written at>"; files from before timestamps fall back to their mtime
+            written = float(parts[1]) if len(parts) > 1 else f.stat().st_mtime
+        except (OSError, ValueError, IndexError):
+            return None
+        left = self.ttl_s - (time.time() - written) if self.ttl_s > 0 else 0.0
+        if self.ttl_s > 0 and left <= 0:
+            f.unlink(missing_ok=True)
+            return None
+        digest = parts[0]
+        self.urls.set(url, digest, ttl_s=left)
+        return digest
+
+    def _disk_embedding(self, digest: str) -> Optional[List[float]]:
+        try:
+            vec = np.load(self.disk / "emb" / f"{digest}.npy").tolist()
+        except (OSError, ValueError):
+            return None
+        self.vectors.set(digest, vec)
+        return vec
+
+    def _disk_put(self, url: str, digest: str, vec: List[float]) -> bool:
+        """Write both tiers; True when the disk tiers are due for a prune."""
+        try:
+            np.save(self.disk / "emb" / f"{digest}.npy", np.asarray(vec, np.float32))
+            (self.disk / "url" / self._url_key(url)).write_text(f"{digest} {time.time():.0f}")
+        except OSError as e:
+            logger.warning(f"image cache write failed: {e}")
+        with self._writes_lock:
+            self._writes += 1
+            return self._writes % self._PRUNE_EVERY == 0
+
+    def _prune(self):
+        """Drop the oldest files of each disk tier beyond ``disk_max_entries``."""
+        if not self._pruning.acquire(blocking=False):
+            return  # a prune is already running
+        try:
+            for tier in ("url", "emb"):
+                try:
+                    with os.scandir(self.disk / tier) as it:
+                        files = [(e.stat().st_mtime, e.path) for e in it if e.is_file()]
+                except OSError as e:
+                    logger.warning(f"image cache prune failed: {e}")
+                    continue
+                if len(files) <= self.disk_max_entries:
+                    continue
+                files.sort()
+                for _, path in files[: len(files) - self.disk_max_entries]:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+        finally:
+            self._pruning.release()
+
+    def stats(self) -> Dict[str, Dict]:
+        return {"urls": self.urls.stats(), "vectors": self.vectors.stats()}
+
+
+fetcher = ImageFetcher(
+    max_connections=settings.IMAGE_FETCH_MAX_CONNECTIONS,
+    per_host=settings.IMAGE_FETCH_PER_HOST,
+    timeout_s=settings.IMAGE_FETCH_TIMEOUT_S,
+    max_bytes=settings.MAX_IMAGE_BYTES,
+)
+embedding_cache = EmbeddingCache(
+    max_entries=settings.IMAGE_CACHE_MAX_ENTRIES,
+    ttl_s=settings.IMAGE_CACHE_TTL_S,
+    disk_dir=settings.IMAGE_CACHE_DIR or None,
+    disk_max_entries=settings.IMAGE_CACHE_DISK_MAX_ENTRIES,
+)
@@ -0,0 +1,70 @@
+# app/services/fusion.py
+"""
+Merging ranked match lists from different retrievers (vector / BM25 / image).
+Fused lists carry the fused value as ``fused_score``.
+
+- ``rrf_fuse``: reciprocal-rank fusion; ignores raw scores, so lists with
+  incomparable scales (BM25, MiniLM cosine, CLIP cosine) mix safely
+- ``weighted_fuse``: weighted sum of per-list min-max normalized scores, for
+  when score gaps matter (a near-duplicate image should dominate)
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence
+
+FUSIONS = ("rrf", "score")
+
+
+def _merge(ranked: Sequence[List[Dict[str, Any]]], contrib, score_from: Optional[int] = None) -> List[Dict[str, Any]]:
+    fused: Dict[str, float] = {}
+    first: Dict[str, Dict[str, Any]] = {}
+    for li, matches in enumerate(ranked):
+        for rank, m in enumerate(matches):
+            fused[m["id"]] = fused.get(m["id"], 0.0) + contrib(li, rank, m)
+            first.setdefault(m["id"], m)
+    kept = None
+    if score_from is not None:
+        kept = {m["id"]: m.get("score") for m in ranked[score_from]}
+    out = []
+    for uid in sorted(fused, key=lambda u: -fused[u]):
+        m = dict(first[uid])
+        m["score"] = fused[uid] if kept is None else kept.get(uid)
+        m["fused_score"] = fused[uid]
+        out.append(m)
+    return out
+
+
+def rrf_fuse(*ranked: List[Dict[str, Any]], k: int = 60, weights: Optional[Sequence[float]] = None,
+             score_from: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Reciprocal-rank fusion of match lists, ordered by ``fused_score``.
+
+    ``score`` becomes the fused value too, unless ``score_from`` names the list
+    whose raw score to keep (None for hits that list didn't return).
+    """
+    weights = weights or [1.0] * len(ranked)
+    return _merge(ranked, lambda li, rank, m: weights[li] / (k + rank + 1), score_from)
+
+
+def weighted_fuse(*ranked: List[Dict[str, Any]], weights: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+    """Weighted sum of min-max normalized scores (an item missing from a list adds 0)."""
+    weights = weights or [1.0] * len(ranked)
+    bounds = []
+    for matches in ranked:
+        scores = [float(m.get("score", 0.0)) for m in matches] or [0.0]
+        bounds.append((min(scores), max(scores) - min(scores)))
+
+    def contrib(li, rank, m):
+        lo, span = bounds[li]
+        # a list whose scores are all equal (e.g. a single hit) counts fully
+        return weights[li] * ((float(m.get("score", 0.0)) - lo) / span if span > 0 else 1.0)
+
+    return _merge(ranked, contrib)
+
+
+def fuse(method: str, *ranked: List[Dict[str, Any]], weights: Optional[Sequence[float]] = None,
+         k: int = 60) -> List[Dict[str, Any]]:
+    if method == "rrf":
+        return rrf_fuse(*ranked, k=k, weights=weights)
+    if method == "score":
+        return weighted_fuse(*ranked, weights=weights)
+    raise ValueError(f"unknown fusion method: {method} (expected one of {', '.join(FUSIONS)})")
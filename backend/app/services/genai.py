@@ -1,17 +1,37 @@
 # app/services/genai.py
 from __future__ import annotations
-import os, random
+import os, random, time
+from typing import Iterator, Sequence
 import torch
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from ..core.metrics import observe_stage, timed
+from .gencache import generation_cache, generation_key
+from .loader import lazy_model
+from .modelserver import model_client, remote
+from .inference import optimize_seq2seq
 
 _MODEL_NAME = os.getenv("GENAI_MODEL", "google/flan-t5-base")  # or flan-t5-small
-_DEVICE = 0 if (os.getenv("DEVICE","auto")=="cuda" and torch.cuda.is_available()) else -1
+_DEVICE = "cuda" if (os.getenv("DEVICE","auto")=="cuda" and torch.cuda.is_available()) else "cpu"
 
-_tokenizer = AutoTokenizer.from_pretrained(_MODEL_NAME)
-_model = AutoModelForSeq2SeqLM.from_pretrained(
-    _MODEL_NAME, torch_dtype=torch.float32, low_cpu_mem_usage=True
-)
-_pipe = pipeline("text2text-generation", model=_model, tokenizer=_tokenizer, device=_DEVICE)
+def _load_generator():
+    tokenizer = AutoTokenizer.from_pretrained(_MODEL_NAME)
+    model = optimize_seq2seq(_MODEL_NAME, _DEVICE, lambda: AutoModelForSeq2SeqLM.from_pretrained(
+        _MODEL_NAME, torch_dtype=torch.float32, low_cpu_mem_usage=True
+    ))
+    return tokenizer, model.to(_DEVICE).eval()
+
+# Loaded on first generation (or by the warm-up task), never at import
+_pipe = lazy_model("generator", _load_generator)
+
+def get_generator():
+    """(tokenizer, model) for the seq2seq description model."""
+    return _pipe.get()
+
+# Workers using a model server only need the tokenizer (to detokenize streamed ids)
+_tok = lazy_model("generator_tokenizer", lambda: AutoTokenizer.from_pretrained(_MODEL_NAME))
+
+def get_tokenizer():
+    return _tok.get() if remote() else get_generator()[0]
 
 DEFAULT_STYLE = (
     "Friendly, concise, modern e-commerce tone. "
@@ -56,6 +76,113 @@ def build_prompt(meta: dict, style: str | None = None) -> str:
         "DESCRIPTION:"
     )
 
+# ------------------------------ SAMPLING -------------------------------------
+# A small decode loop instead of pipeline(): every row samples from its own
+# seeded torch.Generator, so an item's text depends only on its prompt and
+# seed, not on which batch it landed in (padding aside, up to float rounding).
+def _sample(logits: torch.Tensor, gens: list[torch.Generator], temperature: float, top_p: float) -> torch.Tensor:
+    probs = torch.softmax(logits.float() / max(temperature, 1e-5), dim=-1)
+    sorted_p, order = probs.sort(dim=-1, descending=True)
+    # nucleus: drop tokens once the mass before them already exceeds top_p
+    sorted_p = sorted_p.masked_fill(sorted_p.cumsum(-1) - sorted_p > top_p, 0.0)
+    picks = [order[i, torch.multinomial(sorted_p[i], 1, generator=g)] for i, g in enumerate(gens)]
+    return torch.cat(picks)
+
+@torch.inference_mode()
+def decode_steps(
+    prompts: Sequence[str],
+    seeds: Sequence[int | None],
+    max_new_tokens: int = 120,
+    temperature: float = 0.9,
+    top_p: float = 0.95,
+) -> Iterator[list[int | None]]:
+    """
+    Yield, per decoding step, the new token id of every row (None once a row
+    has emitted EOS). Closing the iterator stops generation.
+    """
+    if remote():
+        yield from model_client().stream(
+            "decode_steps", list(prompts), list(seeds),
+            max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p,
+        )
+        return
+    tokenizer, model = get_generator()
+    enc = tokenizer(list(prompts), return_tensors="pt", padding=True, truncation=True).to(model.device)
+    encoder_outputs = model.get_encoder()(**enc)
+    gens = []
+    for s in seeds:
+        g = torch.Generator(device=model.device)
+        if s is not None:
+            g.manual_seed(s)
+        else:
+            g.seed()
+        gens.append(g)
+
+    eos, pad = model.config.eos_token_id, model.config.pad_token_id
+    dec = torch.full((len(prompts), 1), model.config.decoder_start_token_id, device=model.device)
+    done = torch.zeros(len(prompts), dtype=torch.bool, device=model.device)
+    past = None
+    for _ in range(max_new_tokens):
+        out = model(
+            encoder_outputs=encoder_outputs,
+            attention_mask=enc["attention_mask"],
+            decoder_input_ids=dec if past is None else dec[:, -1:],
+            past_key_values=past,
+            use_cache=True,
+        )
+        past = out.past_key_values
+        nxt = _sample(out.logits[:, -1, :], gens, temperature, top_p)
+        nxt = torch.where(done, torch.full_like(nxt, pad), nxt)
+        yield [None if d else int(t) for t, d in zip(nxt.tolist(), done.tolist())]
+        done |= nxt == eos
+        dec = torch.cat([dec, nxt[:, None]], dim=1)
+        if bool(done.all()):
+            break
+
+def _clean(text: str) -> str:
+    # FLAN sometimes echoes; strip leading prompt remnants
+    return text.split("DESCRIPTION:")[-1].strip().replace("\n", " ").strip()
+
+class EchoStripper:
+    """
+    Incremental version of _clean for streamed text: drops everything up to
+    the last "DESCRIPTION:" seen so far and holds back a tail that could still
+    grow into that marker. If a marker shows up after text was already sent,
+    the stream restarts after it; the final cleaned text is authoritative.
+    """
+    MARK = "DESCRIPTION:"
+
+    def __init__(self):
+        self._base = 0   # raw offset where the description body starts
+        self._sent = 0   # chars of the current body already emitted
+
+    def feed(self, raw: str) -> str:
+        cut = raw.rfind(self.MARK)
+        if cut >= 0 and cut + len(self.MARK) > self._base:
+            self._base, self._sent = cut + len(self.MARK), 0
+        body = raw[self._base:].replace("\n", " ").lstrip()
+        hold = 0
+        for k in range(min(len(self.MARK) - 1, len(body)), 0, -1):
+            if self.MARK.startswith(body[-k:]):
+                hold = k
+                break
+        ready = body[: len(body) - hold]
+        delta = ready[self._sent:]
+        self._sent = max(self._sent, len(ready))
+        return delta
+
+def _generate(prompts: Sequence[str], seeds: Sequence[int | None], **sampling) -> list[str]:
+    if remote():  # one round trip instead of one message per decoding step
+        return model_client().call("generate", list(prompts), list(seeds), **sampling)
+    tokenizer, _ = get_generator()
+    ids: list[list[int]] = [[] for _ in prompts]
+    with timed("generate"):
+        for step in decode_steps(prompts, seeds, **sampling):
+            for row, tok in enumerate(step):
+                if tok is not None:
+                    ids[row].append(tok)
+    return [_clean(tokenizer.decode(t, skip_special_tokens=True)) for t in ids]
+
 def generate_description(
     meta: dict,
     style: str | None = None,
@@ -65,15 +192,90 @@ def generate_description(
     seed: int | None = 42,
 ) -> str:
     if seed is not None:
-        torch.manual_seed(seed); random.seed(seed)
+        random.seed(seed)
     prompt = build_prompt(meta, style)
-    out = _pipe(
-        prompt,
-        max_new_tokens=max_new_tokens,
-        do_sample=True,
-        temperature=temperature,
-        top_p=top_p,
-        num_return_sequences=1,
-    )[0]["generated_text"]
-    # FLAN sometimes echoes; strip leading prompt remnants
-    return out.split("DESCRIPTION:")[-1].strip().replace("\n", " ").strip()
+    sampling = dict(max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p)
+    return generation_cache.get_or_generate(
+        generation_key(prompt, _MODEL_NAME, seed, **sampling),
+        lambda: _generate([prompt], [seed], **sampling)[0],
+    )
+
+def generate_descriptions(
+    metas: Sequence[dict],
+    style: str | None = None,
+    max_new_tokens: int = 120,
+    temperature: float = 0.9,
+    top_p: float = 0.95,
+    seeds: Sequence[int | None] | None = None,
+    batch_size: int = 8,
+) -> Iterator[list[tuple[int, str]]]:
+    """
+    Batched generate_description. Prompts are grouped by token length so each
+    padded batch wastes little compute; yields [(input_index, text), ...] as
+    each batch finishes (batches complete in length order, not input order).
+    Cached items come first, in one list.
+    """
+    prompts = [build_prompt(m, style) for m in metas]
+    seeds = list(seeds) if seeds is not None else [42] * len(prompts)
+    sampling = dict(max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p)
+    keys = [generation_key(p, _MODEL_NAME, s, **sampling) for p, s in zip(prompts, seeds)]
+    cached = [(i, generation_cache.get(k)) for i, k in enumerate(keys)]
+    cached = [(i, t) for i, t in cached if t is not None]
+    if cached:
+        yield cached
+    todo = sorted(set(range(len(prompts))) - {i for i, _ in cached})
+    if not todo:
+        return
+    tokenizer = get_tokenizer()
+    lengths = dict(zip(todo, (len(t) for t in tokenizer([prompts[i] for i in todo], truncation=True)["input_ids"])))
+    order = sorted(todo, key=lambda i: lengths[i])
+    for start in range(0, len(order), max(1, batch_size)):
+        idx = order[start:start + batch_size]
+        texts = _generate([prompts[i] for i in idx], [seeds[i] for i in idx], **sampling)
+        for i, text in zip(idx, texts):
+            generation_cache.set(keys[i], text)
+        yield list(zip(idx, texts))
+
+def stream_description(
+    meta: dict,
+    style: str | None = None,
+    max_new_tokens: int = 120,
+    temperature: float = 0.9,
+    top_p: float = 0.95,
+    seed: int | None = 42,
+) -> Iterator[tuple[str, str]]:
+    """
+    Token-streaming generate_description: yields ("token", text_delta) as the
+    model decodes, then ("done", cleaned_full_text). Same sampler and seed as
+    the non-streaming path, so the final text matches it. Closing the
+    iterator stops decoding. A cached description is sent as one token.
+    """
+    prompt = build_prompt(meta, style)
+    key = generation_key(prompt, _MODEL_NAME, seed, max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p)
+    cached = generation_cache.get(key)
+    if cached is not None:
+        yield "token", cached
+        yield "done", cached
+        return
+    tokenizer = get_tokenizer()
+    steps = decode_steps([prompt], [seed], max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p)
+    stripper, ids = EchoStripper(), []
+    busy = 0.0  # decode time only, not time spent waiting on the client
+    try:
+        while True:
+            t = time.perf_counter()
+            step = next(steps, None)
+            busy += time.perf_counter() - t
+            if step is None or step[0] is None:
+                break
+            tok = step[0]
+            ids.append(tok)
+            delta = stripper.feed(tokenizer.decode(ids, skip_special_tokens=True))
+            if delta:
+                yield "token", delta
+    finally:
+        steps.close()
+        observe_stage("generate", busy)
+    text = _clean(tokenizer.decode(ids, skip_special_tokens=True))
+    generation_cache.set(key, text)
+    yield "done", text
@@ -0,0 +1,182 @@
+# app/services/gencache.py
+"""
+Persistent cache of generated descriptions (SQLite at ``GEN_CACHE_DB``).
+
+Generation is deterministic for a given prompt, model, sampling parameters
+and seed, so the text is stored under ``canonical_key`` of exactly those and
+a repeat view of the same product is a lookup instead of seconds of FLAN-T5.
+Unseeded requests (``seed=None``) are never cached.
+
+- size-bounded: once the stored text exceeds ``GEN_CACHE_MAX_MB`` the least
+  recently read entries are evicted down to 90% of the budget
+- single-flight: concurrent misses on one key share a single generation
+  (per process; the SQLite file is shared by every worker)
+"""
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from ..core.config import settings
+from .cache import canonical_key
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+
+def generation_key(prompt: str, model: str, seed: Optional[int], **sampling: Any) -> Optional[str]:
+    """Cache key for one generation; None when the output isn't reproducible."""
+    if seed is None:
+        return None
+    return canonical_key("gen", model, prompt, seed, sampling)
+
+
+class GenerationCache:
+    def __init__(self, path: str | Path, max_bytes: int, enabled: bool = True):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.enabled = enabled and max_bytes > 0
+        self._local = threading.local()
+        self._bytes: Optional[int] = None  # running estimate; re-read from disk before evicting
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.shared = self.evictions = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS generations_accessed ON generations (accessed_at)")
+            self._local.conn = conn
+        return conn
+
+    def _stored_bytes(self) -> int:
+        return self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+
+    # ------------------------------ lookups ---------------------------------
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if key is None or not self.enabled:
+            return None
+        try:
+            with self._conn() as conn:
+                row = conn.execute("SELECT text FROM generations WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE generations SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            logger.warning(f"generation cache read failed: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: Optional[str], text: str):
+        if key is None or not self.enabled:
+            return
+        size = len(text.encode("utf-8")) + len(key)
+        now = time.time()
+        try:
+            with self._conn() as conn:
+                conn.execute("INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?)", (key, text, size, now, now))
+            if self._bytes is None:
+                self._bytes = self._stored_bytes()
+            else:
+                self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict()
+        except sqlite3.Error as e:
+            logger.warning(f"generation cache write failed: {e}")
+
+    def _evict(self):
+        target = int(self.max_bytes * 0.9)
+        with self._conn() as conn:
+            total = self._stored_bytes()  # other workers write to the same file
+            evicted = 0
+            if total > target:
+                cur = conn.execute("SELECT key, size FROM generations ORDER BY accessed_at")
+                drop = []
+                for key, size in cur:
+                    if total <= target:
+                        break
+                    drop.append((key,))
+                    total -= size
+                conn.executemany("DELETE FROM generations WHERE key = ?", drop)
+                evicted = len(drop)
+        self._bytes = total
+        self.evictions += evicted
+        if evicted:
+            logger.info(f"generation cache: evicted {evicted} entries, {total / _MB:.1f} MB kept")
+
+    def get_or_generate(self, key: Optional[str], generate: Callable[[], str]) -> str:
+        """Cached text for ``key``, else ``generate()`` once for all concurrent callers."""
+        if key is None or not self.enabled:
+            return generate()
+        text = self.get(key)
+        if text is not None:
+            return text
+        with self._lock:
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._inflight[key] = Future()
+            else:
+                self.shared += 1
+        if not owner:
+            return fut.result()
+        try:
+            text = generate()
+            self.set(key, text)
+            fut.set_result(text)
+            return text
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM generations")
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            entries, stored = self._conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations").fetchone()
+        except sqlite3.Error:
+            entries, stored = 0, 0
+        lookups = self.hits + self.misses
+        return {
+            "name": "generations",
+            "entries": entries,
+            "bytes": stored,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "shared": self.shared,
+            "evictions": self.evictions,
+        }
+
+
+generation_cache = GenerationCache(
+    settings.GEN_CACHE_DB,
+    max_bytes=int(settings.GEN_CACHE_MAX_MB * _MB),
+    enabled=settings.GEN_CACHE_ENABLED,
+)
@@ -0,0 +1,78 @@
+# app/services/imaging.py
+"""
+Shared image preprocessing for the image routes: byte/pixel limits, JPEG
+draft-mode (DCT-scaled) decoding, RGB conversion and downscaling, run in a
+thread or process pool so the event loop never decodes images itself.
+
+The output is the small RGB PIL image the CLIP micro-batcher consumes; the
+model's own processor does the final resize/normalize to tensors.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from PIL import Image
+
+from ..core.config import settings
+from ..core.metrics import timed
+
+
+class ImageRejected(ValueError):
+    def __init__(self, detail: str, status_code: int = 422):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
+def decode_image(raw: bytes, size: int = 256) -> Image.Image:
+    if len(raw) > settings.MAX_IMAGE_BYTES:
+        raise ImageRejected(f"Image is {len(raw)} bytes; limit is {settings.MAX_IMAGE_BYTES}", 413)
+    try:
+        img = Image.open(io.BytesIO(raw))  # parses the header only
+    except Exception:
+        raise ImageRejected("Invalid image file.")
+    w, h = img.size
+    if w * h > settings.MAX_IMAGE_PIXELS:
+        raise ImageRejected(f"Image is {w}x{h}; limit is {settings.MAX_IMAGE_PIXELS} pixels", 413)
+    try:
+        # JPEG: let libjpeg decode at 1/2..1/8 scale, never below the target size
+        img.draft("RGB", (size, size))
+        img = img.convert("RGB")
+    except Exception:
+        raise ImageRejected("Invalid image file.")
+    img.thumbnail((size, size), Image.BICUBIC)
+    return img
+
+
+_pool: Optional[Executor] = None
+
+
+def _executor() -> Executor:
+    global _pool
+    if _pool is None:
+        workers = settings.IMAGE_DECODE_WORKERS or None
+        if settings.IMAGE_DECODE_POOL == "process":
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="img-decode")
+    return _pool
+
+
+def preprocess(raw: bytes, size: int = 256) -> Image.Image:
+    """Blocking variant for sync routes; still bounded by the shared pool."""
+    with timed("decode"):
+        return _executor().submit(decode_image, raw, size).result()
+
+
+async def preprocess_async(raw: bytes, size: int = 256) -> Image.Image:
+    with timed("decode"):
+        return await asyncio.get_running_loop().run_in_executor(_executor(), decode_image, raw, size)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
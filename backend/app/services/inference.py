@@ -0,0 +1,229 @@
+# app/services/inference.py
+"""
+CPU inference backends for the sentence encoders, the cross-encoder and the
+seq2seq generator, selected by ``INFERENCE_BACKEND``:
+
+  torch      fp32 PyTorch (default, previous behaviour)
+  int8       dynamic int8 quantization of every nn.Linear
+  onnx       ONNX Runtime export of the text encoder (others fall back to int8)
+  onnx-int8  as onnx, with int8-quantized ONNX weights
+
+Converted artifacts are cached under ``MODEL_CACHE_DIR`` so later starts skip
+the fp32 load. ``parity_report`` / ``python -m backend.app.services.inference``
+measures cosine drift of a backend against the fp32 embeddings.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import torch
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+
+def _artifact(name: str, suffix: str) -> Path:
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+    return Path(settings.MODEL_CACHE_DIR) / f"{safe}-{suffix}"
+
+
+def _backend(device: str, backend: str | None = None) -> str:
+    backend = (backend or settings.INFERENCE_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if backend != "torch" and device != "cpu":
+        logger.warning(f"INFERENCE_BACKEND={backend} is CPU-only; using torch on {device}")
+        return "torch"
+    return backend
+
+
+# -------------------------------- INT8 ---------------------------------------
+def quantize_int8(module: torch.nn.Module) -> torch.nn.Module:
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _cached_int8(name: str, build) -> Any:
+    """Load a pickled int8 model if present, else build fp32, quantize and cache it."""
+    path = _artifact(name, f"int8-torch{torch.__version__.split('+')[0]}.pt")
+    if path.exists():
+        try:
+            return torch.load(path, weights_only=False)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable int8 artifact {path}: {e}")
+    model = build()
+    qmodel = quantize_int8(model)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        torch.save(qmodel, path)
+        logger.info(f"Cached int8 model at {path}")
+    except Exception as e:
+        logger.warning(f"Could not cache int8 model {name}: {e}")
+    return qmodel
+
+
+# -------------------------------- ONNX ---------------------------------------
+class OnnxSentenceEncoder:
+    """ONNX Runtime transformer + pooling; mirrors SentenceTransformer.encode."""
+
+    def __init__(self, path: Path):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        cfg = json.loads((path / "pooling.json").read_text())
+        self.pooling = cfg["mode"]
+        self.max_seq_length = cfg["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(path))
+        model_file = path / ("model-int8.onnx" if (path / "model-int8.onnx").exists() else "model.onnx")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_file), opts, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False,
+               convert_to_numpy: bool = True, **_: Any) -> np.ndarray:
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        out = []
+        for i in range(0, len(sentences), max(1, batch_size)):
+            enc = self.tokenizer(sentences[i:i + batch_size], padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors="np")
+            feed = {k: v.astype(np.int64) for k, v in enc.items() if k in self._inputs}
+            hidden = self.session.run(None, feed)[0]
+            if self.pooling == "cls":
+                emb = hidden[:, 0]
+            else:
+                mask = enc["attention_mask"][..., None].astype(np.float32)
+                emb = (hidden * mask).sum(1) / np.maximum(mask.sum(1), 1e-9)
+            out.append(emb.astype(np.float32))
+        embs = np.concatenate(out) if out else np.zeros((0, 0), np.float32)
+        if normalize_embeddings:
+            embs = embs / np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+        return embs[0] if single else embs
+
+
+def export_onnx(st, path: Path, quantize: bool = False):
+    """Export a BERT-style SentenceTransformer (Transformer + Pooling) to ``path``."""
+    transformer, pooling = st[0], st[1]
+    path.mkdir(parents=True, exist_ok=True)
+    enc = transformer.tokenizer(["onnx export probe"], return_tensors="pt")
+    names = list(enc.keys())
+    axes = {k: {0: "batch", 1: "seq"} for k in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    class _Wrapped(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(names, args))).last_hidden_state
+
+    torch.onnx.export(
+        _Wrapped(transformer.auto_model.eval()), tuple(enc[k] for k in names), str(path / "model.onnx"),
+        input_names=names, output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=14,
+    )
+    transformer.tokenizer.save_pretrained(str(path))
+    mode = "cls" if getattr(pooling, "pooling_mode_cls_token", False) else "mean"
+    (path / "pooling.json").write_text(json.dumps({"mode": mode, "max_seq_length": st.max_seq_length}))
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(path / "model.onnx"), str(path / "model-int8.onnx"), weight_type=QuantType.QInt8)
+    logger.info(f"Exported ONNX encoder to {path}")
+
+
+# ------------------------------- LOADERS -------------------------------------
+def load_sentence_model(name: str, device: str, allow_onnx: bool = True, backend: str | None = None):
+    """SentenceTransformer (or a drop-in ONNX encoder) for the configured backend."""
+    from sentence_transformers import SentenceTransformer
+
+    backend = _backend(device, backend)
+    if backend.startswith("onnx"):
+        if allow_onnx:
+            path = _artifact(name, backend)
+            if not (path / "pooling.json").exists():
+                export_onnx(SentenceTransformer(name, device="cpu"), path, quantize=backend == "onnx-int8")
+            return OnnxSentenceEncoder(path)
+        logger.info(f"No ONNX export for {name}; using int8")
+        backend = "int8"
+    if backend == "int8":
+        return _cached_int8(name, lambda: SentenceTransformer(name, device="cpu"))
+    return SentenceTransformer(name, device=device)
+
+
+def load_cross_encoder(name: str, device: str):
+    from sentence_transformers import CrossEncoder
+
+    ce = CrossEncoder(name, device=device)
+    if _backend(device) != "torch":
+        ce.model = _cached_int8(name, lambda: ce.model)
+    return ce
+
+
+def optimize_seq2seq(name: str, device: str, build):
+    """FLAN-T5 and friends: ONNX isn't wired for the decode loop, so onnx* means int8."""
+    if _backend(device) == "torch":
+        return build()
+    return _cached_int8(name, build)
+
+
+# ------------------------------- PARITY --------------------------------------
+def parity_report(name: str, texts: Sequence[str], backend: str, allow_onnx: bool = True,
+                  batch_size: int = 32) -> Dict[str, Any]:
+    """Cosine drift and speed of ``backend`` against fp32 embeddings of ``texts``."""
+    from sentence_transformers import SentenceTransformer
+
+    ref_model = SentenceTransformer(name, device="cpu")
+    cand_model = load_sentence_model(name, "cpu", allow_onnx=allow_onnx, backend=backend)
+
+    def run(model):
+        t0 = time.perf_counter()
+        embs = model.encode(list(texts), batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(embs, np.float32), time.perf_counter() - t0
+
+    ref, t_ref = run(ref_model)
+    cand, t_cand = run(cand_model)
+    cos = (ref * cand).sum(axis=1)
+    return {
+        "model": name,
+        "backend": backend,
+        "n": len(texts),
+        "cosine_mean": float(cos.mean()),
+        "cosine_min": float(cos.min()),
+        "cosine_p01": float(np.percentile(cos, 1)),
+        "fp32_s": round(t_ref, 3),
+        "backend_s": round(t_cand, 3),
+        "speedup": round(t_ref / t_cand, 2) if t_cand else None,
+    }
+
+
+def _titles(csv_path: str, limit: int) -> List[str]:
+    import csv
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return [row["title"] for row, _ in zip(csv.DictReader(f), range(limit)) if row.get("title")]
+
+
+def main(argv: Sequence[str] | None = None):
+    ap = argparse.ArgumentParser(description="Compare an inference backend against fp32 embeddings")
+    ap.add_argument("--backend", choices=BACKENDS[1:], default="int8")
+    ap.add_argument("--model", default=settings.TEXT_MODEL)
+    ap.add_argument("--image-model", action="store_true", help="check IMAGE_MODEL (CLIP text tower) instead")
+    ap.add_argument("--csv", default="notebooks/intern_data_ikarus.csv", help="titles are used as probe texts")
+    ap.add_argument("--limit", type=int, default=512)
+    args = ap.parse_args(argv)
+    name = settings.IMAGE_MODEL if args.image_model else args.model
+    report = parity_report(name, _titles(args.csv, args.limit), args.backend, allow_onnx=not args.image_model)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# app/services/lexical.py
+"""
+In-process BM25 over catalog metadata (title, brand, categories, material,
+color), fused with vector hits by reciprocal-rank fusion in ``/search``.
+
+Catches exact brand / model tokens ("GOYMFK", "subrtex") that MiniLM smears;
+fusion itself lives in ``fusion.py``.
+Postings are append-only ``array`` buffers (row ids + term frequencies) read
+as NumPy views at query time; a changed or deleted product tombstones its old
+row and the index compacts itself once a quarter of the rows are dead.
+Built from the metadata store when it's populated and kept in step with it
+(ingest runs, patches from other workers) by a background catch-up every
+``LEXICAL_REFRESH_S``, like the suggest index.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .catalog import meta_from_row
+from .localindex import match_filter
+
+logger = logging.getLogger(__name__)
+
+# field -> weight (term frequency multiplier); title and brand carry the intent
+FIELDS: Dict[str, float] = {"title": 2.0, "brand": 2.0, "categories": 1.0, "material": 1.0, "color": 1.0}
+
+_TOKEN = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def _field_text(v: Any) -> str:
+    if isinstance(v, (list, tuple)):
+        return " ".join(map(str, v))
+    return "" if v is None else str(v)
+
+
+def doc_terms(meta: Dict[str, Any]) -> Counter:
+    tf: Counter = Counter()
+    for field, w in FIELDS.items():
+        for tok in tokenize(_field_text(meta.get(field))):
+            tf[tok] += w
+    return tf
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.ids: List[str] = []
+        self.metas: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+        self.lengths = array("f")
+        self.alive = bytearray()
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.total_len = 0.0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    # ------------------------------ writes ----------------------------------
+    def _add(self, uid: str, meta: Dict[str, Any]):
+        row = len(self.ids)
+        tf = doc_terms(meta)
+        self.ids.append(uid)
+        self.metas.append(meta)
+        self.rows[uid] = row
+        dl = float(sum(tf.values()))
+        self.lengths.append(dl)
+        self.alive.append(1)
+        self.total_len += dl
+        for term, f in tf.items():
+            p = self.postings.get(term)
+            if p is None:
+                p = self.postings[term] = (array("i"), array("f"))
+            p[0].append(row)
+            p[1].append(f)
+
+    def _kill(self, uid: str):
+        row = self.rows.pop(uid, None)
+        if row is not None:
+            self.alive[row] = 0
+            self.total_len -= self.lengths[row]
+            self.metas[row] = {}
+
+    def upsert(self, items: Iterable[Tuple[str, Dict[str, Any]]]):
+        with self._lock:
+            for uid, meta in items:
+                self._kill(uid)
+                self._add(uid, dict(meta or {}))
+            self._maybe_compact()
+
+    def update(self, uid: str, set_metadata: Dict[str, Any]):
+        """Merge a metadata patch; re-tokenize only if an indexed field changed."""
+        with self._lock:
+            row = self.rows.get(uid)
+            if row is None:
+                return
+            meta = {**self.metas[row], **set_metadata}
+            if any(f in set_metadata for f in FIELDS):
+                self._kill(uid)
+                self._add(uid, meta)
+                self._maybe_compact()
+            else:
+                self.metas[row] = meta
+
+    def delete(self, ids: Sequence[str]):
+        with self._lock:
+            for uid in ids:
+                self._kill(uid)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        dead = len(self.ids) - len(self.rows)
+        if dead > 1024 and dead * 4 > len(self.ids):
+            live = [(uid, self.metas[r]) for uid, r in self.rows.items()]
+            self._reset()  # under self._lock, which must stay the same object
+            for uid, meta in live:
+                self._add(uid, meta)
+
+    # ------------------------------ reads -----------------------------------
+    def search(self, query: str, top_k: int = 50, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.rows)
+            if not terms or not n:
+                return []
+            avgdl = max(self.total_len / n, 1e-6)
+            alive = np.frombuffer(self.alive, dtype=np.uint8)
+            lengths = np.frombuffer(self.lengths, dtype=np.float32)
+            scores = np.zeros(len(self.ids), np.float32)
+            for term in terms:
+                p = self.postings.get(term)
+                if p is None:
+                    continue
+                rows = np.frombuffer(p[0], dtype=np.int32)
+                tf = np.frombuffer(p[1], dtype=np.float32)
+                live = alive[rows].astype(bool)
+                rows, tf = rows[live], tf[live]
+                if not len(rows):
+                    continue
+                df = len(rows)
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * lengths[rows] / avgdl)
+                scores[rows] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+            del alive, lengths
+
+            hit = np.flatnonzero(scores > 0)
+            hit = hit[np.argsort(-scores[hit], kind="stable")]
+            out = []
+            for r in hit.tolist():
+                meta = self.metas[r]
+                if filter and not match_filter(meta, filter):
+                    continue
+                out.append({"id": self.ids[r], "score": float(scores[r]), "metadata": meta})
+                if len(out) >= top_k:
+                    break
+            return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "docs": len(self.rows),
+                "rows": len(self.ids),
+                "terms": len(self.postings),
+                "postings": sum(len(p[0]) for p in self.postings.values()),
+            }
+
+
+# ------------------------------ catalog index --------------------------------
+_index: Optional[BM25Index] = None
+_build_lock = threading.Lock()
+_watermark = 0.0
+_checked = 0.0
+
+
+def _slim(record: Dict[str, Any]) -> Dict[str, Any]:
+    """The index's metadata layout (filterable fields) from a full metadata-store record."""
+    meta = meta_from_row({"uniq_id": "", **record})
+    if "gen_description" in record:
+        meta["gen_description"] = record["gen_description"]
+    return meta
+
+
+def build_from_store(index=None, namespace: str = "default") -> BM25Index:
+    """From the metadata store when it's populated and no ``index`` is given, else that index's metadata."""
+    global _watermark
+    from .metastore import metastore
+    t0 = time.perf_counter()
+    bm25 = BM25Index()
+    if index is None and metastore.ready():
+        for uid, meta, updated_at in metastore.changed_since(0.0):
+            bm25.upsert([(uid, _slim(meta))])
+            _watermark = max(_watermark, updated_at)
+    else:
+        from .vectorstore import export_vectors, text_index
+        ids, _, metas = export_vectors(index if index is not None else text_index, namespace)
+        bm25.upsert(zip(ids, metas))
+    logger.info(f"BM25 index built: {len(bm25)} products, {len(bm25.postings)} terms "
+                f"in {time.perf_counter() - t0:.2f}s")
+    return bm25
+
+
+def _catch_up():
+    """Fold in metastore writes from other processes (e.g. jobs/ingest) since the last refresh."""
+    global _watermark
+    from .metastore import metastore
+    try:
+        if not metastore.ready():
+            return
+        for uid, meta, updated_at in metastore.changed_since(_watermark):
+            _index.upsert([(uid, _slim(meta))])
+            _watermark = max(_watermark, updated_at)
+        if metastore.count() < len(_index):
+            ids = set(metastore.ids())
+            _index.delete([uid for uid in list(_index.rows) if uid not in ids])
+    except Exception:
+        logger.exception("lexical index refresh failed")
+
+
+def get_lexical_index() -> BM25Index:
+    """Built lazily on first use; refreshed in the background every LEXICAL_REFRESH_S."""
+    global _index, _checked
+    if _index is None:
+        with _build_lock:
+            if _index is None:
+                _index = build_from_store()
+                _checked = time.monotonic()
+    elif time.monotonic() - _checked > settings.LEXICAL_REFRESH_S and _build_lock.acquire(blocking=False):
+        _checked = time.monotonic()
+
+        def run():
+            try:
+                _catch_up()
+            finally:
+                _build_lock.release()
+        threading.Thread(target=run, name="lexical-refresh", daemon=True).start()
+    return _index
+
+
+def on_metadata_update(uid: str, set_metadata: Dict[str, Any]):
+    if _index is not None:
+        _index.update(uid, set_metadata)
+
+
+def lexical_stats() -> Dict[str, Any]:
+    return _index.stats() if _index is not None else {"built": False}
@@ -0,0 +1,131 @@
+# app/services/loader.py
+"""
+Lazy, load-once model handles plus the optional background warm-up.
+
+Nothing heavy is loaded at import time: each capability's model is built on
+first ``get()`` (or by the warm-up thread), so a pod only pays for the roles
+listed in ``SERVICE_ROLES``.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModel:
+    def __init__(self, name: str, loader: Callable[[], Any]):
+        self.name = name
+        self._loader = loader
+        self._obj: Any = None
+        self._lock = threading.Lock()
+        self.load_s: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._obj is not None
+
+    def get(self) -> Any:
+        if self._obj is not None:
+            return self._obj
+        with self._lock:
+            if self._obj is None:
+                t0 = time.perf_counter()
+                logger.info(f"Loading model '{self.name}'")
+                try:
+                    self._obj = self._loader()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_s = time.perf_counter() - t0
+                self.error = None
+                logger.info(f"Loaded model '{self.name}' in {self.load_s:.1f}s")
+        return self._obj
+
+    def status(self) -> Dict[str, Any]:
+        return {"loaded": self.loaded, "load_s": round(self.load_s, 3) if self.load_s else None, "error": self.error}
+
+
+_registry: Dict[str, LazyModel] = {}
+
+
+def lazy_model(name: str, loader: Callable[[], Any]) -> LazyModel:
+    handle = LazyModel(name, loader)
+    _registry[name] = handle
+    return handle
+
+
+def model_status() -> Dict[str, Dict[str, Any]]:
+    return {name: m.status() for name, m in _registry.items()}
+
+
+# ------------------------------- WARM-UP -------------------------------------
+_warmup = {"started": False, "done": False, "error": None}
+
+
+def _role_steps() -> list[tuple[str, Callable[[], Any]]]:
+    from .modelserver import model_client, remote
+    steps: list[tuple[str, Callable[[], Any]]] = []
+    if remote():
+        # models live in the model-server process; just wait until it answers
+        steps += [("model_server", lambda: model_client().call("ping"))]
+    if settings.has_role("text"):
+        from . import embeddings
+        from .vectorstore import text_index
+        from .lexical import get_lexical_index
+        if not remote():
+            steps += [("text_encoder", embeddings.get_text_model)]
+        steps += [("text_index", text_index.describe_index_stats)]
+        if settings.HYBRID_SEARCH:
+            steps += [("lexical_index", get_lexical_index)]
+    if settings.has_role("image"):
+        from . import embeddings
+        from .vectorstore import image_index
+        if not remote():
+            steps += [("image_encoder", embeddings.get_image_model)]
+        steps += [("image_index", image_index.describe_index_stats)]
+    if settings.has_role("gen"):
+        from . import genai
+        steps += [("generator", genai.get_tokenizer if remote() else genai.get_generator)]
+    return steps
+
+
+def warm_up():
+    _warmup["started"] = True
+    try:
+        for name, step in _role_steps():
+            t0 = time.perf_counter()
+            step()
+            logger.info(f"Warm-up: {name} ready in {time.perf_counter() - t0:.1f}s")
+    except Exception as e:
+        _warmup["error"] = str(e)
+        logger.exception("Warm-up failed")
+    finally:
+        _warmup["done"] = True
+
+
+def start_background_warmup() -> threading.Thread:
+    t = threading.Thread(target=warm_up, name="model-warmup", daemon=True)
+    _warmup["started"] = True
+    t.start()
+    return t
+
+
+def readiness() -> Dict[str, Any]:
+    """Ready once warm-up finished cleanly, or immediately when warm-up is off."""
+    if settings.WARMUP_ON_STARTUP:
+        ready = _warmup["done"] and not _warmup["error"]
+    else:
+        ready = True
+    return {
+        "ready": ready,
+        "roles": sorted(settings.roles),
+        "warmup": dict(_warmup),
+        "models": model_status(),
+    }
@@ -0,0 +1,625 @@
+# app/services/localindex.py
+"""
+In-process vector index exposing the subset of the Pinecone ``Index`` surface
+the routes use (``query`` / ``fetch`` / ``update`` / ``upsert`` / ``delete``),
+including Pinecone-style metadata ``filter`` dicts.
+
+Vectors are L2-normalised and scored by inner product (cosine). Small
+namespaces are scanned exactly with one matrix-vector product; large ones use
+an IVF coarse quantizer (spherical k-means lists, ``nprobe`` lists scanned).
+
+With a ``codec`` (``int8`` / ``pq``, see ``quantize``) candidates are first
+ranked on compact in-memory codes and only the best ``top_k * rescore`` are
+re-scored against the full vectors, which a saved index then memory-maps from
+``vectors.npy`` instead of reading into RAM (the first write to a namespace
+copies them back in).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .facets import FacetIndex, FilterError, validate_filter
+from .quantize import Codec, load_codec, parse_codec, train_codec
+
+logger = logging.getLogger(__name__)
+
+_EMPTY_NS_DIR = "__default__"
+
+
+# ----------------------------- FILTERS ---------------------------------------
+def _apply(op: str, value: Any, arg: Any) -> bool:
+    if op == "$exists":
+        return (value is not None) == bool(arg)
+    if isinstance(value, list):
+        # list metadata (e.g. categories): positive ops match any element,
+        # negative ops require that no element matches
+        if op in ("$ne", "$nin"):
+            return all(_apply(op, v, arg) for v in value)
+        return any(_apply(op, v, arg) for v in value)
+    if op == "$eq":
+        return value == arg
+    if op == "$ne":
+        return value != arg
+    if op == "$in":
+        return value in (arg or [])
+    if op == "$nin":
+        return value not in (arg or [])
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        if value is None or isinstance(value, (bool, str)):
+            return False
+        try:
+            v, a = float(value), float(arg)
+        except (TypeError, ValueError):
+            return False
+        if op == "$gt": return v > a
+        if op == "$gte": return v >= a
+        if op == "$lt": return v < a
+        return v <= a
+    raise ValueError(f"unsupported filter operator: {op}")
+
+
+def match_filter(meta: Dict[str, Any], flt: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a Pinecone metadata filter against one metadata dict."""
+    if not flt:
+        return True
+    for key, cond in flt.items():
+        if key == "$and":
+            if not all(match_filter(meta, c) for c in cond):
+                return False
+            continue
+        if key == "$or":
+            if not any(match_filter(meta, c) for c in cond):
+                return False
+            continue
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        value = meta.get(key)
+        for op, arg in cond.items():
+            if not _apply(op, value, arg):
+                return False
+    return True
+
+
+# ------------------------------- IVF -----------------------------------------
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+class _IVF:
+    """Inverted lists over a fixed snapshot of rows; later rows go to ``pending``."""
+
+    def __init__(self, vectors: np.ndarray, rows: np.ndarray, nlist: int, iters: int = 10, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        nlist = max(1, min(nlist, len(rows)))
+        sample = rows if len(rows) <= nlist * 64 else rng.choice(rows, nlist * 64, replace=False)
+        data = vectors[sample]
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        assign = np.argmax(vectors[rows] @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        self.centroids = centroids
+        self.rows = rows[order].astype(np.int64)
+        self.offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self.trained_rows = len(rows)
+        self.pending: set[int] = set()
+
+    def probe_size(self, nprobe: int) -> float:
+        """Expected rows scanned per query (before filtering)."""
+        return self.trained_rows * min(max(1, nprobe), len(self.centroids)) / len(self.centroids)
+
+    def candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        probe = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        parts = [self.rows[self.offsets[c]:self.offsets[c + 1]] for c in probe]
+        if self.pending:
+            parts.append(np.fromiter(self.pending, dtype=np.int64))
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, np.int64)
+
+
+# ---------------------------- NAMESPACE --------------------------------------
+class _Namespace:
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.metadata: List[Dict[str, Any]] = []
+        self._vecs = np.zeros((0, dim or 0), np.float32)
+        self._alive = np.zeros(0, bool)
+        self.size = 0
+        self.ivf: Optional[_IVF] = None
+        self.facets: Optional[FacetIndex] = None  # built on the first filtered query
+        self.codec: Optional[Codec] = None        # trained on the first query when the index has one
+        self.codec_rows = 0
+        self._codes: Optional[np.ndarray] = None
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vecs[: self.size]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._alive[: self.size]
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self._codes[: self.size]
+
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+    def _reserve(self, n: int):
+        if n <= len(self._vecs):
+            return
+        cap = max(n, 2 * len(self._vecs), 64)
+        vecs = np.zeros((cap, self.dim), np.float32)
+        vecs[: self.size] = self._vecs[: self.size]
+        alive = np.zeros(cap, bool)
+        alive[: self.size] = self._alive[: self.size]
+        self._vecs, self._alive = vecs, alive
+        if self._codes is not None:
+            codes = np.zeros((cap,) + self._codes.shape[1:], self._codes.dtype)
+            codes[: self.size] = self._codes[: self.size]
+            self._codes = codes
+
+    def set_codes(self, codec: Optional[Codec], codes: Optional[np.ndarray]):
+        if codes is not None and len(codes) < len(self._vecs):
+            grown = np.zeros((len(self._vecs),) + codes.shape[1:], codes.dtype)
+            grown[: len(codes)] = codes
+            codes = grown
+        self.codec, self._codes = codec, codes
+        self.codec_rows = self.count if codec is not None else 0
+
+    def upsert(self, vid: str, values, metadata: Optional[Dict[str, Any]]):
+        vec = _normalize(values)
+        if self.dim is None:
+            self.dim = int(vec.shape[-1])
+            self._vecs = np.zeros((0, self.dim), np.float32)
+        if vec.shape[-1] != self.dim:
+            raise ValueError(f"vector dimension {vec.shape[-1]} does not match index dimension {self.dim}")
+        if not self._vecs.flags.writeable:  # memory-mapped from disk: writes need a private copy
+            self._vecs = np.array(self._vecs)
+        row = self.rows.get(vid)
+        if row is None:
+            self._reserve(self.size + 1)
+            row = self.size
+            self.size += 1
+            self.ids.append(vid)
+            self.metadata.append({})
+            self.rows[vid] = row
+        self._vecs[row] = vec
+        self._alive[row] = True
+        self.metadata[row] = dict(metadata or {})
+        if self.codec is not None:
+            self._codes[row] = self.codec.encode(vec[None])[0]
+        if self.ivf is not None:
+            self.ivf.pending.add(row)
+        if self.facets is not None:
+            self.facets.set(row, self.metadata[row])
+
+    def set_metadata(self, row: int, metadata: Dict[str, Any]):
+        self.metadata[row] = metadata
+        if self.facets is not None:
+            self.facets.set(row, metadata)
+
+    @classmethod
+    def from_arrays(
+        cls, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]], normalized: bool = False,
+    ) -> "_Namespace":
+        ns = cls(int(vectors.shape[1]) if vectors.ndim == 2 else None)
+        if ns.dim is None:
+            return ns
+        if not len(vectors):
+            ns._vecs = np.zeros((0, ns.dim), np.float32)
+        else:
+            ns._vecs = vectors if normalized else _normalize(vectors)
+        ns._alive = np.ones(len(ids), bool)
+        ns.size = len(ids)
+        ns.ids = list(ids)
+        ns.rows = {vid: i for i, vid in enumerate(ns.ids)}
+        ns.metadata = [dict(m or {}) for m in metadata]
+        return ns
+
+    def delete(self, vid: str):
+        row = self.rows.pop(vid, None)
+        if row is not None:
+            self._alive[row] = False
+            self.metadata[row] = {}
+            if self.facets is not None:
+                self.facets.set(row, None)
+
+
+# ------------------------------ INDEX ----------------------------------------
+class LocalIndex:
+    """
+    Drop-in stand-in for ``pinecone.Index``. ``kind`` is ``exact``, ``ivf`` or
+    ``auto`` (IVF once a namespace holds at least ``ivf_min_rows`` vectors).
+    ``codec`` is ``float32`` (scan full vectors), ``int8``, ``pq`` or ``pq:<m>``
+    (rank on codes, re-score the best ``top_k * rescore`` exactly).
+    """
+
+    def __init__(
+        self,
+        name: str = "local",
+        path: str | Path | None = None,
+        kind: str = "auto",
+        ivf_min_rows: int = 20000,
+        nlist: int = 0,
+        nprobe: int = 8,
+        codec: str = "float32",
+        rescore: int = 4,
+    ):
+        if kind not in ("auto", "exact", "ivf"):
+            raise ValueError(f"unknown local index kind: {kind}")
+        self.codec, self.pq_m = parse_codec(codec)
+        self.rescore = max(1, rescore)
+        self.name = name
+        self.path = Path(path) if path else None
+        self.kind = kind
+        self.ivf_min_rows = ivf_min_rows
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._ns: Dict[str, _Namespace] = {}
+        self._lock = threading.RLock()
+        self.dirty = False          # written to since the last load / save
+        self._disk_stamp = None     # index.json mtime as of the last load / save
+        if self.path and (self.path / "index.json").exists():
+            self._load(self.path)
+
+    # ---- write path ----
+    def upsert(self, vectors: Iterable[Any], namespace: str = "") -> Dict[str, Any]:
+        n = 0
+        with self._lock:
+            ns = self._ns.setdefault(namespace, _Namespace())
+            for v in vectors:
+                if isinstance(v, dict):
+                    vid, values, md = v["id"], v["values"], v.get("metadata")
+                else:
+                    vid, values, md = (tuple(v) + (None,))[:3]
+                ns.upsert(str(vid), values, md)
+                n += 1
+            self._maybe_retrain(ns)
+            self.dirty = self.dirty or n > 0
+        return {"upserted_count": n}
+
+    def update(
+        self,
+        id: str,
+        values: Optional[List[float]] = None,
+        set_metadata: Optional[Dict[str, Any]] = None,
+        namespace: str = "",
+    ) -> Dict[str, Any]:
+        with self._lock:
+            ns = self._ns.get(namespace)
+            row = ns.rows.get(id) if ns else None
+            if row is None:
+                raise KeyError(f"id not found: {id}")
+            md = dict(ns.metadata[row])
+            md.update(set_metadata or {})
+            if values is None:
+                ns.set_metadata(row, md)
+            else:
+                ns.upsert(id, values, md)
+            self.dirty = True
+        return {}
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False, namespace: str = ""):
+        with self._lock:
+            ns = self._ns.get(namespace)
+            if ns is None:
+                return {}
+            if delete_all:
+                self._ns.pop(namespace, None)
+                self.dirty = True
+                return {}
+            for vid in ids or []:
+                if vid in ns.rows:
+                    ns.delete(vid)
+                    self.dirty = True
+        return {}
+
+    # ---- read path ----
+    def fetch(self, ids: List[str], namespace: str = "") -> Dict[str, Any]:
+        ns = self._ns.get(namespace)
+        out: Dict[str, Any] = {}
+        if ns is not None:
+            for vid in ids:
+                row = ns.rows.get(vid)
+                if row is not None:
+                    out[vid] = {
+                        "id": vid,
+                        "values": ns.vectors[row].tolist(),
+                        "metadata": dict(ns.metadata[row]),
+                    }
+        return {"vectors": out, "namespace": namespace}
+
+    def query(
+        self,
+        vector: Optional[List[float]] = None,
+        id: Optional[str] = None,
+        top_k: int = 10,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        filter: Optional[Dict[str, Any]] = None,
+        namespace: str = "",
+        **_: Any,
+    ) -> Dict[str, Any]:
+        ns = self._ns.get(namespace)
+        if ns is None or ns.count == 0 or top_k <= 0:
+            return {"matches": [], "namespace": namespace}
+        if vector is None:
+            if id is None or id not in ns.rows:
+                return {"matches": [], "namespace": namespace}
+            q = ns.vectors[ns.rows[id]]
+        else:
+            q = _normalize(vector)
+
+        mask = self._filter_mask(ns, filter) if filter else None
+        rows, scores = self._search(ns, q, top_k, mask)
+
+        matches = []
+        for r, s in zip(rows.tolist(), scores.tolist()):
+            m: Dict[str, Any] = {"id": ns.ids[r], "score": float(s)}
+            if include_metadata:
+                m["metadata"] = dict(ns.metadata[r])
+            if include_values:
+                m["values"] = ns.vectors[r].tolist()
+            matches.append(m)
+        return {"matches": matches, "namespace": namespace}
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        dims = [ns.dim for ns in self._ns.values() if ns.dim]
+        return {
+            "dimension": dims[0] if dims else 0,
+            "total_vector_count": sum(ns.count for ns in self._ns.values()),
+            "namespaces": {k: {"vector_count": ns.count} for k, ns in self._ns.items()},
+        }
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Bytes held in RAM vs. memory-mapped from disk, per namespace."""
+        out: Dict[str, Any] = {"codec": self.codec, "rescore": self.rescore, "namespaces": {}}
+        for name, ns in self._ns.items():
+            mapped = isinstance(ns._vecs, np.memmap)
+            out["namespaces"][name] = {
+                "vector_bytes": int(ns.vectors.nbytes),
+                "vectors_mapped": mapped,
+                "code_bytes": int(ns.codes.nbytes) if ns.codec is not None else 0,
+                "codec_bytes": ns.codec.model_bytes() if ns.codec is not None else 0,
+                "bytes_per_vector": ns.codec.code_bytes() if ns.codec is not None else 4 * (ns.dim or 0),
+            }
+        return out
+
+    def list_ids(self, namespace: str = "") -> List[str]:
+        ns = self._ns.get(namespace)
+        return list(ns.rows) if ns else []
+
+    def facet_counts(self, fields, flt: Optional[Dict[str, Any]] = None, namespace: str = "", limit: int = 50):
+        ns = self._ns.get(namespace)
+        if ns is None:
+            return {"total": 0}
+        flt = validate_filter(flt, facets_only=True)
+        return self._facets(ns).counts(fields, flt, alive=ns.alive, limit=limit)
+
+    # ---- search internals ----
+    def _filter_mask(self, ns: _Namespace, flt: Dict[str, Any]) -> np.ndarray:
+        try:
+            flt = validate_filter(flt, facets_only=True)
+        except FilterError:
+            # outside the facet grammar (other fields, $exists): evaluate row by row
+            mask = np.zeros(ns.size, bool)
+            for r in ns.rows.values():
+                mask[r] = match_filter(ns.metadata[r], flt)
+            return mask
+        return self._facets(ns).mask(flt, ns.size)
+
+    def _facets(self, ns: _Namespace) -> FacetIndex:
+        if ns.facets is None:
+            with self._lock:
+                if ns.facets is None:
+                    ns.facets = FacetIndex.build(ns.metadata[: ns.size])
+        return ns.facets
+
+    def _search(self, ns: _Namespace, q: np.ndarray, top_k: int, mask: Optional[np.ndarray]):
+        valid = ns.alive if mask is None else (ns.alive & mask)
+        ivf = self._ensure_ivf(ns)
+        # a selective pre-filter leaves fewer rows than the probed lists hold: scan just those
+        if ivf is not None and mask is not None and valid.sum() <= ivf.probe_size(self.nprobe):
+            ivf = None
+        if ivf is not None:
+            cand = ivf.candidates(q, self.nprobe)
+            cand = cand[valid[cand]]
+            # selective filters can empty the probed lists; fall back to exact
+            if len(cand) >= top_k:
+                return self._score(ns, cand, q, top_k)
+        cand = np.flatnonzero(valid)
+        if len(cand) == ns.size:
+            return self._score(ns, None, q, top_k)
+        return self._score(ns, cand, q, top_k)
+
+    def _score(self, ns: _Namespace, rows: Optional[np.ndarray], q: np.ndarray, top_k: int):
+        """Top ``top_k`` of ``rows`` (None = every row); ranked on codes first when there is a codec."""
+        n = ns.size if rows is None else len(rows)
+        codec = self._ensure_codec(ns) if n > top_k * self.rescore else None
+        if codec is None:
+            if rows is None:
+                return self._topk(np.arange(ns.size), ns.vectors @ q, top_k)
+            return self._topk(rows, ns.vectors[rows] @ q, top_k)
+        codes = ns.codes if rows is None else ns.codes[rows]
+        short, _ = self._topk(np.arange(ns.size) if rows is None else rows, codec.scores(codes, q),
+                              top_k * self.rescore)
+        short = np.sort(short)  # ascending rows: sequential reads from a memory-mapped file
+        return self._topk(short, ns.vectors[short] @ q, top_k)
+
+    @staticmethod
+    def _topk(rows: np.ndarray, scores: np.ndarray, k: int):
+        if len(rows) == 0:
+            return rows, scores
+        k = min(k, len(rows))
+        part = np.argpartition(-scores, k - 1)[:k]
+        order = part[np.argsort(-scores[part], kind="stable")]
+        return rows[order], scores[order]
+
+    def _wants_ivf(self, ns: _Namespace) -> bool:
+        if self.kind == "exact":
+            return False
+        if self.kind == "ivf":
+            return ns.count > 0
+        return ns.count >= self.ivf_min_rows
+
+    def _ensure_ivf(self, ns: _Namespace) -> Optional[_IVF]:
+        if not self._wants_ivf(ns):
+            return None
+        if ns.ivf is None:
+            with self._lock:
+                if ns.ivf is None:
+                    self._train(ns)
+        return ns.ivf
+
+    def _train(self, ns: _Namespace):
+        rows = np.flatnonzero(ns.alive)
+        nlist = self.nlist or max(1, int(np.sqrt(len(rows))))
+        ns.ivf = _IVF(ns.vectors, rows, nlist)
+        logger.info(f"[{self.name}] trained IVF: {nlist} lists over {len(rows)} vectors")
+
+    def _maybe_retrain(self, ns: _Namespace):
+        ivf = ns.ivf
+        if ivf is not None and len(ivf.pending) > max(1000, ivf.trained_rows // 10):
+            ns.ivf = None  # retrained lazily on next query
+        # new rows are encoded with the existing codebooks; retrain once the data has outgrown them
+        if ns.codec is not None and ns.count > max(1000, 2 * ns.codec_rows):
+            ns.set_codes(None, None)
+
+    def _ensure_codec(self, ns: _Namespace) -> Optional[Codec]:
+        if self.codec == "float32" or ns.count == 0:
+            return None
+        if ns.codec is None:
+            with self._lock:
+                if ns.codec is None:
+                    self._train_codec(ns)
+        return ns.codec
+
+    def _train_codec(self, ns: _Namespace):
+        rows = np.flatnonzero(ns.alive)
+        if len(rows) > 65536:
+            rows = np.sort(np.random.default_rng(0).choice(rows, 65536, replace=False))
+        codec = train_codec(self.codec, np.asarray(ns.vectors[rows]), self.pq_m)
+        codes = np.concatenate([codec.encode(np.asarray(ns.vectors[i:i + 65536]))
+                                for i in range(0, ns.size, 65536)])
+        ns.set_codes(codec, codes)
+        logger.info(f"[{self.name}] trained {self.codec} codec: {codec.code_bytes()} bytes/vector "
+                    f"over {ns.size} vectors")
+
+    # ---- persistence ----
+    def changed_on_disk(self) -> bool:
+        """True when another process has saved over ``path`` since this copy was loaded / saved."""
+        return self.path is not None and _stamp(self.path) != self._disk_stamp
+
+    def flush(self) -> bool:
+        """
+        Save to ``path`` if there are unsaved writes. Skipped (with a warning)
+        when the files on disk have changed since they were loaded, so a stale
+        copy never overwrites a newer index written by ``jobs.ingest`` or
+        another worker.
+        """
+        if not self.dirty or self.path is None:
+            return False
+        if self.changed_on_disk():
+            logger.warning(f"[{self.name}] {self.path} changed on disk since it was loaded; "
+                           f"not overwriting it with this process's copy")
+            return False
+        self.save()
+        return True
+
+    def save(self, path: str | Path | None = None):
+        path = Path(path or self.path or "")
+        if not str(path):
+            raise ValueError("no path to save local index to")
+        with self._lock:
+            path.mkdir(parents=True, exist_ok=True)
+            names = []
+            for name, ns in self._ns.items():
+                d = path / (name or _EMPTY_NS_DIR)
+                d.mkdir(parents=True, exist_ok=True)
+                rows = np.flatnonzero(ns.alive)  # a deleted then re-upserted id keeps one live row
+                # replaced, not rewritten in place: this or another process may have the old file mapped
+                _save_npy(d / "vectors.npy", ns.vectors[rows] if len(rows) else np.zeros((0, ns.dim or 0), np.float32))
+                if ns.codec is not None and len(rows):
+                    _save_npy(d / "codes.npy", ns.codes[rows])
+                    ns.codec.save(d / "codec.npz")
+                else:
+                    for stale in ("codes.npy", "codec.npz"):
+                        (d / stale).unlink(missing_ok=True)
+                rows = rows.tolist()
+                _save_json(d / "items.json", {"ids": [ns.ids[r] for r in rows],
+                                              "metadata": [ns.metadata[r] for r in rows]})
+                names.append(name)
+            # written last: its mtime marks a complete save for changed_on_disk()
+            _save_json(path / "index.json", {"name": self.name, "namespaces": names})
+            if path == self.path:
+                self.dirty = False
+                self._disk_stamp = _stamp(path)
+
+    def _load(self, path: Path):
+        self._disk_stamp = _stamp(path)
+        with open(path / "index.json", encoding="utf-8") as f:
+            info = json.load(f)
+        for name in info.get("namespaces", []):
+            d = path / (name or _EMPTY_NS_DIR)
+            mapped = self.codec != "float32"
+            vecs = np.load(d / "vectors.npy", mmap_mode="r" if mapped else None)
+            with open(d / "items.json", encoding="utf-8") as f:
+                items = json.load(f)
+            ns = self._ns[name] = _Namespace.from_arrays(items["ids"], vecs, items["metadata"], normalized=mapped)
+            if mapped:
+                self._load_codes(ns, d)
+        logger.info(f"[{self.name}] loaded {self.describe_index_stats()['total_vector_count']} vectors from {path}")
+
+    def _load_codes(self, ns: _Namespace, d: Path):
+        codec = load_codec(d / "codec.npz")
+        if codec is None or codec.kind != self.codec or (self.pq_m and getattr(codec, "m", 0) != self.pq_m):
+            return  # missing or saved under another setting: retrained on first query
+        codes = np.load(d / "codes.npy")
+        if len(codes) == ns.size:
+            ns.set_codes(codec, codes)
+
+
+def _stamp(path: Path) -> Optional[int]:
+    try:
+        return (path / "index.json").stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _tmp(path: Path) -> Path:
+    # per-process name: concurrent writers never interleave into one temp file
+    return path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+
+def _save_npy(path: Path, arr: np.ndarray):
+    tmp = _tmp(path)
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def _save_json(path: Path, obj: Any):
+    tmp = _tmp(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
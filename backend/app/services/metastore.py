@@ -0,0 +1,203 @@
+# app/services/metastore.py
+"""
+Product metadata keyed by uniq_id, kept locally in SQLite (``METADATA_DB``).
+
+Once it's populated (by ``jobs/ingest`` or ``jobs/build_metastore``) the
+routes query the vector indexes for ids and scores only and hydrate every hit
+of a response with one ``SELECT ... IN (...)``, projected to the requested
+fields. Ids missing from the store fall back to one bulk ``fetch`` from the
+index they came from.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ..core.config import settings
+from ..core.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = 500  # ids per IN (...) clause
+
+
+def project(meta: Dict[str, Any], fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return meta
+    return {f: meta[f] for f in fields if f in meta}
+
+
+def parse_fields(raw: Optional[Sequence[str] | str]) -> Optional[List[str]]:
+    """'a,b' / ['a','b'] -> ['a','b']; '*' -> None (everything); unset -> RESPONSE_FIELDS."""
+    if raw is None:
+        raw = settings.RESPONSE_FIELDS
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    fields = [f.strip() for f in raw if f and f.strip()]
+    if not fields or "*" in fields:
+        return None
+    return fields
+
+
+def _dumps(meta: Dict[str, Any]) -> str:
+    # canonical form: equal records serialize identically, so upsert can compare them
+    return json.dumps(meta, ensure_ascii=False, default=str, sort_keys=True)
+
+
+class MetaStore:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._count: Optional[int] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                "uniq_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS products_updated ON products (updated_at)")
+            self._local.conn = conn
+        return conn
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def ready(self) -> bool:
+        # remember a populated store; keep re-checking an empty one (ingest may fill it)
+        if not self._count:
+            self._count = self.count()
+        return self._count > 0
+
+    # ------------------------------ writes ----------------------------------
+    def upsert(self, items: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        Merge fields into each record (fields only a patch set, like
+        ``gen_description``, are kept). Records the merge leaves unchanged are
+        not rewritten, so ``updated_at`` keeps marking real changes; returns
+        how many were written.
+        """
+        items = dict(items)
+        now = time.time()
+        rows = []
+        with self._conn() as conn:
+            ids = list(items)
+            old: Dict[str, Dict[str, Any]] = {}
+            for i in range(0, len(ids), _CHUNK):
+                chunk = ids[i:i + _CHUNK]
+                marks = ",".join("?" * len(chunk))
+                for uid, data in conn.execute(
+                    f"SELECT uniq_id, data FROM products WHERE uniq_id IN ({marks})", chunk
+                ):
+                    old[uid] = json.loads(data)
+            for uid, meta in items.items():
+                prev = old.get(uid)
+                merged = _dumps({**prev, **meta} if prev is not None else meta)
+                if prev is None or merged != _dumps(prev):
+                    rows.append((uid, merged, now))
+            conn.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?)", rows)
+        if rows:
+            self._count = None
+        return len(rows)
+
+    def patch(self, uid: str, fields: Dict[str, Any]) -> bool:
+        """Merge fields into one record; False if the id isn't stored."""
+        with self._conn() as conn:
+            row = conn.execute("SELECT data FROM products WHERE uniq_id = ?", (uid,)).fetchone()
+            if row is None:
+                return False
+            data = {**json.loads(row[0]), **fields}
+            conn.execute(
+                "UPDATE products SET data = ?, updated_at = ? WHERE uniq_id = ?",
+                (_dumps(data), time.time(), uid),
+            )
+        return True
+
+    def delete(self, ids: Sequence[str]):
+        with self._conn() as conn:
+            conn.executemany("DELETE FROM products WHERE uniq_id = ?", [(i,) for i in ids])
+        self._count = None
+
+    # ------------------------------ reads -----------------------------------
+    def get_many(self, ids: Sequence[str], fields: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        conn = self._conn()
+        ids = list(dict.fromkeys(ids))
+        for i in range(0, len(ids), _CHUNK):
+            chunk = ids[i:i + _CHUNK]
+            marks = ",".join("?" * len(chunk))
+            for uid, data in conn.execute(f"SELECT uniq_id, data FROM products WHERE uniq_id IN ({marks})", chunk):
+                out[uid] = project(json.loads(data), fields)
+        return out
+
+    def ids(self) -> List[str]:
+        return [r[0] for r in self._conn().execute("SELECT uniq_id FROM products")]
+
+    def iter_all(self, batch: int = 1000):
+        cur = self._conn().execute("SELECT uniq_id, data FROM products ORDER BY uniq_id")
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            for uid, data in rows:
+                yield uid, json.loads(data)
+
+    def changed_since(self, ts: float, batch: int = 1000):
+        """(uniq_id, metadata, updated_at) written after ``ts``, oldest first."""
+        cur = self._conn().execute(
+            "SELECT uniq_id, data, updated_at FROM products WHERE updated_at > ? ORDER BY updated_at", (ts,)
+        )
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            for uid, data, updated_at in rows:
+                yield uid, json.loads(data), updated_at
+
+
+metastore = MetaStore(settings.METADATA_DB)
+
+
+def include_metadata() -> bool:
+    """Ask the index for metadata only while the local store is empty."""
+    try:
+        return not metastore.ready()
+    except sqlite3.Error as e:
+        logger.warning(f"metadata store unavailable: {e}")
+        return True
+
+
+def hydrate(matches: List[Dict[str, Any]], fields: Optional[Sequence[str]], index=None) -> List[Dict[str, Any]]:
+    """Bulk-attach projected metadata to index matches (store first, index fallback)."""
+    with timed("hydrate"):
+        ids = [m["id"] for m in matches]
+        try:
+            found = metastore.get_many(ids, fields) if metastore.ready() else {}
+        except sqlite3.Error as e:
+            logger.warning(f"metadata store read failed: {e}")
+            found = {}
+        by_id = {m["id"]: m for m in matches}
+        missing = [i for i in by_id if i not in found and not by_id[i].get("metadata")]
+        if missing and index is not None:
+            vecs = index.fetch(ids=missing, namespace="default").get("vectors", {}) or {}
+            for uid, v in vecs.items():
+                found[uid] = project((v or {}).get("metadata", {}) or {}, fields)
+        items = []
+        for m in matches:
+            score = m.get("score", 0.0)
+            item = {"id": m["id"], "score": None if score is None else float(score),
+                    "metadata": found[m["id"]] if m["id"] in found else project(m.get("metadata") or {}, fields)}
+            if "fused_score" in m:
+                item["fused_score"] = float(m["fused_score"])
+            items.append(item)
+        return items
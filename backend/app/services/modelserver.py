@@ -0,0 +1,345 @@
+# app/services/modelserver.py
+"""
+Out-of-process model serving for multi-worker deployments (``MODEL_SERVER``).
+
+One model-server process owns the encoders, the cross-encoder and FLAN-T5;
+uvicorn workers keep only tokenizers and send encode / rerank / generate calls
+to it over a local socket (``multiprocessing.connection``: pickled NumPy
+arrays and PIL images, no HTTP), so N workers cost one copy of the weights.
+
+- per-model concurrency: ``MODEL_SERVER_LIMITS`` ("text=4,image=2,...") caps
+  the calls running at once per model group; the server's micro-batchers
+  still coalesce concurrent encodes coming from every worker
+- backpressure: at most ``MODEL_SERVER_MAX_QUEUE`` calls wait per group;
+  past that a call fails fast with ``ModelServerBusy`` (HTTP 503 with
+  Retry-After) instead of queueing without bound
+- streaming ops (``decode_steps``) send one message per step; a client that
+  stops reading drops its connection, which stops decoding on the server
+
+    python -m backend.app.services.modelserver      # standalone server
+    python -m backend.app.serve --workers 4         # server + uvicorn workers
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import threading
+from multiprocessing.connection import AuthenticationError, Client, Connection, Listener
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_serving = False  # True inside the model-server process: models run locally there
+
+
+class ModelServerError(RuntimeError):
+    status_code = 502
+
+
+class ModelServerBusy(ModelServerError):
+    """The model's queue on the server is full; retry shortly."""
+    status_code = 503
+
+
+def remote() -> bool:
+    """True in HTTP workers configured to use a model server."""
+    return bool(settings.MODEL_SERVER) and not _serving
+
+
+def _authkey() -> Optional[bytes]:
+    return settings.MODEL_SERVER_AUTHKEY.encode() if settings.MODEL_SERVER_AUTHKEY else None
+
+
+def parse_limits(raw: str) -> Dict[str, int]:
+    limits = {"text": 4, "image": 2, "rerank": 2, "gen": 1}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            limits[k.strip()] = max(1, int(v))
+    return limits
+
+
+# --------------------------------- OPS ---------------------------------------
+def _coalesced(batcher: str, encode: str) -> Callable[[List[Any]], np.ndarray]:
+    """Encode through the server's micro-batcher so calls from all workers share forward passes."""
+    def run(items: List[Any]) -> np.ndarray:
+        from . import embeddings
+        b = getattr(embeddings, batcher)
+        if b is None:
+            return getattr(embeddings, encode)(items)
+        futs = [b.submit(x) for x in items]
+        return np.stack([f.result() for f in futs])
+    return run
+
+
+def _rerank(pairs: List[Tuple[str, str]]) -> np.ndarray:
+    from .embeddings import get_reranker
+    model = get_reranker()
+    if model is None:
+        raise RuntimeError("reranker not available on the model server")
+    return np.asarray(model.predict(pairs, batch_size=len(pairs), show_progress_bar=False), dtype=np.float32)
+
+
+def _generate(prompts, seeds, **sampling) -> List[str]:
+    from . import genai
+    return genai._generate(prompts, seeds, **sampling)
+
+
+def _decode_steps(prompts, seeds, **sampling) -> Iterator[list]:
+    from . import genai
+    return genai.decode_steps(prompts, seeds, **sampling)
+
+
+def _ping() -> Dict[str, Any]:
+    from .loader import model_status
+    return {"pid": os.getpid(), "models": model_status()}
+
+
+# op -> (model group or None for unlimited, handler)
+OPS: Dict[str, Tuple[Optional[str], Callable[..., Any]]] = {
+    "encode_text": ("text", _coalesced("_text_batcher", "encode_texts")),
+    "encode_image": ("image", _coalesced("_img_batcher", "encode_images")),
+    "encode_clip_text": ("image", _coalesced("_clip_text_batcher", "encode_clip_texts")),
+    "rerank": ("rerank", _rerank),
+    "generate": ("gen", _generate),
+    "decode_steps": ("gen", _decode_steps),
+    "ping": (None, _ping),
+}
+STREAMING = {"decode_steps"}
+
+
+# -------------------------------- SERVER -------------------------------------
+class ModelServer:
+    def __init__(self, address: str, authkey: Optional[bytes] = None,
+                 limits: Optional[Dict[str, int]] = None, max_queue: int = 64):
+        self.address = address
+        self.authkey = authkey
+        self.limits = limits or parse_limits("")
+        self.max_queue = max(0, max_queue)
+        self._slots = {g: threading.BoundedSemaphore(n) for g, n in self.limits.items()}
+        self._inflight = {g: 0 for g in self.limits}
+        self._lock = threading.Lock()
+
+    def _enter(self, group: Optional[str]) -> bool:
+        if group is None:
+            return True
+        with self._lock:
+            if self._inflight[group] >= self.limits[group] + self.max_queue:
+                return False
+            self._inflight[group] += 1
+        self._slots[group].acquire()
+        return True
+
+    def _exit(self, group: Optional[str]):
+        if group is None:
+            return
+        self._slots[group].release()
+        with self._lock:
+            self._inflight[group] -= 1
+
+    def serve_forever(self):
+        global _serving
+        _serving = True
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            logger.info(f"Model server listening on {self.address} (limits {self.limits}, queue {self.max_queue})")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    logger.warning(f"rejected model-server client: {e}")
+                    continue
+                threading.Thread(target=self._serve_conn, args=(conn,), name="model-conn", daemon=True).start()
+
+    def _serve_conn(self, conn: Connection):
+        with conn:
+            while True:
+                try:
+                    op, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if op not in OPS:
+                    if not self._send(conn, ("error", f"unknown op {op!r}")):
+                        return
+                    continue
+                group, fn = OPS[op]
+                if not self._enter(group):
+                    if not self._send(conn, ("busy", f"{group} model is saturated")):
+                        return
+                    continue
+                try:
+                    if op in STREAMING:
+                        alive = self._stream(conn, fn(*args, **kwargs))
+                    else:
+                        alive = self._send(conn, ("ok", fn(*args, **kwargs)))
+                except Exception as e:
+                    logger.exception(f"model-server op {op} failed")
+                    alive = self._send(conn, ("error", f"{type(e).__name__}: {e}"))
+                finally:
+                    self._exit(group)
+                if not alive:
+                    return
+
+    @staticmethod
+    def _send(conn: Connection, msg: Tuple[str, Any]) -> bool:
+        try:
+            conn.send(msg)
+            return True
+        except (EOFError, OSError):
+            return False
+
+    @staticmethod
+    def _stream(conn: Connection, items: Iterator[Any]) -> bool:
+        """Forward a generator; False when the client went away (the generator is closed either way)."""
+        try:
+            for item in items:
+                conn.send(("item", item))
+            conn.send(("end", None))
+            return True
+        except (EOFError, OSError):
+            return False
+        finally:
+            items.close()
+
+
+def _warm_models():
+    from . import embeddings
+    steps = []
+    if settings.has_role("text"):
+        steps.append(embeddings.get_text_model)
+    if settings.has_role("image"):
+        steps.append(embeddings.get_image_model)
+    if settings.has_role("text") and settings.USE_RERANKER:
+        steps.append(embeddings.get_reranker)
+    if settings.has_role("gen"):
+        from . import genai
+        steps.append(genai.get_generator)
+    for step in steps:
+        try:
+            step()
+        except Exception:
+            logger.exception("model-server warm-up step failed")
+
+
+# -------------------------------- CLIENT -------------------------------------
+class ModelClient:
+    """Pooled connections to the model server; safe to share across threads."""
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None, timeout_s: float = 120.0):
+        self.address = address
+        self.authkey = authkey
+        self.timeout_s = timeout_s
+        self._idle: List[Connection] = []
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise ModelServerError(f"model server at {self.address} unreachable: {e}") from e
+
+    def _checkin(self, conn: Connection):
+        with self._lock:
+            self._idle.append(conn)
+
+    def _recv(self, conn: Connection) -> Tuple[str, Any]:
+        if not conn.poll(self.timeout_s):
+            raise ModelServerError(f"model server did not answer within {self.timeout_s:.0f}s")
+        return conn.recv()
+
+    @staticmethod
+    def _fail(status: str, value: Any):
+        if status == "busy":
+            raise ModelServerBusy(value)
+        raise ModelServerError(value)
+
+    def call(self, op: str, *args, **kwargs) -> Any:
+        conn = self._checkout()
+        try:
+            conn.send((op, args, kwargs))
+            status, value = self._recv(conn)
+        except (EOFError, OSError) as e:
+            conn.close()
+            raise ModelServerError(f"model server connection lost: {e}") from e
+        except BaseException:
+            conn.close()
+            raise
+        self._checkin(conn)
+        if status != "ok":
+            self._fail(status, value)
+        return value
+
+    def stream(self, op: str, *args, **kwargs) -> Iterator[Any]:
+        conn: Optional[Connection] = self._checkout()
+        try:
+            conn.send((op, args, kwargs))
+            while True:
+                try:
+                    status, value = self._recv(conn)
+                except (EOFError, OSError) as e:
+                    raise ModelServerError(f"model server connection lost: {e}") from e
+                if status == "item":
+                    yield value
+                    continue
+                self._checkin(conn)
+                conn = None
+                if status != "end":
+                    self._fail(status, value)
+                return
+        finally:
+            if conn is not None:
+                conn.close()  # abandoned mid-stream: the server stops decoding
+
+
+class _RemoteReranker:
+    """Stands in for CrossEncoder in workers: ``predict`` runs on the model server."""
+
+    def predict(self, pairs, batch_size: Optional[int] = None, show_progress_bar: bool = False) -> np.ndarray:
+        return model_client().call("rerank", list(pairs))
+
+
+_client: Optional[ModelClient] = None
+_client_lock = threading.Lock()
+
+
+def model_client() -> ModelClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ModelClient(settings.MODEL_SERVER, _authkey(), settings.MODEL_SERVER_TIMEOUT_S)
+    return _client
+
+
+remote_reranker = _RemoteReranker()
+
+
+def run_server(address: str = "", warm: bool = True):
+    from ..core.logging import setup_logging
+    setup_logging()
+    server = ModelServer(address or settings.MODEL_SERVER, _authkey(),
+                         parse_limits(settings.MODEL_SERVER_LIMITS), settings.MODEL_SERVER_MAX_QUEUE)
+    if warm:
+        threading.Thread(target=_warm_models, name="model-warmup", daemon=True).start()
+    server.serve_forever()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Serve the models to HTTP workers over a local socket")
+    ap.add_argument("--socket", default=settings.MODEL_SERVER or "/tmp/furnishiq-models.sock")
+    ap.add_argument("--no-warmup", action="store_true", help="load models on first call instead of at start")
+    args = ap.parse_args(argv)
+    run_server(args.socket, warm=not args.no_warmup)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# app/services/neighbors.py
+"""
+Precomputed top-N neighbor tables for ``/similar/{uniq_id}``.
+
+One directory per modality under ``NEIGHBOR_DIR``:
+  CURRENT           name of the active version directory
+  v000003/
+    ids.json        row -> uniq_id
+    neighbors.i32   (n, top_n) int32 row ids, -1 padded      (memory-mapped)
+    scores.f16      (n, top_n) float16 cosine scores          (memory-mapped)
+    meta.json       {"n", "top_n", "built_at", ...}
+
+Built offline by ``python -m backend.app.jobs.build_neighbors``. A rebuild
+writes a new version directory and swaps ``CURRENT`` atomically, so files a
+serving process has mapped are never truncated; ``get_table`` reopens the
+table once ``CURRENT`` changes.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def compute_neighbors(vectors: np.ndarray, top_n: int, block: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact top-N inner-product neighbors for every row (self excluded), in row blocks."""
+    vecs = np.asarray(vectors, dtype=np.float32)
+    vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+    n = len(vecs)
+    # keep each (block, n) similarity slab around 256 MB
+    block = block or max(16, min(1024, (256 << 20) // max(1, 4 * n)))
+    k = min(top_n, max(0, n - 1))
+    nbrs = np.full((n, top_n), -1, np.int32)
+    scores = np.zeros((n, top_n), np.float16)
+    if k == 0:
+        return nbrs, scores
+    for start in range(0, n, block):
+        sims = vecs[start:start + block] @ vecs.T
+        rows = np.arange(start, min(start + block, n))
+        sims[rows - start, rows] = -np.inf
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        part_s = np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-part_s, axis=1, kind="stable")
+        nbrs[rows, :k] = np.take_along_axis(part, order, axis=1)
+        scores[rows, :k] = np.take_along_axis(part_s, order, axis=1)
+    return nbrs, scores
+
+
+_KEEP_VERSIONS = 2  # the previous table stays on disk for processes that still have it open
+
+
+def _current(root: Path) -> Optional[Path]:
+    """Active table directory: the ``CURRENT`` version, or ``root`` itself for a table built before versions."""
+    try:
+        name = (root / "CURRENT").read_text().strip()
+    except FileNotFoundError:
+        return root if (root / "meta.json").exists() else None
+    return root / name if name and (root / name).is_dir() else None
+
+
+def _stamp(root: Path) -> int:
+    for marker in ("CURRENT", "meta.json"):
+        try:
+            return (root / marker).stat().st_mtime_ns
+        except OSError:
+            continue
+    return 0
+
+
+def write_table(path: str | Path, ids: Sequence[str], nbrs: np.ndarray, scores: np.ndarray, **info) -> Path:
+    """Write a new version of the table at ``path`` and make it current."""
+    root = Path(path)
+    root.mkdir(parents=True, exist_ok=True)
+    versions = sorted(p.name for p in root.glob("v[0-9]*") if p.is_dir())
+    version = int(versions[-1][1:]) + 1 if versions else 1
+    final = root / f"v{version:06d}"
+    tmp = root / f".v{version:06d}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    nbrs.astype(np.int32).tofile(tmp / "neighbors.i32")
+    scores.astype(np.float16).tofile(tmp / "scores.f16")
+    (tmp / "ids.json").write_text(json.dumps(list(ids)))
+    meta = {"n": len(ids), "top_n": int(nbrs.shape[1]), "built_at": time.time(), "version": version, **info}
+    (tmp / "meta.json").write_text(json.dumps(meta))
+    os.replace(tmp, final)
+
+    pointer = root / "CURRENT.tmp"
+    pointer.write_text(final.name)
+    os.replace(pointer, root / "CURRENT")
+    for old in sorted(p for p in root.glob("v[0-9]*") if p.is_dir())[:-_KEEP_VERSIONS]:
+        shutil.rmtree(old, ignore_errors=True)
+    return final
+
+
+class NeighborTable:
+    def __init__(self, path: str | Path):
+        path = Path(path)
+        self.meta = json.loads((path / "meta.json").read_text())
+        n, top_n = self.meta["n"], self.meta["top_n"]
+        self.ids: List[str] = json.loads((path / "ids.json").read_text())
+        self.rows: Dict[str, int] = {uid: i for i, uid in enumerate(self.ids)}
+        self.nbrs = np.memmap(path / "neighbors.i32", dtype=np.int32, mode="r", shape=(n, top_n))
+        self.scores = np.memmap(path / "scores.f16", dtype=np.float16, mode="r", shape=(n, top_n))
+
+    @property
+    def top_n(self) -> int:
+        return int(self.meta["top_n"])
+
+    def lookup(self, uniq_id: str, k: int) -> Optional[List[Tuple[str, float]]]:
+        """Top-k (uniq_id, score) or None if the id isn't in the table / k exceeds it."""
+        row = self.rows.get(uniq_id)
+        if row is None or k > self.top_n:
+            return None
+        out = []
+        for j, s in zip(self.nbrs[row, :k].tolist(), self.scores[row, :k].tolist()):
+            if j < 0:
+                break
+            out.append((self.ids[j], float(s)))
+        return out
+
+
+_tables: Dict[str, Tuple[int, Optional[NeighborTable]]] = {}  # modality -> (CURRENT mtime, table)
+_lock = threading.Lock()
+
+
+def get_table(modality: str) -> Optional[NeighborTable]:
+    """Opened on first use and again whenever a rebuild swaps in a new version; None when it hasn't been built."""
+    root = Path(settings.NEIGHBOR_DIR) / modality
+    stamp = _stamp(root)
+    cached = _tables.get(modality)
+    if cached is None or cached[0] != stamp:
+        with _lock:
+            cached = _tables.get(modality)
+            if cached is None or cached[0] != stamp:
+                table, path = None, _current(root)
+                if path is not None:
+                    try:
+                        table = NeighborTable(path)
+                        logger.info(f"Loaded {modality} neighbor table: {len(table.ids)} ids x {table.top_n}")
+                    except Exception as e:
+                        logger.warning(f"Neighbor table at {path} unreadable: {e}")
+                        table = cached[1] if cached else None  # keep serving the previous one
+                cached = _tables[modality] = (stamp, table)
+    return cached[1]
+
+
+def reload_tables():
+    with _lock:
+        _tables.clear()
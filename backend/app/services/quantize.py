@@ -0,0 +1,160 @@
+# app/services/quantize.py
+"""
+Compressed vector codes for ``LocalIndex`` (``LOCAL_TEXT_CODEC`` /
+``LOCAL_IMAGE_CODEC``):
+
+- ``int8``: per-dimension symmetric scalar quantization, ``dim`` bytes per
+  vector (4x smaller than float32)
+- ``pq``: product quantization, ``m`` sub-vectors each replaced by the id of
+  its nearest of 256 trained centroids, ``m`` bytes per vector; inner
+  products come from a per-query (m, 256) lookup table
+
+Codes only rank candidates; ``LocalIndex`` re-scores a shortlist with the
+full-precision vectors (memory-mapped from disk), so the compressed pass
+mostly costs recall at the shortlist boundary. ``jobs/vector_report``
+measures that trade-off.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+CODECS = ("float32", "int8", "pq")
+_BLOCK = 8192  # rows decoded per chunk while scoring (bounds temporaries)
+
+
+class Codec:
+    kind = ""
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def scores(self, codes: np.ndarray, q: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def code_bytes(self) -> int:
+        raise NotImplementedError
+
+    def model_bytes(self) -> int:
+        raise NotImplementedError
+
+    def save(self, path: Path):
+        raise NotImplementedError
+
+
+class Int8Codec(Codec):
+    kind = "int8"
+
+    def __init__(self, scale: np.ndarray):
+        self.scale = scale.astype(np.float32)
+
+    @classmethod
+    def train(cls, x: np.ndarray, **_) -> "Int8Codec":
+        return cls(np.maximum(np.abs(x).max(axis=0), 1e-6) / 127.0)
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(x / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, codes: np.ndarray, q: np.ndarray) -> np.ndarray:
+        qs = (q * self.scale).astype(np.float32)
+        out = np.empty(len(codes), np.float32)
+        for i in range(0, len(codes), _BLOCK):
+            out[i:i + _BLOCK] = codes[i:i + _BLOCK].astype(np.float32) @ qs
+        return out
+
+    def code_bytes(self) -> int:
+        return len(self.scale)
+
+    def model_bytes(self) -> int:
+        return self.scale.nbytes
+
+    def save(self, path: Path):
+        np.savez(path, kind=self.kind, scale=self.scale)
+
+
+class PQCodec(Codec):
+    kind = "pq"
+
+    def __init__(self, centroids: np.ndarray):
+        self.centroids = centroids.astype(np.float32)  # (m, ksub, dsub)
+        self.m, self.ksub, self.dsub = centroids.shape
+
+    @classmethod
+    def train(cls, x: np.ndarray, m: int = 0, iters: int = 12, seed: int = 0, **_) -> "PQCodec":
+        dim = x.shape[1]
+        m = m or max(1, dim // 8)
+        if dim % m:
+            raise ValueError(f"PQ sub-vectors ({m}) must divide the dimension ({dim})")
+        rng = np.random.default_rng(seed)
+        ksub = min(256, len(x))
+        sample = x if len(x) <= ksub * 64 else x[rng.choice(len(x), ksub * 64, replace=False)]
+        dsub = dim // m
+        centroids = np.zeros((m, ksub, dsub), np.float32)
+        for j in range(m):
+            sub = sample[:, j * dsub:(j + 1) * dsub]
+            c = sub[rng.choice(len(sub), ksub, replace=False)].copy()
+            for _ in range(iters):
+                assign = _nearest(sub, c)
+                counts = np.bincount(assign, minlength=ksub)
+                sums = np.stack([np.bincount(assign, weights=sub[:, d], minlength=ksub) for d in range(dsub)], 1)
+                filled = counts > 0
+                c[filled] = sums[filled] / counts[filled, None]
+            centroids[j] = c
+        return cls(centroids)
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(x), self.m), np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _nearest(x[:, j * self.dsub:(j + 1) * self.dsub], self.centroids[j])
+        return codes
+
+    def scores(self, codes: np.ndarray, q: np.ndarray) -> np.ndarray:
+        lut = np.einsum("mkd,md->mk", self.centroids, q.reshape(self.m, self.dsub).astype(np.float32))
+        out = np.zeros(len(codes), np.float32)
+        for j in range(self.m):
+            out += lut[j][codes[:, j]]
+        return out
+
+    def code_bytes(self) -> int:
+        return self.m
+
+    def model_bytes(self) -> int:
+        return self.centroids.nbytes
+
+    def save(self, path: Path):
+        np.savez(path, kind=self.kind, centroids=self.centroids)
+
+
+def _nearest(x: np.ndarray, c: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||^2 == argmax (x.c - |c|^2 / 2)
+    half = 0.5 * (c * c).sum(axis=1)
+    out = np.empty(len(x), np.int64)
+    for i in range(0, len(x), _BLOCK):
+        out[i:i + _BLOCK] = np.argmax(x[i:i + _BLOCK] @ c.T - half, axis=1)
+    return out
+
+
+def parse_codec(spec: str) -> tuple[str, int]:
+    """'pq' / 'pq:48' / 'int8' / 'float32' -> (kind, pq sub-vectors or 0)."""
+    kind, _, arg = (spec or "float32").strip().lower().partition(":")
+    if kind not in CODECS:
+        raise ValueError(f"unknown vector codec {spec!r} (expected one of {', '.join(CODECS)})")
+    return kind, int(arg) if arg else 0
+
+
+def train_codec(kind: str, x: np.ndarray, pq_m: int = 0) -> Codec:
+    return Int8Codec.train(x) if kind == "int8" else PQCodec.train(x, m=pq_m)
+
+
+def load_codec(path: Path) -> Optional[Codec]:
+    if not path.exists():
+        return None
+    data = np.load(path)
+    kind = str(data["kind"])
+    if kind == "int8":
+        return Int8Codec(data["scale"])
+    if kind == "pq":
+        return PQCodec(data["centroids"])
+    return None
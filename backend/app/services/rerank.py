@@ -0,0 +1,117 @@
+# app/services/rerank.py
+"""
+Cross-encoder reranking stage for ``/api/search``.
+
+- candidate budget: only the top ``RERANK_CANDIDATES`` vector hits are scored
+- rich pair text: title | brand | categories | material (not the title alone)
+- batched, lock-guarded ``CrossEncoder.predict`` (the tokenizer isn't thread-safe)
+- LRU cache of (query, product text) -> score
+- latency budget: stop scoring when the next batch would overrun the deadline
+  and rerank only the prefix scored so far (or skip if nothing was)
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..core.config import settings
+from ..core.metrics import timed
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+PAIR_FIELDS = ("title", "brand", "categories", "material")
+
+
+def pair_text(meta: Dict[str, Any]) -> str:
+    parts = []
+    for f in PAIR_FIELDS:
+        v = meta.get(f) or ""
+        parts.append(", ".join(map(str, v)) if isinstance(v, list) else str(v))
+    return " | ".join(p for p in parts if p)
+
+
+class RerankStage:
+    def __init__(
+        self,
+        get_model: Callable[[], Any],
+        candidates: int = 50,
+        batch_size: int = 16,
+        cache: Optional[LRUCache] = None,
+    ):
+        self.get_model = get_model
+        self.candidates = candidates
+        self.batch_size = max(1, batch_size)
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._batch_s = 0.0  # EMA of one predict() call, for deadline checks
+
+    def _predict(self, model, pairs: List[Tuple[str, str]]) -> List[float]:
+        t0 = time.perf_counter()
+        with self._lock, timed("rerank"):
+            scores = model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        took = time.perf_counter() - t0
+        self._batch_s = took if not self._batch_s else 0.8 * self._batch_s + 0.2 * took
+        return [float(s) for s in scores]
+
+    def rerank(
+        self, query: str, matches: List[Dict[str, Any]], deadline: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        info = {"candidates": 0, "scored": 0, "cache_hits": 0, "truncated": False, "skipped": False}
+        model = self.get_model()
+        if model is None or not matches:
+            info["skipped"] = True
+            return matches, info
+
+        cands = matches[: self.candidates]
+        texts = [pair_text(m.get("metadata", {}) or {}) for m in cands]
+        keys = [hashlib.sha1(f"{query}\x00{t}".encode("utf-8")).digest() for t in texts]
+        scores: List[Optional[float]] = [self.cache.get(k) if self.cache is not None else None for k in keys]
+        info["candidates"] = len(cands)
+        info["cache_hits"] = sum(s is not None for s in scores)
+
+        todo = [i for i, s in enumerate(scores) if s is None]
+        for b in range(0, len(todo), self.batch_size):
+            if deadline is not None and time.perf_counter() + self._batch_s > deadline:
+                info["truncated"] = True
+                break
+            idx = todo[b:b + self.batch_size]
+            for i, s in zip(idx, self._predict(model, [(query, texts[i]) for i in idx])):
+                scores[i] = s
+                if self.cache is not None:
+                    self.cache.set(keys[i], s)
+            info["scored"] += len(idx)
+
+        # rerank the longest fully-scored prefix; the rest keeps vector order
+        n = next((i for i, s in enumerate(scores) if s is None), len(scores))
+        if n == 0:
+            info["skipped"] = True
+            return matches, info
+        head = sorted(zip(scores[:n], range(n)), key=lambda x: -x[0])
+        out = []
+        for s, i in head:
+            m = dict(cands[i])
+            m["rerank_score"] = s
+            out.append(m)
+        return out + matches[n:], info
+
+    def stats(self) -> Dict[str, Any]:
+        return {"batch_ms_ema": round(self._batch_s * 1000, 2), "cache": self.cache.stats() if self.cache is not None else None}
+
+
+def _model():
+    from .embeddings import get_reranker
+    return get_reranker()
+
+
+reranker = RerankStage(
+    _model,
+    candidates=settings.RERANK_CANDIDATES,
+    batch_size=settings.RERANK_BATCH_SIZE,
+    cache=LRUCache("rerank_scores", max_entries=settings.RERANK_CACHE_MAX_ENTRIES, max_bytes=32 * 1024 * 1024,
+                   ttl_s=settings.SEARCH_CACHE_TTL_S),
+)
@@ -0,0 +1,373 @@
+# app/services/suggest.py
+"""
+Typeahead for ``/api/suggest``: prefix lookups over product titles, brands,
+categories and popular past queries, without touching a model or an index.
+
+Every phrase is stored under its normalized text (``lexical.tokenize``) and
+under each word-boundary suffix ("shoe rack" is found by "sh" and "ra") as
+``(key, phrase id)`` in one sorted list, so a prefix is two ``bisect`` calls
+and a scan of the matching slice. Phrases rank by popularity: products that
+carry them plus ``SUGGEST_QUERY_WEIGHT`` per past search. Each prefix's top
+results are memoized until a phrase under that prefix changes, so repeated
+keystrokes (and the wide slices of one- and two-letter prefixes) cost a dict
+lookup. Keys added by one write are sorted into the list together, so
+building the index from the whole catalog is one sort.
+
+Catalog phrases are reference-counted per product, so upserts, metadata
+patches and deletes update the structure in place; searches are counted in
+``SUGGEST_QUERIES_DB`` (shared by all workers) and folded into the ranking
+by a background refresh every ``SUGGEST_REFRESH_S``, which also picks up
+metastore writes from other processes (``jobs/ingest``).
+"""
+from __future__ import annotations
+
+import bisect
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ..core.config import settings
+from .lexical import tokenize
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("category", "brand", "title", "query")  # tie-break order
+_END = "\U0010ffff"
+_MAX_KEY = 64        # chars of a key worth matching against
+_MAX_WORDS = 8       # word-boundary suffixes indexed per phrase
+_MAX_QUERY_LEN = 80
+_TOP = 20            # results kept per memoized prefix (and the API's max)
+_MEMO = 50_000       # memoized prefixes before the memo starts over
+_INVALIDATE = 256    # phrases changed by one write before the whole memo is dropped
+
+
+def normalize(text: str) -> str:
+    return " ".join(tokenize(text or ""))
+
+
+def _keys(norm: str) -> List[str]:
+    words = norm.split()
+    return list(dict.fromkeys(" ".join(words[i:])[:_MAX_KEY] for i in range(min(len(words), _MAX_WORDS))))
+
+
+def _catalog_phrases(meta: Dict[str, Any]) -> List[Tuple[str, str]]:
+    out = []
+    if meta.get("title"):
+        out.append(("title", str(meta["title"]).strip()))
+    if meta.get("brand"):
+        out.append(("brand", str(meta["brand"]).strip()))
+    cats = meta.get("categories") or []
+    for c in cats if isinstance(cats, (list, tuple)) else [cats]:
+        if str(c).strip():
+            out.append(("category", str(c).strip()))
+    return out
+
+
+class SuggestIndex:
+    def __init__(self, query_weight: float = 5.0, min_query_count: int = 2):
+        self.query_weight = query_weight
+        self.min_query_count = min_query_count
+        self._keys: List[Tuple[str, int]] = []  # sorted (key, phrase id)
+        self.text: List[str] = []               # phrase id -> display text
+        self.norm: List[str] = []               # phrase id -> normalized text
+        self.kind: List[str] = []
+        self.refs: List[int] = []               # catalog products carrying the phrase
+        self.queries: List[int] = []            # past searches for it
+        self._ids: Dict[str, int] = {}          # normalized text -> phrase id
+        self._free: List[int] = []
+        self._products: Dict[str, Tuple[int, ...]] = {}
+        self._top: Dict[str, List[int]] = {}
+        self._added: set = set()                # (key, pid) shown by the current write, not yet sorted in
+        self._changed: set = set()              # normalized phrases whose memoized prefixes are stale
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ---- phrases ----
+    def _live(self, pid: int) -> bool:
+        return self.refs[pid] > 0 or self.queries[pid] >= self.min_query_count
+
+    def _phrase(self, kind: str, text: str) -> int:
+        norm = normalize(text)
+        pid = self._ids.get(norm)
+        if pid is not None:
+            if KINDS.index(kind) < KINDS.index(self.kind[pid]):  # catalog spelling beats a typed query
+                self.kind[pid], self.text[pid] = kind, text
+                self._changed.add(norm)
+            return pid
+        if self._free:
+            pid = self._free.pop()
+            self.text[pid], self.kind[pid], self.refs[pid], self.queries[pid] = text, kind, 0, 0
+            self.norm[pid] = norm
+        else:
+            pid = len(self.text)
+            self.text.append(text)
+            self.norm.append(norm)
+            self.kind.append(kind)
+            self.refs.append(0)
+            self.queries.append(0)
+        self._ids[norm] = pid
+        return pid
+
+    def _show(self, pid: int):
+        self._added.update((key, pid) for key in _keys(self.norm[pid]))
+
+    def _hide(self, pid: int):
+        for key in _keys(self.norm[pid]):
+            if (key, pid) in self._added:
+                self._added.discard((key, pid))
+                continue
+            i = bisect.bisect_left(self._keys, (key, pid))
+            if i < len(self._keys) and self._keys[i] == (key, pid):
+                del self._keys[i]
+
+    def _adjust(self, pid: int, refs: int = 0, queries: int = 0):
+        was = self._live(pid)
+        self.refs[pid] += refs
+        self.queries[pid] += queries
+        now = self._live(pid)
+        if now and not was:
+            self._show(pid)
+        elif was and not now:
+            self._hide(pid)
+        norm = self.norm[pid]
+        self._changed.add(norm)
+        if not now and self.refs[pid] <= 0 and self.queries[pid] <= 0:
+            del self._ids[norm]
+            self._free.append(pid)
+
+    def _commit(self):
+        """End of a write: sort the new keys in and drop the memoized prefixes they affect."""
+        if self._added:
+            if len(self._added) < 32:
+                for item in self._added:
+                    bisect.insort(self._keys, item)
+            else:
+                self._keys.extend(self._added)
+                self._keys.sort()  # sorted run + new tail: one merge, not an insort per key
+            self._added.clear()
+        if self._changed and self._top:
+            if len(self._changed) > _INVALIDATE:
+                self._top.clear()
+            else:
+                for norm in self._changed:
+                    for key in _keys(norm):
+                        for i in range(1, len(key) + 1):
+                            self._top.pop(key[:i], None)
+        self._changed.clear()
+
+    # ---- catalog writes ----
+    def upsert(self, items: Iterable[Tuple[str, Dict[str, Any]]]):
+        with self._lock:
+            for uid, meta in items:
+                new = tuple(dict.fromkeys(self._phrase(k, t) for k, t in _catalog_phrases(meta or {})))
+                old = self._products.get(uid, ())
+                for pid in set(old) - set(new):
+                    self._adjust(pid, refs=-1)
+                for pid in set(new) - set(old):
+                    self._adjust(pid, refs=+1)
+                self._products[uid] = new
+            self._commit()
+
+    def delete(self, ids: Sequence[str]):
+        with self._lock:
+            for uid in ids:
+                for pid in self._products.pop(uid, ()):
+                    self._adjust(pid, refs=-1)
+            self._commit()
+
+    def update(self, uid: str, set_metadata: Dict[str, Any]):
+        """Apply a metadata patch; only title / brand / categories matter here."""
+        with self._lock:
+            if uid not in self._products or not ({"title", "brand", "categories"} & set_metadata.keys()):
+                return
+            current = {"title": None, "brand": None, "categories": []}
+            for pid in self._products[uid]:
+                kind = self.kind[pid]
+                if kind == "category":
+                    current["categories"].append(self.text[pid])
+                elif kind in current and current[kind] is None:
+                    current[kind] = self.text[pid]
+            self.upsert([(uid, {**current, **set_metadata})])
+
+    # ---- past queries ----
+    def set_queries(self, counts: Dict[str, int]):
+        """Make past-search counts equal to ``counts`` (query text -> searches); others drop to 0."""
+        with self._lock:
+            want: Dict[int, int] = {}
+            for text, n in counts.items():
+                if normalize(text):
+                    pid = self._phrase("query", text)
+                    want[pid] = want.get(pid, 0) + n
+            for pid in [p for p in self._ids.values() if self.queries[p] and p not in want]:
+                self._adjust(pid, queries=-self.queries[pid])
+            for pid, n in want.items():
+                if n != self.queries[pid]:
+                    self._adjust(pid, queries=n - self.queries[pid])
+            self._commit()
+
+    # ---- reads ----
+    def _score(self, pid: int) -> float:
+        return self.refs[pid] + self.query_weight * self.queries[pid]
+
+    def _rank(self, prefix: str, limit: int) -> List[int]:
+        lo = bisect.bisect_left(self._keys, (prefix,))
+        hi = bisect.bisect_left(self._keys, (prefix + _END,), lo)
+        pids = {pid for _, pid in self._keys[lo:hi]}
+        return sorted(pids, key=lambda p: (-self._score(p), KINDS.index(self.kind[p]), self.text[p]))[:limit]
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Dict[str, Any]]:
+        norm = normalize(prefix)[:_MAX_KEY]
+        if not norm:
+            return []
+        limit = max(1, min(limit, _TOP))
+        with self._lock:
+            top = self._top.get(norm)
+            if top is None:
+                if len(self._top) >= _MEMO:
+                    self._top.clear()
+                top = self._top[norm] = self._rank(norm, _TOP)
+            return [{"text": self.text[p], "kind": self.kind[p], "score": self._score(p)} for p in top[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"phrases": len(self._ids), "keys": len(self._keys), "products": len(self._products),
+                    "memoized_prefixes": len(self._top)}
+
+
+# ------------------------------ catalog index --------------------------------
+_index: Optional[SuggestIndex] = None
+_build_lock = threading.Lock()
+_watermark = 0.0
+_checked = 0.0
+_pending: Counter = Counter()  # searches not yet written to SUGGEST_QUERIES_DB
+_pending_lock = threading.Lock()
+
+
+class QueryLog:
+    """Search counts in SQLite, shared by every worker (counts add up across processes)."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS queries (text TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def add(self, counts: Dict[str, int]):
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO queries VALUES (?, ?) ON CONFLICT(text) DO UPDATE SET count = count + excluded.count",
+                list(counts.items()),
+            )
+
+    def top(self, n: int) -> Dict[str, int]:
+        return dict(self._conn().execute("SELECT text, count FROM queries ORDER BY count DESC LIMIT ?", (n,)))
+
+
+query_log = QueryLog(settings.SUGGEST_QUERIES_DB)
+
+
+def _sync_queries(index: SuggestIndex):
+    """Write this process's pending searches, then rank by everyone's counts."""
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    try:
+        if pending:
+            query_log.add(pending)
+        index.set_queries(query_log.top(settings.SUGGEST_MAX_QUERIES))
+    except sqlite3.Error as e:
+        logger.warning(f"popular queries unavailable: {e}")
+
+
+def _changed_since(metastore, ts: float):
+    """Metastore records written after ``ts`` as (uid, meta), advancing the watermark as they're read."""
+    global _watermark
+    for uid, meta, updated_at in metastore.changed_since(ts):
+        _watermark = max(_watermark, updated_at)
+        yield uid, meta
+
+
+def build() -> SuggestIndex:
+    """From the metadata store when populated, else the text index's metadata."""
+    from .metastore import metastore
+    t0 = time.perf_counter()
+    index = SuggestIndex(settings.SUGGEST_QUERY_WEIGHT, settings.SUGGEST_MIN_QUERY_COUNT)
+    if metastore.ready():
+        index.upsert(_changed_since(metastore, 0.0))
+    else:
+        from .vectorstore import export_vectors, text_index
+        ids, _, metas = export_vectors(text_index, "default")
+        index.upsert(zip(ids, metas))
+    _sync_queries(index)
+    logger.info(f"Suggest index built: {len(index)} phrases, {index.stats()['keys']} keys "
+                f"in {time.perf_counter() - t0:.2f}s")
+    return index
+
+
+def _catch_up():
+    """Fold in metastore writes from other processes (e.g. jobs/ingest) and recent searches."""
+    from .metastore import metastore
+    try:
+        if metastore.ready():
+            rows = _changed_since(metastore, _watermark)
+            while batch := list(islice(rows, 1000)):  # lets readers in between batches
+                _index.upsert(batch)
+            if metastore.count() < len(_index._products):
+                ids = set(metastore.ids())
+                _index.delete([uid for uid in list(_index._products) if uid not in ids])
+        _sync_queries(_index)
+    except Exception:
+        logger.exception("suggest index refresh failed")
+
+
+def get_suggest_index() -> SuggestIndex:
+    """Built lazily on first use; refreshed in the background every SUGGEST_REFRESH_S."""
+    global _index, _checked
+    if _index is None:
+        with _build_lock:
+            if _index is None:
+                _index = build()
+                _checked = time.monotonic()
+    elif time.monotonic() - _checked > settings.SUGGEST_REFRESH_S and _build_lock.acquire(blocking=False):
+        _checked = time.monotonic()
+
+        def run():
+            try:
+                _catch_up()
+            finally:
+                _build_lock.release()
+        threading.Thread(target=run, name="suggest-refresh", daemon=True).start()
+    return _index
+
+
+def record_query(prompt: str):
+    """Count a search towards popular queries (written out on the next refresh)."""
+    text = " ".join((prompt or "").split())
+    if text and len(text) <= _MAX_QUERY_LEN:
+        with _pending_lock:
+            if text in _pending or len(_pending) < 10_000:
+                _pending[text] += 1
+
+
+def on_metadata_update(uid: str, set_metadata: Dict[str, Any]):
+    if _index is not None:
+        _index.update(uid, set_metadata)
+
+
+def suggest_stats() -> Dict[str, Any]:
+    return _index.stats() if _index is not None else {"built": False}
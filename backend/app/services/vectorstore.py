@@ -1,17 +1,109 @@
 import logging
-from pinecone import Pinecone, ServerlessSpec
+import threading
+from pathlib import Path
 from ..core.config import settings
+from ..core.metrics import timed
 
 logger = logging.getLogger(__name__)
 
-_pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-
 def _region_from_env(env_str: str) -> str:
     parts = env_str.split("-")
     return "-".join(parts[:3]) if len(parts) >= 3 else "us-east-1"
 
 _region = _region_from_env(settings.PINECONE_ENV)
 
-# Open indexes you already created via notebooks
-text_index  = _pc.Index(settings.PINECONE_TEXT_INDEX)
-image_index = _pc.Index(settings.PINECONE_IMAGE_INDEX)
+def _open_pinecone():
+    # Imported lazily so the local backend runs without the client or an API key
+    from pinecone import Pinecone
+    pc = Pinecone(api_key=settings.PINECONE_API_KEY)
+    # Open indexes you already created via notebooks
+    return pc.Index(settings.PINECONE_TEXT_INDEX), pc.Index(settings.PINECONE_IMAGE_INDEX)
+
+def _open_local():
+    from .localindex import LocalIndex
+    root = Path(settings.LOCAL_INDEX_DIR)
+    opts = dict(
+        kind=settings.LOCAL_INDEX_KIND,
+        ivf_min_rows=settings.LOCAL_IVF_MIN_ROWS,
+        nlist=settings.LOCAL_IVF_NLIST,
+        nprobe=settings.LOCAL_IVF_NPROBE,
+        rescore=settings.LOCAL_RESCORE,
+    )
+    return (
+        LocalIndex(settings.PINECONE_TEXT_INDEX, path=root / "text", codec=settings.LOCAL_TEXT_CODEC, **opts),
+        LocalIndex(settings.PINECONE_IMAGE_INDEX, path=root / "image", codec=settings.LOCAL_IMAGE_CODEC, **opts),
+    )
+
+_BACKENDS = {"pinecone": _open_pinecone, "local": _open_local}
+
+def open_indexes():
+    backend = settings.VECTOR_BACKEND.lower()
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown VECTOR_BACKEND: {settings.VECTOR_BACKEND}")
+    logger.info(f"Vector store backend: {backend}")
+    return _BACKENDS[backend]()
+
+_opened = None
+_open_lock = threading.Lock()
+
+def _indexes():
+    global _opened
+    if _opened is None:
+        with _open_lock:
+            if _opened is None:
+                _opened = open_indexes()
+    return _opened
+
+class _LazyIndex:
+    """Connects (or loads from disk) on first attribute access, not at import."""
+
+    def __init__(self, slot: int, name: str):
+        self._slot = slot
+        self._stage = f"vector_query_{name}"
+
+    @property
+    def resolved(self) -> bool:
+        return _opened is not None
+
+    def __getattr__(self, name):
+        return getattr(_indexes()[self._slot], name)
+
+    def query(self, *args, **kwargs):
+        with timed(self._stage):
+            return _indexes()[self._slot].query(*args, **kwargs)
+
+def export_vectors(index, namespace: str = "default", batch: int = 100):
+    """(ids, float32 matrix, metadata list) for every vector in a namespace."""
+    import numpy as np
+    if hasattr(index, "list_ids"):  # LocalIndex
+        ids = index.list_ids(namespace)
+    else:  # Pinecone serverless: list() yields pages of ids
+        ids = [vid for page in index.list(namespace=namespace) for vid in page]
+    out_ids, vecs, metas = [], [], []
+    for i in range(0, len(ids), batch):
+        res = index.fetch(ids=ids[i:i + batch], namespace=namespace)
+        for vid, v in (res.get("vectors", {}) or {}).items():
+            out_ids.append(vid)
+            vecs.append(v["values"])
+            metas.append(v.get("metadata", {}) or {})
+    matrix = np.asarray(vecs, dtype=np.float32) if vecs else np.zeros((0, 0), np.float32)
+    return out_ids, matrix, metas
+
+def persist_indexes() -> bool:
+    """
+    Flush unsaved local index writes to LOCAL_INDEX_DIR (no-op for Pinecone, if
+    never opened, or if nothing changed). An index whose files were rewritten
+    on disk since it was loaded is left alone rather than overwritten; False
+    if any index still has unsaved writes afterwards.
+    """
+    if _opened is None:
+        return True
+    ok = True
+    for index in _opened:
+        if hasattr(index, "flush"):
+            index.flush()
+            ok = ok and not index.dirty
+    return ok
+
+text_index = _LazyIndex(0, "text")
+image_index = _LazyIndex(1, "image")